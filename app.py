@@ -1,20 +1,158 @@
-from shiny import App, render, reactive, ui
-import faicons as fa
+from shiny import App, render, reactive, req, ui
+import asyncio
+import contextlib
+import contextvars
 import getpass
+import hmac
+import os
 from pathlib import Path
-from data.data_con import DataLoader
-from view.myplots import PlotBuilder
+from view.myplots import PlotBuilder, RenderCancelled, get_template_json, render_cache, render_pool, warm_up as warm_up_plots
+from helper.metrics import ACTIVE_SESSIONS, OUTPUT_BYTES, RENDER_SECONDS, metrics, timer
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Mount, Route
+from helper.assets import AssetFiles, asset_tags
+from helper.compression import CompressionMiddleware
+from helper.ui_cache import cached_html, icon_svg
+from helper.sessions import SessionReaper
+from helper.latest_task import LatestTask
+from helper.profiler import profiler
 from helper.functs import phs_config_get, get_social_urls, get_phs_url, get_ogl_url, get_compliance_list, get_my_www_folder
 
 # important settings
 assets_folder = Path(__file__).parent / 'www'
-cfg = phs_config_get(assets_folder / "config" / "default-config.json")
+config_path = assets_folder / "config" / "default-config.json"
+cfg = phs_config_get(config_path)
+# "html" pushes plot HTML through ui.HTML, "json" sends figure JSON to Plotly.react (www/js/phs-plotly-react.js)
+plot_output_format = os.environ.get("PHS_PLOT_OUTPUT", "html")
+
+def plot_container(output_id: str):
+    if plot_output_format == "json":
+        return ui.div(id=output_id, class_="phs-plot-container phs-plotly-json", role="img")
+    return ui.output_ui(output_id, class_="phs-plot-container")
+
+# "client" sends the whole frame to the DataGrid, "server" filters, sorts and pages on the server
+grid_mode = os.environ.get("PHS_GRID_MODE", "client")
+# Scatter trendline: LOWESS fraction and "exact" (statsmodels) or "binned" (fast approximation)
+trendline_frac = float(os.environ.get("PHS_TRENDLINE_FRAC", 2 / 3))
+trendline_mode = os.environ.get("PHS_TRENDLINE_MODE", "exact")
+# DataLoader query engine: "pandas" or "duckdb" (filters, sorting and top-N pushed down to DuckDB)
+query_backend = os.environ.get("PHS_QUERY_BACKEND", "pandas")
+# Import plotly / pandas and load the data in the background once the worker accepts connections
+prewarm = os.environ.get("PHS_PREWARM", "1") != "0"
+# Seconds between checks of the data file for a new extract, 0 turns the watcher off
+data_watch_seconds = float(os.environ.get("PHS_DATA_WATCH_SECONDS", 0))
+# Close sessions without activity for this many seconds, and the longest idle ones while
+# the worker is above the memory budget (MB of resident memory); 0 turns either off
+session_reaper = SessionReaper(
+    idle_seconds=float(os.environ.get("PHS_SESSION_IDLE_SECONDS", 0)),
+    memory_budget_mb=float(os.environ.get("PHS_MEMORY_BUDGET_MB", 0)),
+)
+# Over the budget, rendered plots are dropped before any session is closed
+session_reaper.add_release_hook(render_cache.clear)
+# A change of any of these inputs counts as activity of the session
+activity_inputs = ("selected_tab", "theme_mode", "byear", "mapyear", "ddpieyear", "ddCountry",
+                   "compare_mode", "ddCompare", "grid_country", "grid_year", "grid_score_min",
+                   "grid_score_max", "grid_sort", "grid_desc", "grid_page_size", "grid_page")
+# Sampling profiler (helper/profiler.py): a window of this many seconds when the worker
+# starts, and /admin/profile?seconds=N for requests carrying this token
+profile_seconds = float(os.environ.get("PHS_PROFILE_SECONDS", 0))
+profile_token = os.environ.get("PHS_PROFILE_TOKEN", "")
+# HTTP response compression (helper/compression.py): encodings in order of preference,
+# "br" needs the brotli package and an empty list turns it off. Smaller responses are sent as is
+http_compression = tuple(filter(None, os.environ.get("PHS_HTTP_COMPRESSION", "br,gzip").split(",")))
+compress_min_bytes = int(os.environ.get("PHS_COMPRESS_MIN_BYTES", 1024))
+gzip_level = int(os.environ.get("PHS_GZIP_LEVEL", 6))
+brotli_quality = int(os.environ.get("PHS_BROTLI_QUALITY", 5))
+
+def data_grid_panel():
+    if grid_mode != "server":
+        return ui.output_data_frame("df_table")
+    return ui.TagList(
+        ui.layout_columns(
+            ui.input_text("grid_country", "Country contains"),
+            ui.input_selectize("grid_year", "Year", choices=[], multiple=True),
+            ui.input_numeric("grid_score_min", "Ladder score min", value=None),
+            ui.input_numeric("grid_score_max", "Ladder score max", value=None),
+            ui.input_select("grid_sort", "Sort by", choices={"": "(file order)"}),
+            ui.input_switch("grid_desc", "Descending"),
+            col_widths=[3, 3, 2, 2, 2, 2]
+        ),
+        ui.output_data_frame("df_table"),
+        ui.layout_columns(
+            ui.input_select("grid_page_size", "Rows per page", choices=["25", "50", "100", "250"], selected="50"),
+            ui.input_numeric("grid_page", "Page", value=1, min=1),
+            ui.output_text("grid_info"),
+            col_widths=[2, 2, 8]
+        )
+    )
+
+def phs_navbar_title(cfg: dict):
+    return ui.tags.a(
+        ui.tags.img(class_ = "phs-navbar-logo", alt="PHS logo"), "",
+        href = get_phs_url(cfg),
+        target = "_blank",
+        class_="navbar-brand"
+    )
+
+def phs_footer(cfg: dict):
+    return ui.tags.footer(
+        ui.div(
+            ui.div(
+                ui.div("Shiny Python demo", class_ = "phs-footer-row1-left"),
+                ui.div(
+                    *[
+                        ui.tags.a(section.get('name_en'), href="#")
+                        for name, section in get_compliance_list(cfg).items() if section.get('enabled') is True and section.get('name_en') is not None
+                    ], class_="phs-footer-row1-right"),
+                class_="phs-footer-row phs-footer-row1",
+            ),
+            ui.div(
+                ui.span(
+                    ui.tags.a(
+                        "publichealthscotland.scot",
+                        href = get_phs_url(cfg),
+                        target = "_blank",
+                        rel = "noopener noreferrer",
+                        class_="phs-footer-phs-link"
+                    ), class_="left"),
+                ui.span(
+                    *[
+                        ui.tags.a(icon_svg(name), href=url, target="_blank", class_ = "phs-footer-social-icon")
+                        for name, url in get_social_urls(cfg).items()
+                    ], class_="phs-footer-row2-right"),
+                class_="phs-footer-row phs-footer-row2",
+            ),
+            ui.div(
+                ui.div(
+                    ui.tags.img(class_="ogl-logo", alt="Open Government Licence logo"),
+                    ui.span("All content is available under the ", 
+                            ui.tags.a("Open Government Licence",
+                                        href = get_ogl_url(cfg),
+                                        target = "_blank",
+                                        rel = "noopener noreferrer",
+                                        class_ = "phs-footer-ogl-link"),
+                            ", except where otherwise stated",
+                            class_="phs-footer-ogl-text"),
+                    class_ = "phs-footer-row3-left"
+                ),
+                ui.div(
+                    ui.span(id="app-footer", class_="phs-footer-copyright"),
+                    class_ = "phs-footer-row3-right",
+                ),
+                class_="phs-footer-row phs-footer-row3",
+            ), class_ = "phs-footer-inner"
+        ),
+        class_="phs-footer",
+        role="contentinfo"
+    )
 
 # Define the UI
 app_ui = ui.page_navbar(
     ui.nav_panel(
         # Name and icon
-        ui.TagList(fa.icon_svg("house"), "Home"),
+        ui.TagList(icon_svg("house"), "Home"),
         
         ui.layout_column_wrap(
             ui.output_ui("kpi_records"),
@@ -28,16 +166,16 @@ app_ui = ui.page_navbar(
             ui.card(ui.card_header("Top 3 happiness data distribution",
                     ui.popover(
                         ui.span(
-                            fa.icon_svg("ellipsis"),
+                            icon_svg("ellipsis"),
                             style="position:absolute; top: 5px; right: 7px;",),
                         "Year",
                         ui.input_selectize("ddpieyear", "Choose", choices=[] ))
                     ),
-                    ui.output_ui("pietop3", class_="phs-plot-container"),
+                    plot_container("pietop3"),
                     full_screen=True
             ),
             ui.card(ui.card_header("Scatter plot"), 
-                    ui.output_ui("scatterplot", class_="phs-plot-container"), 
+                    plot_container("scatterplot"), 
                     full_screen=True),
             col_widths=[6, 6]
         ),
@@ -47,11 +185,15 @@ app_ui = ui.page_navbar(
             ui.card(ui.card_header("time happiness",
                     ui.popover(
                         ui.span(
-                            fa.icon_svg("ellipsis"),
+                            icon_svg("ellipsis"),
                             style="position:absolute; top: 5px; right: 7px;",),
                         "Select a country",
-                        ui.input_selectize("ddCountry", "country", choices=[] ))),
-                    ui.output_ui("linecountry", class_="phs-plot-container"),
+                        ui.input_switch("compare_mode", "Compare countries"),
+                        ui.panel_conditional("!input.compare_mode",
+                                             ui.input_selectize("ddCountry", "country", choices=[] )),
+                        ui.panel_conditional("input.compare_mode",
+                                             ui.input_selectize("ddCompare", "countries", choices=[], multiple=True)))),
+                    plot_container("linecountry"),
                     full_screen=True),
             col_widths=[12]
         ),
@@ -59,39 +201,39 @@ app_ui = ui.page_navbar(
     ),
     ui.nav_panel(
         # Name and icon
-        ui.TagList(fa.icon_svg("chart-line"), "Bar plot"),
+        ui.TagList(icon_svg("chart-line"), "Bar plot"),
 
         ui.layout_sidebar(
             ui.sidebar(
                 ui.h3("World Happiness top 10"),
                 ui.input_selectize("byear", "Choose", choices=[])
             ),
-            ui.output_ui("top10_bar", class_="phs-plot-container")
+            plot_container("top10_bar")
         ),
         value="bar_plots"
     ),
     ui.nav_panel(
         # Name and icon
-        ui.TagList(fa.icon_svg("map"), "Geodata"),
+        ui.TagList(icon_svg("map"), "Geodata"),
 
         ui.layout_sidebar(
             ui.sidebar(
                 ui.h3("Map plot"),
                 ui.input_selectize("mapyear", "Choose", choices=[])
             ),
-            ui.output_ui("happiness_map", class_="phs-plot-container")
+            plot_container("happiness_map")
         ),
         value="geodata"
     ),
     ui.nav_spacer(),
     ui.nav_menu(
         # Name and icon
-        ui.TagList(fa.icon_svg("ellipsis"), "More"),
+        ui.TagList(icon_svg("ellipsis"), "More"),
         ui.nav_control(
             ui.div(
                 ui.span("User:"),
                 ui.div(
-                    fa.icon_svg("person-circle-check"),
+                    icon_svg("person-circle-check"),
                     ui.output_text("welcome", inline=True)
                 )
             )
@@ -107,10 +249,10 @@ app_ui = ui.page_navbar(
         ),
         ui.nav_panel(
             # Name and icon
-            ui.TagList(fa.icon_svg("database"), "Database"),
+            ui.TagList(icon_svg("database"), "Database"),
             ui.layout_columns(
                 ui.card(ui.card_header("happiness data"),
-                        ui.output_data_frame("df_table"),
+                        data_grid_panel(),
                         full_screen=True
                 ),
                 col_widths=[12]
@@ -119,13 +261,13 @@ app_ui = ui.page_navbar(
         ),
         ui.nav_panel(
             # Name and icon
-            ui.TagList(fa.icon_svg("codepen"), "Contact"),
+            ui.TagList(icon_svg("codepen"), "Contact"),
             ui.h2("Contact us"),
             value="contact"
         ),
         ui.nav_panel(
             # Name and icon
-            ui.TagList(fa.icon_svg("people-carry-box"), "Help"),
+            ui.TagList(icon_svg("people-carry-box"), "Help"),
             ui.h2("Help Page"),
             value="help"
         )
@@ -134,85 +276,98 @@ app_ui = ui.page_navbar(
     ui.head_content(
         ui.tags.link(rel="icon", href="www/img/phs-logo.svg", type="image/x-icon"),
         # ui.tags.script(src="https://cdn.plot.ly/plotly-3.7.0.min.js"), # online version
-        ui.tags.script(src="www/js/plotly-3.7.0.min.js"),
-        ui.tags.script(src="www/js/phs-footer.js"),
-        ui.tags.script(src="www/js/phs-router.js"),
-        ui.tags.script(src="www/js/phs-thene-mode.js"),
-        ui.tags.link(rel="stylesheet", href="www/styles/phs.css"),
-        ui.tags.link(rel="stylesheet", href="www/styles/_navbar.css"),
-        ui.tags.link(rel="stylesheet", href="www/styles/_footer.css"),
-        ui.tags.link(rel="stylesheet", href="www/styles/_value_box.css"),
-        ui.tags.link(rel="stylesheet", href="www/styles/_datagrid.css"),
-        ui.tags.link(rel="stylesheet", href="www/styles/_spinner.css")
-    ),
-    title=ui.tags.a(
-        ui.tags.img(class_ = "phs-navbar-logo", alt="PHS logo"), "",
-        href = get_phs_url(cfg),
-        target = "_blank",
-        class_="navbar-brand"
+        # Plotly, JS and CSS files (helper/assets.py), bundled when tools/build_assets.py has run
+        *asset_tags(assets_folder)
     ),
+    title=cached_html("navbar-title", lambda: phs_navbar_title(cfg), sources=(config_path, __file__)),
     lang="en",
     navbar_options=ui.navbar_options(position="fixed-top"),
-    footer=ui.tags.footer(
-        ui.div(
-            ui.div(
-                ui.div("Shiny Python demo", class_ = "phs-footer-row1-left"),
-                ui.div(
-                    *[
-                        ui.tags.a(section.get('name_en'), href="#")
-                        for name, section in get_compliance_list(cfg).items() if section.get('enabled') is True and section.get('name_en') is not None
-                    ], class_="phs-footer-row1-right"),
-                class_="phs-footer-row phs-footer-row1",
-            ),
-            ui.div(
-                ui.span(
-                    ui.tags.a(
-                        "publichealthscotland.scot",
-                        href = get_phs_url(cfg),
-                        target = "_blank",
-                        rel = "noopener noreferrer",
-                        class_="phs-footer-phs-link"
-                    ), class_="left"),
-                ui.span(
-                    *[
-                        ui.tags.a(fa.icon_svg(name), href=url, target="_blank", class_ = "phs-footer-social-icon")
-                        for name, url in get_social_urls(cfg).items()
-                    ], class_="phs-footer-row2-right"),
-                class_="phs-footer-row phs-footer-row2",
-            ),
-            ui.div(
-                ui.div(
-                    ui.tags.img(class_="ogl-logo", alt="Open Government Licence logo"),
-                    ui.span("All content is available under the ", 
-                            ui.tags.a("Open Government Licence",
-                                        href = get_ogl_url(cfg),
-                                        target = "_blank",
-                                        rel = "noopener noreferrer",
-                                        class_ = "phs-footer-ogl-link"),
-                            ", except where otherwise stated",
-                            class_="phs-footer-ogl-text"),
-                    class_ = "phs-footer-row3-left"
-                ),
-                ui.div(
-                    ui.span(id="app-footer", class_="phs-footer-copyright"),
-                    class_ = "phs-footer-row3-right",
-                ),
-                class_="phs-footer-row phs-footer-row3",
-            ), class_ = "phs-footer-inner"
-        ),
-        class_="phs-footer",
-        role="contentinfo"
-    ),
+    # Built from default-config.json once, then read from the UI cache (helper/ui_cache.py)
+    footer=cached_html("footer", lambda: phs_footer(cfg), sources=(config_path, __file__)),
     id="selected_tab",
     window_title="World Happiness"
 )
 
 def server(input, output, session):
-    my_data = DataLoader()
-    myplots = PlotBuilder()
+    # Imported on first use (pandas is slow to import), usually already done by warm_up
+    from data.data_con import DataLoader
+
+    my_data = DataLoader(query_backend)
+    myplots = PlotBuilder(plot_output_format)
+
+    ACTIVE_SESSIONS.inc()
+    session.on_ended(ACTIVE_SESSIONS.dec)
+    session_reaper.track(session)
+
+    if session_reaper.enabled:
+        @reactive.effect
+        def _track_activity():
+            for input_id in activity_inputs:
+                if input_id in input:
+                    input[input_id]()
+            session_reaper.touch(session.id)
+
+    df_val = reactive.Value(None, name="df_val")
+    kpi_cache = reactive.Value(None, name="kpi_cache")  # cache KPI stats after load
+
+    # Revision counters bumped by a data reload: a plot reads the counter of its
+    # year or country, so only plots whose slice changed render again. They are named:
+    # an unnamed reactive.Value inspects the call stack to find its name
+    dataset_rev = reactive.Value(0, name="dataset_rev")
+    year_revs: dict[int, reactive.Value] = {}
+    country_revs: dict[str, reactive.Value] = {}
+
+    def year_rev(year: int) -> int:
+        rev = year_revs.get(year)
+        if rev is None:
+            rev = year_revs[year] = reactive.Value(0, name=f"year_rev_{year}")
+        return rev()
+
+    def country_rev(country: str) -> int:
+        rev = country_revs.get(country)
+        if rev is None:
+            rev = country_revs[country] = reactive.Value(0, name=f"country_rev_{country}")
+        return rev()
+
+    def bump(rev: reactive.Value):
+        with reactive.isolate():
+            rev.set(rev() + 1)
+
+    async def _apply_data_change(change):
+        async with reactive.lock():
+            old_years, old_countries = my_data.dict_years, my_data.country_list
+            my_data.apply_change(change)
+            df_val.set(my_data.happiness_data)
+            kpi_cache.set(my_data.get_kpis())
+            bump(dataset_rev)
+            for year in change.years & year_revs.keys():
+                bump(year_revs[year])
+            for country in change.countries & country_revs.keys():
+                bump(country_revs[country])
+            if my_data.dict_years != old_years or my_data.country_list != old_countries:
+                with reactive.isolate():
+                    for input_id in ("byear", "mapyear", "ddpieyear"):
+                        ui.update_selectize(input_id, choices=my_data.dict_years, selected=input[input_id](), session=session)
+                    ui.update_selectize("ddCountry", choices=my_data.country_list, selected=input.ddCountry(), session=session)
+                    ui.update_selectize("ddCompare", choices=my_data.country_list, selected=input.ddCompare(), session=session)
+                    if grid_mode == "server":
+                        ui.update_selectize("grid_year", choices=my_data.dict_years, selected=input.grid_year(), session=session)
+            await reactive.flush()
 
-    df_val = reactive.Value(None)
-    kpi_cache = reactive.Value(None)  # cache KPI stats after load
+    if data_watch_seconds > 0:
+        loop = asyncio.get_event_loop()
+        # The watcher calls back from its own thread, hand the change to this session's loop
+        stop_watching = my_data.watch(
+            lambda change: asyncio.run_coroutine_threadsafe(_apply_data_change(change), loop),
+            interval=data_watch_seconds
+        )
+        session.on_ended(stop_watching)
+
+    if plot_output_format == "json":
+        @reactive.effect(priority=1)
+        async def _send_plot_templates():
+            # Sent once, JSON figures only carry the template name
+            await session.send_custom_message("phs_plotly_templates", get_template_json())
 
     @reactive.effect
     async def _sync_tab_hash():
@@ -229,37 +384,141 @@ def server(input, output, session):
             user_name = getpass.getuser()
         return user_name
 
-    # @reactive.effect
-    # async def _expire_session():
-    #     await asyncio.sleep(180)  # wait 1200s, then continue
-    #     await session.close()
+    async def _finish_loading():
+        # The rest of a streamed file arrives like a reload from the data watcher
+        change = await my_data.load_rest()
+        if change is not None:
+            await _apply_data_change(change)
+        ui.notification_remove("phs_loading", session=session)
 
     # Load data ONCE at session start
     @reactive.effect
     async def _load_data():
-        df = await my_data.load_data()
+        # A large CSV without columnar cache is shown from its first chunk on
+        df = await my_data.load_preview()
         df_val.set(df)
+        if not my_data.complete:
+            ui.notification_show("Loading the rest of the data...", id="phs_loading", duration=None, close_button=False)
+            # Outside this effect's context: _apply_data_change waits for the reactive lock
+            task = asyncio.get_running_loop().create_task(_finish_loading(), context=contextvars.Context())
+            session.on_ended(task.cancel)
         
-        # Cache KPI values once
-        kpi_cache.set({
-            "n_rows":   my_data.happiness_data.shape[0],
-            "n_cols":   my_data.happiness_data.shape[1],
-            "year_max": my_data.happiness_data["Year"].max(),
-            "year_min": my_data.happiness_data["Year"].min(),
-            "score_max": round(my_data.happiness_data["Ladder score"].max(), 2),
-            "score_min": round(my_data.happiness_data["Ladder score"].min(), 2),
-        })
+        # KPI values come from the summary cube built once per data file
+        kpi_cache.set(my_data.get_kpis())
 
         # Now the country list is ready!
         ui.update_selectize("byear", choices=my_data.dict_years)
         ui.update_selectize("mapyear", choices=my_data.dict_years)
         ui.update_selectize("ddpieyear", choices=my_data.dict_years)
         ui.update_selectize("ddCountry", choices=my_data.country_list)
+        ui.update_selectize("ddCompare", choices=my_data.country_list)
+        if grid_mode == "server":
+            ui.update_selectize("grid_year", choices=my_data.dict_years)
+            ui.update_select("grid_sort", choices={"": "(file order)", **{col: col for col in my_data.COLUMNS}})
 
     @reactive.Calc
     def current_theme():
         template = "plotly_dark" if input.theme_mode() == "dark" else "ggplot2"
         return template
+
+    # Plots live on these tabs, a tab's plots are only rendered while it is shown
+    tab_shown = {tab: reactive.Value(tab == "home", name=f"tab_shown_{tab}") for tab in ("home", "bar_plots", "geodata")}
+    # Arguments of the plot last requested, per output
+    shown_plots: dict[str, tuple] = {}
+    plot_tasks: list[LatestTask] = []
+
+    def _release_plots():
+        for task in plot_tasks:
+            task.cancel()
+        myplots.cancel_all()
+        shown_plots.clear()
+
+    session.on_ended(_release_plots)
+
+    @reactive.effect
+    def _track_shown_tab():
+        # Value.set() only invalidates on change, so switching between other tabs costs nothing
+        tab = input.selected_tab()
+        for name, shown in tab_shown.items():
+            shown.set(name == tab)
+
+    def require_tab(tab: str):
+        # Call first in a plot handler: while the tab is hidden the handler stops here,
+        # before reading its inputs or the theme, and the last plot stays in place
+        req(tab_shown[tab]())
+
+    def plot_render(fn):
+        # fn reads its tab and inputs and returns (builder, fetch, args), fetch() being the
+        # data query. The query and the render run in a LatestTask, outside the reactive
+        # flush and its lock: a slow render holds up neither this session nor any other
+        output_id = fn.__name__
+        handler = profiler.wrap(fn)
+
+        async def _render(key: tuple, fetch, builder: str, args: tuple):
+            # The render is cached under the version of the data fetched, not the one of the
+            # request: a reload may have moved my_data since. fetch() queries the dataset bound
+            # when it starts, with no await in between
+            version = my_data.version
+            data = await fetch()
+            with timer(RENDER_SECONDS, output=output_id):
+                plot, descript = await myplots.render_async(output_id, builder, version, data, *args)
+            return key, plot, descript
+
+        async def run(key: tuple, fetch, builder: str, args: tuple):
+            return await profiler.run(output_id, _render(key, fetch, builder, args))
+
+        task = LatestTask(run, name=f"plot_{output_id}")
+        plot_tasks.append(task)
+
+        @reactive.effect
+        def _request():
+            request = handler()
+            if request is None:
+                return
+            builder, fetch, args = request
+            key = (builder, my_data.version, args)
+            if shown_plots.get(output_id) == key:
+                # Back on a tab whose plot is unchanged, nothing to render
+                return
+            shown_plots[output_id] = key
+            # The render in flight is superseded
+            task.invoke(key, fetch, builder, args)
+
+        # An output keeps its plot on these silent exceptions, an effect only takes plain req()
+        progress, keep = (False, False) if plot_output_format == "json" else ("progress", True)
+
+        def result() -> tuple[str, str]:
+            # The plot of the latest request; while it renders, or when its render was
+            # cancelled, the previous plot stays in place
+            status = task.status()
+            if status == "running":
+                req(False, cancel_output=progress)
+            if status == "error":
+                error = task.error()
+                if isinstance(error, RenderCancelled):
+                    req(False, cancel_output=keep)
+                # Rendered again by the next request, even with the same arguments
+                shown_plots.pop(output_id, None)
+                raise error
+            req(status == "success", cancel_output=keep)
+            key, plot, descript = task.value()
+            req(shown_plots.get(output_id) == key, cancel_output=keep)
+            OUTPUT_BYTES.observe(len(plot), output=output_id)
+            return plot, descript
+
+        if plot_output_format == "json":
+            # Plots are pushed by custom message
+            @reactive.effect
+            async def _send():
+                plot, descript = result()
+                await session.send_custom_message("phs_plotly_react", {"id": output_id, "figure": plot, "description": descript})
+        else:
+            @output(id=output_id)
+            @render.ui
+            def _show():
+                plot, descript = result()
+                return ui.tags.div(ui.HTML(plot), aria_label=descript, role="img")
+        return task
     
     def kpi_value_box(title: str, icon_name: str, message: str, current: float, historical: float):
         # get colour for your icon and current value
@@ -276,12 +535,13 @@ def server(input, output, session):
                 ),
                 ui.div("(Historical / Current)", class_ = "div_hist_curr")
             ),
-            showcase=fa.icon_svg(icon_name, fill=f"{my_kpi_color} !important"),
+            showcase=icon_svg(icon_name, fill=f"{my_kpi_color} !important"),
             class_="phs-kpi-box",
         )
 
     @output
     @render.ui
+    @profiler.wrap
     def kpi_records():
         kpi = kpi_cache()
         if kpi is None:
@@ -290,6 +550,7 @@ def server(input, output, session):
 
     @output
     @render.ui
+    @profiler.wrap
     def kpi_scale():
         kpi = kpi_cache()
         if kpi is None:
@@ -298,6 +559,7 @@ def server(input, output, session):
 
     @output
     @render.ui
+    @profiler.wrap
     def kpi_other():
         kpi = kpi_cache()
         if kpi is None:
@@ -305,62 +567,156 @@ def server(input, output, session):
         return kpi_value_box("KPI Title", "face-smile",
                                     "Score (Min - max)", kpi["score_max"], kpi["score_min"])
     
+    grid_total = reactive.Value(0, name="grid_total")
+
+    @reactive.effect
+    @reactive.event(input.grid_country, input.grid_year, input.grid_score_min, input.grid_score_max,
+                    input.grid_sort, input.grid_desc, input.grid_page_size, ignore_init=True)
+    def _grid_first_page():
+        # A new filter or sort starts again from the first page
+        ui.update_numeric("grid_page", value=1)
+
     @output
     @render.data_frame
-    def df_table():
-        return render.DataGrid(my_data.happiness_data, 
-                                # width="fit-content", height=430, 
-                                filters=True)
+    @profiler.wrap
+    async def df_table():
+        df_val()  # render again when the data is reloaded
+        if grid_mode != "server":
+            return render.DataGrid(my_data.happiness_data, 
+                                    # width="fit-content", height=430, 
+                                    filters=True)
+        if df_val() is None:
+            return
+        page_size = int(input.grid_page_size())
+        page = max(int(input.grid_page() or 1), 1)
+        rows, total = await my_data.get_page(
+            offset=(page - 1) * page_size,
+            limit=page_size,
+            sort_by=input.grid_sort() or None,
+            descending=input.grid_desc(),
+            years=[int(year) for year in input.grid_year()],
+            country=input.grid_country().strip() or None,
+            score_range=(input.grid_score_min(), input.grid_score_max()),
+        )
+        grid_total.set(total)
+        # Only the current window is sent to the browser
+        return render.DataGrid(rows, filters=False, summary=False)
 
     @output
-    @render.ui
-    async def top10_bar():
+    @render.text
+    def grid_info():
+        total = grid_total()
+        page_size = int(input.grid_page_size())
+        pages = max((total + page_size - 1) // page_size, 1)
+        first = (max(int(input.grid_page() or 1), 1) - 1) * page_size
+        if first >= total:
+            return f"No rows on this page ({total} rows, {pages} pages)"
+        return f"Rows {first + 1} to {min(first + page_size, total)} of {total} ({pages} pages)"
+
+    @plot_render
+    def top10_bar():
+        require_tab("bar_plots")
         if not input.byear():  # guard against empty
             return
         year = int(input.byear())
-        data = await my_data.get_top_happiest_countries(year, 10)
-        plot, descript = myplots.build_top10_bar(data, current_theme(), year)
-        return ui.tags.div(ui.HTML(plot), aria_label=descript, role="img")
+        year_rev(year)
+        return "top10_bar", lambda: my_data.get_top_happiest_countries(year, 10), (current_theme(), year)
 
-    @output
-    @render.ui
-    async def happiness_map():
+    @plot_render
+    def happiness_map():
+        require_tab("geodata")
         if not input.mapyear():
             return
         year = int(input.mapyear())
-        data = await my_data.get_data_by_year(year)
-        plot, descript = myplots.build_happiness_map(data, current_theme(), year)
-        return ui.tags.div(ui.HTML(plot), aria_label=descript, role="img")
+        year_rev(year)
+        return "happiness_map", lambda: my_data.get_map_data(year), (current_theme(), year)
 
-    @output
-    @render.ui
-    async def pietop3():
+    @plot_render
+    def pietop3():
+        require_tab("home")
         if not input.ddpieyear():
             return
         # 
         
         year = int(input.ddpieyear())
-        data = await my_data.get_top_happiest_countries(year=year, top=3)
-        plot, descript = myplots.build_pietop3(data, current_theme(), year, 3)
-        return ui.tags.div(ui.HTML(plot), aria_label=descript, role="img")
+        year_rev(year)
+        return "pietop3", lambda: my_data.get_top_happiest_countries(year=year, top=3), (current_theme(), year, 3)
 
-    @output
-    @render.ui
-    async def scatterplot():
+    @plot_render
+    def scatterplot():
+        require_tab("home")
         if my_data.happiness_data is None:  # guard until data loaded
             return
-        data = await my_data.get_clean_data_for_scatter()
-        plot, descript = myplots.build_scatterplot(data, current_theme())
-        return ui.tags.div(ui.HTML(plot), aria_label=descript, role="img")
+        dataset_rev()
+        return "scatterplot", lambda: my_data.get_clean_data_for_scatter(trendline_frac, trendline_mode), (current_theme(),)
 
-    @output
-    @render.ui
-    async def linecountry():
+    @plot_render
+    def linecountry():
+        require_tab("home")
+        if input.compare_mode():
+            # Overlay of the selected countries, gathered from the year x country matrix
+            countries = tuple(input.ddCompare() or ())
+            if not countries:
+                return
+            for country in countries:
+                country_rev(country)
+            return "comparecountries", lambda: my_data.get_score_matrix(countries), (current_theme(), countries)
         if not input.ddCountry():
             return
         selected_country = input.ddCountry()
-        data = await my_data.get_data_by_country(selected_country)
-        plot, descript = myplots.build_linecountry(data, current_theme(), selected_country)
-        return ui.tags.div(ui.HTML(plot), aria_label=descript, role="img")
+        country_rev(selected_country)
+        return "linecountry", lambda: my_data.get_data_by_country(selected_country), (current_theme(), selected_country)
+
+shiny_app = App(app_ui, server, static_assets={"/www": get_my_www_folder()})
+
+async def metrics_endpoint(request):
+    # Prometheus text format: render latency, query and load times, payload sizes, sessions
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+async def profile_endpoint(request):
+    # Admin only: samples the output handlers and plot builds for ?seconds=N, then lists the files
+    token = request.headers.get("x-profile-token") or request.query_params.get("token", "")
+    if not profile_token or not hmac.compare_digest(token.encode(), profile_token.encode()):
+        return PlainTextResponse("Not Found", status_code=404)
+    try:
+        seconds = float(request.query_params.get("seconds", 10))
+    except ValueError:
+        return PlainTextResponse("seconds must be a number", status_code=400)
+    return JSONResponse(await profiler.profile(seconds))
+
+def warm_up():
+    # Heavy imports, plot templates and the data load; a failure here shows up again on first use
+    from data.data_con import DataLoader
+
+    warm_up_plots()
+    asyncio.run(DataLoader(query_backend).load_data())
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    if prewarm:
+        asyncio.get_running_loop().run_in_executor(None, warm_up)
+    if profile_seconds > 0:
+        profiler.start(profile_seconds)
+    yield
+    # Worker shutdown: drop queued renders and stop the background threads;
+    # a process pool waits for its running renders, off the event loop
+    await asyncio.to_thread(render_pool.shutdown)
+    if data_watch_seconds > 0:
+        from data.data_con import stop_watchers
+
+        stop_watchers()
+    window = profiler.stop()
+    if window is not None and not window.done():
+        # An open profiling window still writes what it sampled
+        await asyncio.wait([asyncio.wrap_future(window)], timeout=5)
+
+middleware = [Middleware(CompressionMiddleware, encodings=http_compression, minimum_size=compress_min_bytes,
+                         gzip_level=gzip_level, brotli_quality=brotli_quality)] if http_compression else []
 
-app = App(app_ui, server, static_assets={"/www": get_my_www_folder()})
+app = Starlette(lifespan=lifespan, middleware=middleware, routes=[
+    Route("/metrics", metrics_endpoint),
+    Route("/admin/profile", profile_endpoint),
+    # Cache headers and precompressed bundles, ahead of the Shiny static mount
+    Mount("/www", app=AssetFiles(directory=get_my_www_folder())),
+    Mount("/", app=shiny_app),
+])
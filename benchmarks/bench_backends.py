@@ -0,0 +1,63 @@
+# Times the queries per query backend (data/backends.py) on the data and on
+# scaled copies; tests/test_backends.py checks that they return the same rows.
+# Run from the project root:
+#     python -m benchmarks.bench_backends [--scales 1,10,100]
+import argparse
+import asyncio
+import logging
+import sys
+import time
+import numpy as np
+import pandas as pd
+from benchmarks.common import scale_frame
+from data.backends import BACKENDS
+from data.data_con import DataLoader, _SharedDataset
+
+REPEAT = 20
+
+
+def measure(run) -> float:
+    # Median time in microseconds
+    run()
+    samples = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return float(np.median(samples))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Query backend timings")
+    parser.add_argument("--scales", default="1,10,100", help="comma separated row multipliers")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="comma separated backend names")
+    args = parser.parse_args(argv)
+    names = args.backends.split(",")
+    # Scaled copies have made-up country names, do not log each one as missing from the map
+    logging.getLogger("data.geo").setLevel(logging.ERROR)
+
+    base_frame = asyncio.run(DataLoader().load_data())
+
+    year = int(base_frame["Year"].max())
+    country = str(base_frame["Country name"].iloc[0])
+    queries = {
+        "top10": ("top_countries", (year, 10)),
+        "top50": ("top_countries", (year, 50)),
+        "map": ("map_rows", (year,)),
+        "country": ("country_rows", (country,)),
+        "page_sorted": ("page", (1000, 50, "Ladder score", True, None, None, None)),
+        "page_filtered": ("page", (0, 50, "Year", False, [year - 1, year], "a", (5.0, None))),
+        "scatter": ("scatter_rows", ()),
+    }
+    print(f"{'rows':>9} {'backend':>8} " + " ".join(f"{name:>13}" for name in queries) + "   (us)")
+    for factor in (int(scale) for scale in args.scales.split(",")):
+        dataset = _SharedDataset(scale_frame(base_frame, factor), 0, f"bench-x{factor}")
+        for name in names:
+            backend = dataset.backend(name)
+            timings = [measure(lambda: getattr(backend, method)(*query_args)) for method, query_args in queries.values()]
+            print(f"{len(dataset.frame):>9} {backend.name:>8} " + " ".join(f"{value:>13.0f}" for value in timings))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
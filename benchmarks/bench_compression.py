@@ -0,0 +1,181 @@
+# Bytes on the wire and compression CPU time: the plot outputs of a simulated session
+# through the websocket permessage-deflate encoder at several settings, and the first
+# page load (HTML and static files) through CompressionMiddleware. Run from the project root:
+#     python -m benchmarks.bench_compression [--years 5] [--compare old.json]
+import argparse
+import asyncio
+import gzip
+import json
+import re
+import sys
+import time
+import numpy as np
+from starlette.applications import Starlette
+from websockets.extensions.permessage_deflate import PerMessageDeflate
+from websockets.frames import Frame, Opcode
+from benchmarks.common import compare_results, write_results
+from data.data_con import DataLoader
+from helper.compression import WS_DEFLATE_LEVEL, WS_MEM_LEVEL, WS_WINDOW_BITS, CompressionMiddleware, brotli
+from view.myplots import PlotBuilder
+
+# (zlib level, window bits, memory level); uvicorn's own protocol uses (6, 12, 5)
+WS_SETTINGS = {
+    "uvicorn": (6, 12, 5),
+    "level1": (1, 15, 8),
+    "default": (WS_DEFLATE_LEVEL, WS_WINDOW_BITS, WS_MEM_LEVEL),
+    "level9": (9, 15, 8),
+}
+THEMES = ("ggplot2", "plotly_dark")
+ASSET_URL = re.compile(r'(?:src|href)="(/?(?:www|lib|shiny)[^"?#]+)')
+
+
+def session_payloads(loop, output_format: str, years: int) -> list[bytes]:
+    # The plot messages a session receives while it steps through the last years,
+    # a few countries and both themes, in Shiny's message envelope
+    loader = DataLoader()
+    frame = loop.run_until_complete(loader.load_data())
+    builder = PlotBuilder(output_format)
+    countries = [str(country) for country in frame["Country name"].unique()[:years]]
+    renders = []
+    for theme in THEMES:
+        for year in sorted(frame["Year"].unique())[-years:]:
+            year = int(year)
+            top10 = loop.run_until_complete(loader.get_top_happiest_countries(year, 10))
+            top3 = loop.run_until_complete(loader.get_top_happiest_countries(year, 3))
+            renders.append(("top10_bar", builder.build_top10_bar(top10, theme, year)))
+            renders.append(("pietop3", builder.build_pietop3(top3, theme, year, 3)))
+            year_data = loop.run_until_complete(loader.get_map_data(year))
+            renders.append(("happiness_map", builder.build_happiness_map(year_data, theme, year)))
+        for country in countries:
+            data = loop.run_until_complete(loader.get_data_by_country(country))
+            renders.append(("linecountry", builder.build_linecountry(data, theme, country)))
+        scatter = loop.run_until_complete(loader.get_clean_data_for_scatter(None, "binned"))
+        renders.append(("scatterplot", builder.build_scatterplot(scatter, theme)))
+    payloads = []
+    for output_id, (plot, descript) in renders:
+        if output_format == "json":
+            message = {"custom": {"phs_plotly_react": {"id": output_id, "figure": plot, "description": descript}}}
+        else:
+            html = f'<div aria-label="{descript}" role="img">{plot}</div>'
+            message = {"errors": {}, "values": {output_id: {"html": html, "deps": []}}, "inputMessages": []}
+        payloads.append(json.dumps(message).encode())
+    return payloads
+
+
+def bench_websocket(payloads: list[bytes], prefix: str) -> dict[str, float]:
+    # One encoder per setting, kept across messages like a connection with context takeover
+    results = {f"{prefix}/raw_bytes_per_render": float(np.mean([len(payload) for payload in payloads]))}
+    for name, (level, bits, mem_level) in WS_SETTINGS.items():
+        encoder = PerMessageDeflate(False, False, bits, bits, {"level": level, "memLevel": mem_level})
+        sizes, seconds = [], []
+        for payload in payloads:
+            start = time.process_time()
+            frame = encoder.encode(Frame(Opcode.TEXT, payload))
+            seconds.append(time.process_time() - start)
+            sizes.append(len(frame.data))
+        results[f"{prefix}/{name}/bytes_per_render"] = float(np.mean(sizes))
+        results[f"{prefix}/{name}/ratio"] = sum(sizes) / sum(len(payload) for payload in payloads)
+        results[f"{prefix}/{name}/cpu_us_per_render"] = float(np.mean(seconds)) * 1e6
+    return results
+
+
+async def asgi_get(app, path: str, accept_encoding: str) -> tuple[int, dict[str, str], bytes]:
+    # GET through the ASGI app without a server: status, headers and the body as sent
+    scope = {"type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+             "headers": [(b"host", b"localhost"), (b"accept-encoding", accept_encoding.encode())],
+             "client": ("127.0.0.1", 0), "server": ("localhost", 80)}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    start = next(message for message in messages if message["type"] == "http.response.start")
+    headers = {key.decode().lower(): value.decode() for key, value in start["headers"]}
+    return start["status"], headers, b"".join(message.get("body", b"") for message in messages)
+
+
+def bench_page(loop, encodings: dict[str, dict], repeat: int) -> dict[str, float]:
+    # The first page load: the HTML of app_ui and the static files it links
+    import app
+
+    # The app's routes without its own middleware
+    plain = Starlette(routes=app.app.routes)
+    status, _, page = loop.run_until_complete(asgi_get(plain, "/", "identity"))
+    paths = ["/"] + sorted(set(ASSET_URL.findall(page.decode())))
+    paths = [path if path.startswith("/") else "/" + path for path in paths]
+    bodies = {}
+    for path in paths:
+        status, _, body = loop.run_until_complete(asgi_get(plain, path, "identity"))
+        if status == 200:
+            bodies[path] = body
+    results = {"page/files": len(bodies), "page/identity/html_bytes": len(bodies["/"]),
+               "page/identity/total_bytes": sum(len(body) for body in bodies.values())}
+    for name, options in encodings.items():
+        middleware = CompressionMiddleware(plain, encodings=(name,), minimum_size=1024, **options)
+        sizes = {}
+        for path in bodies:
+            _, headers, body = loop.run_until_complete(asgi_get(middleware, path, "gzip, deflate, br"))
+            sizes[path] = len(body)
+        results[f"page/{name}/html_bytes"] = sizes["/"]
+        results[f"page/{name}/total_bytes"] = sum(sizes.values())
+        # Compression time of the whole page load, on the bodies the middleware received
+        compress = (lambda data: gzip.compress(data, options["gzip_level"])) if name == "gzip" \
+            else (lambda data: brotli.compress(data, quality=options["brotli_quality"]))
+        samples = []
+        for _ in range(repeat):
+            start = time.process_time()
+            for body in bodies.values():
+                if len(body) >= 1024:
+                    compress(body)
+            samples.append(time.process_time() - start)
+        results[f"page/{name}/cpu_ms"] = float(np.median(samples)) * 1e3
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Compressed size and CPU cost of plot messages and the first page")
+    parser.add_argument("--years", type=int, default=5, help="years and countries the simulated session steps through")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--gzip-level", type=int, default=6)
+    parser.add_argument("--brotli-quality", type=int, default=5)
+    parser.add_argument("--output", help="result file, defaults to benchmarks/results/compression-<time>.json")
+    parser.add_argument("--compare", help="earlier result file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative increase reported as a regression")
+    args = parser.parse_args(argv)
+
+    loop = asyncio.new_event_loop()
+    results: dict[str, float] = {}
+    for output_format in ("html", "json"):
+        print(f"websocket {output_format} ...", file=sys.stderr)
+        payloads = session_payloads(loop, output_format, args.years)
+        results[f"ws_{output_format}/renders"] = len(payloads)
+        results.update(bench_websocket(payloads, f"ws_{output_format}"))
+    print("page ...", file=sys.stderr)
+    encodings = {"gzip": {"gzip_level": args.gzip_level}}
+    if brotli is not None:
+        encodings["br"] = {"brotli_quality": args.brotli_quality}
+    results.update(bench_page(loop, encodings, args.repeat))
+    loop.close()
+
+    for key, value in results.items():
+        print(f"{key:<48} {value:>12.3f}")
+    path = write_results("compression", results, {
+        "years": args.years,
+        "repeat": args.repeat,
+        "gzip_level": args.gzip_level,
+        "brotli_quality": args.brotli_quality,
+        "ws_settings": WS_SETTINGS,
+    }, args.output)
+    print(f"\nResults written to {path}")
+    if args.compare:
+        return 1 if compare_results(args.compare, results, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
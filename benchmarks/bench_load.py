@@ -0,0 +1,50 @@
+# Load time and frame memory of the CSV path against the columnar Arrow cache,
+# on the real data and on scaled copies. Run from the project root:
+#     python -m benchmarks.bench_load
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from data.columnar import build_cache, read_cache, read_csv
+from data.data_con import DataLoader
+
+SCALES = [1, 10, 100]
+REPEAT = 5
+
+
+def timeit(fn, *args) -> tuple[float, pd.DataFrame]:
+    # Median time in milliseconds and the last result
+    samples = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = fn(*args)
+        samples.append((time.perf_counter() - start) * 1e3)
+    return float(np.median(samples)), result
+
+
+def frame_mb(frame: pd.DataFrame) -> float:
+    return frame.memory_usage(deep=True).sum() / 2**20
+
+
+def main():
+    columns = DataLoader().COLUMNS
+    source = pd.read_csv("data/WHR2024.csv")
+
+    print(f"{'rows':>9} {'csv ms':>8} {'csv MB':>7} {'compact ms':>11} {'compact MB':>11} "
+          f"{'arrow ms':>9} {'arrow MB':>9}")
+    with tempfile.TemporaryDirectory() as folder:
+        for factor in SCALES:
+            csv_path = os.path.join(folder, f"whr_x{factor}.csv")
+            pd.concat([source] * factor, ignore_index=True).to_csv(csv_path, index=False)
+            build_cache(csv_path)
+
+            csv_ms, plain = timeit(lambda: pd.read_csv(csv_path, usecols=columns))
+            compact_ms, compact = timeit(read_csv, csv_path, columns)
+            arrow_ms, cached = timeit(read_cache, csv_path, columns)
+            print(f"{len(plain):>9} {csv_ms:>8.1f} {frame_mb(plain):>7.2f} {compact_ms:>11.1f} "
+                  f"{frame_mb(compact):>11.2f} {arrow_ms:>9.1f} {frame_mb(cached):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# DataLoader queries and PlotBuilder.build_* timings on the real data and on
+# scaled copies, written to a JSON file for regression comparison. Run from
+# the project root:
+#     python -m benchmarks.bench_micro [--scales 1,10,100,1000] [--compare old.json]
+import argparse
+import asyncio
+import logging
+import sys
+import time
+import numpy as np
+from benchmarks.common import compare_results, scale_frame, write_results
+from data.data_con import DataLoader, _SharedDataset
+from view.myplots import PlotBuilder
+
+# Above this many rows the scatter trendline uses the binned LOWESS, the exact
+# fit is quadratic in the number of rows
+EXACT_TRENDLINE_ROWS = 5000
+THEME = "ggplot2"
+
+
+def measure(run, repeat: int, warmup: int = 1) -> float:
+    # Median time in milliseconds
+    for _ in range(warmup):
+        run()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - start) * 1e3)
+    return float(np.median(samples))
+
+
+def bench_scale(base_frame, factor: int, loop, query_repeat: int, plot_repeat: int) -> dict[str, float]:
+    results: dict[str, float] = {}
+    prefix = f"x{factor}"
+    frame = scale_frame(base_frame, factor)
+    year = int(frame["Year"].max())
+    country = str(frame["Country name"].iloc[0])
+    results[f"{prefix}/rows"] = len(frame)
+
+    start = time.perf_counter()
+    dataset = _SharedDataset(frame, 0, f"bench-x{factor}")
+    results[f"{prefix}/dataset_build_ms"] = (time.perf_counter() - start) * 1e3
+    loader = DataLoader()
+    loader._bind(dataset)
+
+    def query(fn, *args, **kwargs):
+        return lambda: loop.run_until_complete(fn(*args, **kwargs))
+
+    queries = {
+        "top10": query(loader.get_top_happiest_countries, year, 10),
+        "year": query(loader.get_data_by_year, year),
+        "map": query(loader.get_map_data, year),
+        "country": query(loader.get_data_by_country, country),
+        "page_sorted": query(loader.get_page, 0, 50, sort_by="Ladder score", descending=True),
+        "page_filtered": query(loader.get_page, 0, 50, years=[year], score_range=(5.0, 8.0)),
+        "kpis": loader.get_kpis,
+    }
+    for name, run in queries.items():
+        results[f"{prefix}/query/{name}_ms"] = measure(run, query_repeat)
+
+    mode = "exact" if len(frame) <= EXACT_TRENDLINE_ROWS else "binned"
+    scatter = query(loader.get_clean_data_for_scatter, None, mode)
+    # The first call fits the trendline, later calls reuse it
+    start = time.perf_counter()
+    scatter_data = scatter()
+    results[f"{prefix}/query/scatter_first_ms"] = (time.perf_counter() - start) * 1e3
+    results[f"{prefix}/query/scatter_ms"] = measure(scatter, query_repeat)
+
+    inputs = {
+        "top10_bar": (queries["top10"](), THEME, year),
+        "happiness_map": (queries["map"](), THEME, year),
+        "pietop3": (loop.run_until_complete(loader.get_top_happiest_countries(year, 3)), THEME, year, 3),
+        "scatterplot": (scatter_data, THEME),
+        "linecountry": (queries["country"](), THEME, country),
+    }
+    for output_format in ("html", "json"):
+        builder = PlotBuilder(output_format)
+        for name, args in inputs.items():
+            build = getattr(builder, f"build_{name}")
+            results[f"{prefix}/plot_{output_format}/{name}_ms"] = measure(lambda: build(*args), plot_repeat)
+            results[f"{prefix}/plot_{output_format}/{name}_bytes"] = len(build(*args)[0])
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="DataLoader query and PlotBuilder micro-benchmarks")
+    parser.add_argument("--scales", default="1,10,100,1000", help="comma separated row multipliers")
+    parser.add_argument("--query-repeat", type=int, default=50)
+    parser.add_argument("--plot-repeat", type=int, default=5)
+    parser.add_argument("--output", help="result file, defaults to benchmarks/results/micro-<time>.json")
+    parser.add_argument("--compare", help="earlier result file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slowdown reported as a regression")
+    args = parser.parse_args(argv)
+    scales = [int(scale) for scale in args.scales.split(",")]
+    # Scaled copies have made-up country names, do not log each one as missing from the map
+    logging.getLogger("data.geo").setLevel(logging.ERROR)
+
+    loop = asyncio.new_event_loop()
+    base_frame = loop.run_until_complete(DataLoader().load_data())
+    results: dict[str, float] = {}
+    for factor in scales:
+        print(f"x{factor} ...", file=sys.stderr)
+        results.update(bench_scale(base_frame, factor, loop, args.query_repeat, args.plot_repeat))
+    loop.close()
+
+    for key, value in results.items():
+        print(f"{key:<48} {value:>12.3f}")
+    path = write_results("micro", results, {
+        "scales": scales,
+        "query_repeat": args.query_repeat,
+        "plot_repeat": args.plot_repeat,
+        "exact_trendline_rows": EXACT_TRENDLINE_ROWS,
+    }, args.output)
+    print(f"\nResults written to {path}")
+    if args.compare:
+        return 1 if compare_results(args.compare, results, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+# Lookup latency of the DataLoader queries against a naive boolean-mask scan
+# as the dataset grows. Run from the project root:
+#     python -m benchmarks.bench_queries
+import asyncio
+import logging
+import time
+import numpy as np
+import pandas as pd
+from data.data_con import DataLoader, _SharedDataset
+from benchmarks.common import scale_frame
+
+SCALES = [1, 10, 100, 1000]
+REPEAT = 50
+# Countries overlaid by the comparison query
+COMPARE_COUNTRIES = 30
+
+
+def run_now(coro):
+    # The query coroutines never suspend, drive them without an event loop
+    # so loop start-up cost does not hide the lookup time
+    try:
+        coro.send(None)
+    except StopIteration as done:
+        return done.value
+    raise RuntimeError("query coroutine suspended")
+
+
+def timeit(fn, *args) -> float:
+    # Median time in microseconds
+    samples = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        run_now(fn(*args)) if asyncio.iscoroutinefunction(fn) else fn(*args)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return float(np.median(samples))
+
+
+def main():
+    # Scaled copies have made-up country names, do not log each one as missing from the map
+    logging.getLogger("data.geo").setLevel(logging.ERROR)
+    base = DataLoader()
+    base_frame = asyncio.run(base.load_data())
+    year = int(base_frame["Year"].max())
+    country = base_frame["Country name"].iloc[0]
+    countries = base.country_list[:COMPARE_COUNTRIES]
+
+    print(f"{'rows':>10} {'build ms':>9} {'matrix ms':>10} {'top10 scan':>11} {'top10 idx':>10} "
+          f"{'year scan':>10} {'year idx':>9} {'ctry scan':>10} {'ctry idx':>9} "
+          f"{'cmp slices':>11} {'cmp matrix':>11}   (us)")
+    for factor in SCALES:
+        frame = scale_frame(base_frame, factor)
+        start = time.perf_counter()
+        dataset = _SharedDataset(frame, 0, "bench")
+        build_ms = (time.perf_counter() - start) * 1e3
+        loader = DataLoader()
+        loader._bind(dataset)
+        # The year x country matrix is built on first use, on the dataset executor
+        start = time.perf_counter()
+        asyncio.run(loader.get_score_matrix(countries))
+        matrix_ms = (time.perf_counter() - start) * 1e3
+
+        def top10_scan():
+            return frame[frame["Year"] == year].sort_values(by="Ladder score", ascending=False).head(10)
+
+        def year_scan():
+            return frame[frame["Year"] == year]
+
+        def country_scan():
+            return frame[frame["Country name"] == country].sort_values(by="Year")
+
+        async def top10_idx():
+            return await loader.get_top_happiest_countries(year, 10)
+
+        async def year_idx():
+            return await loader.get_data_by_year(year)
+
+        async def country_idx():
+            return await loader.get_data_by_country(country)
+
+        async def compare_slices():
+            # One country query each, then pivoted to a column per country
+            rows = [await loader.get_data_by_country(name) for name in countries]
+            return pd.concat(rows).pivot_table(index="Year", columns="Country name", values="Ladder score",
+                                               observed=True)
+
+        async def compare_matrix():
+            return await loader.get_score_matrix(countries)
+
+        print(f"{len(frame):>10} {build_ms:>9.1f} {matrix_ms:>10.1f} {timeit(top10_scan):>11.0f} {timeit(top10_idx):>10.0f} "
+              f"{timeit(year_scan):>10.0f} {timeit(year_idx):>9.0f} "
+              f"{timeit(country_scan):>10.0f} {timeit(country_idx):>9.0f} "
+              f"{timeit(compare_slices):>11.0f} {timeit(compare_matrix):>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
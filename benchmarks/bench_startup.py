@@ -0,0 +1,85 @@
+# Worker cold start: import time breakdown of app.py (python -X importtime),
+# time until a fresh worker answers HTTP, and until its first session has the
+# home tab rendered. Run from the project root:
+#     python -m benchmarks.bench_startup [--runs 3] [--compare old.json]
+import argparse
+import asyncio
+import re
+import subprocess
+import sys
+import time
+import numpy as np
+from benchmarks.common import compare_results, write_results
+from benchmarks.load_test import Session, free_port, start_app
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+def import_breakdown(module: str = "app") -> tuple[float, dict[str, float]]:
+    # Total import time of module and cumulative time of each module it imports directly, in ms
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, check=True).stderr
+    total, children, pending = 0.0, {}, {}
+    # A module's line comes after the lines of the modules it imports
+    for match in IMPORT_LINE.finditer(stderr):
+        cumulative, depth, name = int(match[2]) / 1e3, len(match[3]), match[4]
+        if depth == 3:
+            pending[name] = pending.get(name, 0.0) + cumulative
+        elif depth == 1:
+            if name == module:
+                total, children = cumulative, pending
+            pending = {}
+    return total, children
+
+
+def cold_start(app: str, timeout: float) -> tuple[float, float | None]:
+    # Seconds until the worker answers "/", then until its first session is rendered
+    port = free_port()
+    start = time.perf_counter()
+    process = start_app(app, port, timeout)
+    ready = time.perf_counter() - start
+    try:
+        record = asyncio.run(Session(f"ws://127.0.0.1:{port}/websocket/", 0, timeout).run(0, 0))
+    finally:
+        process.terminate()
+        process.wait()
+    return ready, record["start"]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="App cold start and import time report")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--app", default="app:app", help="ASGI app started with uvicorn")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", help="result file, defaults to benchmarks/results/startup-<time>.json")
+    parser.add_argument("--compare", help="earlier result file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slowdown reported as a regression")
+    args = parser.parse_args(argv)
+    module = args.app.split(":")[0]
+
+    imports = [import_breakdown(module) for _ in range(args.runs)]
+    starts = [cold_start(args.app, args.timeout) for _ in range(args.runs)]
+
+    results: dict[str, float] = {
+        "import/total_ms": float(np.median([total for total, _ in imports])),
+        "worker/ready_ms": float(np.median([ready for ready, _ in starts])) * 1e3,
+    }
+    firsts = [first for _, first in starts if first is not None]
+    if firsts:
+        results["worker/first_session_ms"] = float(np.median(firsts)) * 1e3
+    names = sorted({name for _, children in imports for name in children},
+                   key=lambda name: -imports[0][1].get(name, 0.0))
+    for name in names:
+        results[f"import/{name}_ms"] = float(np.median([children.get(name, 0.0) for _, children in imports]))
+
+    for key, value in results.items():
+        print(f"{key:<48} {value:>12.1f}")
+    path = write_results("startup", results, {"runs": args.runs, "app": args.app}, args.output)
+    print(f"\nResults written to {path}")
+    if args.compare:
+        return 1 if compare_results(args.compare, results, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
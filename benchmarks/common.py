@@ -0,0 +1,84 @@
+# Shared helpers of the benchmark scripts: synthetic data scaling, JSON result
+# files and comparison of two result files
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import pandas as pd
+
+RESULTS_FOLDER = os.path.join("benchmarks", "results")
+
+
+def scale_frame(frame: pd.DataFrame, factor: int) -> pd.DataFrame:
+    # Repeat the real data, each copy gets its own country names so the
+    # number of rows per year grows while rows per country stay the same
+    copies = []
+    for i in range(factor):
+        part = frame.copy()
+        if i:
+            part["Country name"] = part["Country name"].astype(str) + f" #{i}"
+        copies.append(part)
+    return pd.concat(copies, ignore_index=True)
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(name: str, metrics: dict[str, float], settings: dict, output: str | None = None) -> str:
+    """Write benchmark results to a JSON file.
+    Args:
+        name (str): Benchmark name, used for the default file name.
+        metrics (dict[str, float]): Measurements keyed by metric name, lower is better.
+        settings (dict): Options the benchmark ran with.
+        output (str | None): File path, defaults to benchmarks/results/<name>-<time>.json.
+    Returns:
+        str: Path of the written file.
+    """
+    if output is None:
+        os.makedirs(RESULTS_FOLDER, exist_ok=True)
+        output = os.path.join(RESULTS_FOLDER, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    document = {
+        "benchmark": name,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_revision": git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "settings": settings,
+        "metrics": metrics,
+    }
+    with open(output, "w") as f:
+        json.dump(document, f, indent=2)
+    return output
+
+
+def compare_results(baseline_path: str, metrics: dict[str, float], tolerance: float = 0.2) -> list[str]:
+    """Print each metric against a baseline result file.
+    Args:
+        baseline_path (str): JSON file written by write_results.
+        metrics (dict[str, float]): Current measurements.
+        tolerance (float): Allowed relative slowdown before a metric counts as a regression.
+    Returns:
+        list[str]: Names of the metrics that regressed.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)["metrics"]
+    regressions = []
+    print(f"\n{'metric':<48} {'baseline':>12} {'current':>12} {'change':>8}")
+    for key, value in metrics.items():
+        old = baseline.get(key)
+        if old is None or value is None:
+            continue
+        change = (value - old) / old if old else 0.0
+        flag = ""
+        if change > tolerance:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        print(f"{key:<48} {old:>12.3f} {value:>12.3f} {change:>+8.1%}{flag}")
+    return regressions
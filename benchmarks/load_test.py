@@ -0,0 +1,333 @@
+# Simulated concurrent sessions against a locally launched app. Each session
+# opens the Shiny websocket, waits for the home tab, then changes years,
+# country and tabs like a user would. Reports session start latency, render
+# latency percentiles per output and server memory per session, written to a
+# JSON file for regression comparison. A probe session meanwhile switches between
+# plot-free tabs: its latency is the time other sessions hold the reactive lock
+# (cross-session latency). Run from the project root:
+#     python -m benchmarks.load_test [--sessions 20] [--compare old.json]
+# Environment variables (PHS_PLOT_OUTPUT, PHS_GRID_MODE, ...) are passed on to the app.
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+import numpy as np
+import websockets
+from benchmarks.common import compare_results, write_results
+
+HOME_OUTPUTS = ("kpi_records", "kpi_scale", "kpi_other", "df_table", "scatterplot")
+# Outputs a session reports as visible, the app renders nothing for hidden outputs
+OUTPUTS = ("welcome", "kpi_records", "kpi_scale", "kpi_other", "df_table", "grid_info",
+           "top10_bar", "happiness_map", "pietop3", "scatterplot", "linecountry")
+INITIAL_INPUTS = {
+    "theme_mode": "light", ".clientdata_url_hash": "", "selected_tab": "home", "compare_mode": False, "ddCompare": None,
+    "grid_country": "", "grid_year": [], "grid_score_min": None, "grid_score_max": None,
+    "grid_sort": "", "grid_desc": False, "grid_page_size": "50", "grid_page": 1,
+    **{f".clientdata_output_{output}_hidden": False for output in OUTPUTS},
+}
+OPTION_VALUE = re.compile(r'value="([^"]*)"')
+SINGLEFLIGHT = re.compile(r'^phs_singleflight_requests_total\{group="(\w+)",result="(\w+)"\} (\S+)$', re.M)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb(pid: int, children: bool = False) -> float | None:
+    # Resident memory of the app process, with children: summed over its process tree. Linux only
+    total = None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    total = int(line.split()[1]) / 1024
+        if children:
+            with open(f"/proc/{pid}/task/{pid}/children") as f:
+                for child in f.read().split():
+                    total += rss_mb(int(child), True) or 0.0
+    except (OSError, TypeError):
+        pass
+    return total
+
+
+def start_app(app: str, port: int, timeout: float, workers: int = 1, ws: str | None = None) -> subprocess.Popen:
+    command = [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--log-level", "warning"]
+    if workers > 1:
+        command += ["--workers", str(workers)]
+    if ws:
+        command += ["--ws", ws]
+    process = subprocess.Popen(command)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"app exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"app did not answer on port {port} within {timeout}s")
+
+
+def singleflight_counts(base_url: str) -> dict[str, float]:
+    # Leader and coalesced requests per single-flight group, from the app's /metrics
+    with urllib.request.urlopen(f"{base_url}/metrics", timeout=10) as response:
+        text = response.read().decode()
+    return {f"singleflight/{group}/{result}": float(value) for group, result, value in SINGLEFLIGHT.findall(text)}
+
+
+class Session():
+    # One simulated browser session on the Shiny websocket
+    __slots__ = ("url", "ws", "seen", "choices", "rng", "timeout", "_arrived")
+
+    def __init__(self, url: str, seed: int, timeout: float):
+        self.url = url
+        self.ws = None
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.choices: dict[str, list[str]] = {}
+        # Output id -> arrival time of its latest value
+        self.seen: dict[str, float] = {}
+        self._arrived = asyncio.Event()
+
+    async def _receive(self):
+        async for raw in self.ws:
+            message = json.loads(raw)
+            now = time.perf_counter()
+            for output, value in (message.get("values") or {}).items():
+                self.seen[output] = now
+            # JSON plot output mode sends figures as custom messages
+            custom = message.get("custom") or {}
+            figure = custom.get("phs_plotly_react")
+            if figure:
+                self.seen[figure["id"]] = now
+            if "update_hash" in custom:
+                self.seen["update_hash"] = now
+            for output in message.get("errors") or {}:
+                self.seen[output] = now
+            for update in message.get("inputMessages") or []:
+                options = update.get("message", {}).get("options")
+                if isinstance(options, str):
+                    self.choices[update["id"]] = OPTION_VALUE.findall(options)
+            self._arrived.set()
+
+    async def wait_for(self, outputs, since: float) -> dict[str, float | None]:
+        # Seconds from `since` until each output got a value, None on timeout
+        deadline = since + self.timeout
+        while True:
+            done = {output: self.seen[output] - since for output in outputs if self.seen.get(output, 0) > since}
+            if len(done) == len(outputs) or time.perf_counter() > deadline:
+                return {output: done.get(output) for output in outputs}
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), max(deadline - time.perf_counter(), 0.01))
+            except asyncio.TimeoutError:
+                pass
+
+    async def wait_for_choices(self):
+        deadline = time.perf_counter() + self.timeout
+        while not {"byear", "ddCountry"} <= self.choices.keys() and time.perf_counter() < deadline:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), 0.5)
+            except asyncio.TimeoutError:
+                pass
+
+    async def update(self, inputs: dict, outputs) -> dict[str, float | None]:
+        sent = time.perf_counter()
+        await self.ws.send(json.dumps({"method": "update", "data": inputs}))
+        return await self.wait_for(outputs, sent)
+
+    async def run(self, steps: int, think_time: float) -> dict:
+        record = {"start": None, "renders": [], "timeouts": 0}
+        start = time.perf_counter()
+        async with websockets.connect(self.url, max_size=None) as ws:
+            self.ws = ws
+            receiver = asyncio.create_task(self._receive())
+            try:
+                await ws.send(json.dumps({"method": "init", "data": INITIAL_INPUTS}))
+                first = await self.wait_for(HOME_OUTPUTS, start)
+                record["start"] = None if None in first.values() else max(first.values())
+                await self.wait_for_choices()
+                years = self.choices.get("byear") or ["2024"]
+                countries = self.choices.get("ddCountry") or ["Finland"]
+                plan = [
+                    ({"ddpieyear": years[-1], "ddCountry": countries[0]}, ("pietop3", "linecountry")),
+                    ({"selected_tab": "bar_plots", "byear": years[-1]}, ("top10_bar",)),
+                    ({"selected_tab": "geodata", "mapyear": years[-1]}, ("happiness_map",)),
+                    ({"selected_tab": "home"}, ()),
+                ]
+                # Each step changes one input to a new value, so its output has to render again
+                state = {"ddpieyear": years[-1], "ddCountry": countries[0], "grid_page": 1}
+                options = {"ddpieyear": (years, "pietop3"), "ddCountry": (countries, "linecountry")}
+                if "grid_year" in self.choices:
+                    # Server side grid (PHS_GRID_MODE=server), paging renders the table again
+                    options["grid_page"] = (list(range(1, 21)), "df_table")
+                for _ in range(steps):
+                    name = self.rng.choice(list(options))
+                    values, output = options[name]
+                    value = self.rng.choice([value for value in values if value != state[name]] or values)
+                    state[name] = value
+                    plan.append(({name: value}, (output,)))
+                for inputs, outputs in plan:
+                    timings = await self.update(inputs, outputs)
+                    for output, seconds in timings.items():
+                        if seconds is None:
+                            record["timeouts"] += 1
+                        else:
+                            record["renders"].append((output, seconds))
+                    await asyncio.sleep(think_time)
+            finally:
+                receiver.cancel()
+        return record
+
+    async def probe(self, done: asyncio.Event, interval: float) -> list[float]:
+        # Switch between two tabs without plots until done is set: the only work is the
+        # URL hash effect, so the latency is the wait for the reactive lock
+        latencies = []
+        async with websockets.connect(self.url, max_size=None) as ws:
+            self.ws = ws
+            receiver = asyncio.create_task(self._receive())
+            try:
+                sent = time.perf_counter()
+                await ws.send(json.dumps({"method": "init", "data": {**INITIAL_INPUTS, "selected_tab": "contact"}}))
+                await self.wait_for(("update_hash",), sent)
+                tabs = ("help", "contact")
+                while not done.is_set():
+                    timings = await self.update({"selected_tab": tabs[len(latencies) % 2]}, ("update_hash",))
+                    if timings["update_hash"] is not None:
+                        latencies.append(timings["update_hash"])
+                    await asyncio.sleep(interval)
+            finally:
+                receiver.cancel()
+        return latencies
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    data = np.asarray(values) * 1e3
+    return {"p50_ms": float(np.percentile(data, 50)), "p90_ms": float(np.percentile(data, 90)),
+            "p99_ms": float(np.percentile(data, 99)), "max_ms": float(data.max())}
+
+
+async def run_sessions(url: str, sessions: int, steps: int, think_time: float, ramp: float,
+                       timeout: float, pid: int | None, tree: bool = False,
+                       probe_interval: float = 0.1) -> tuple[dict[str, float], dict]:
+    # One session first, so lazy imports and the data load are not counted as session memory
+    await Session(url, -1, timeout).run(0, 0)
+    memory_before = rss_mb(pid, tree) if pid else None
+    peak = {"rss": memory_before}
+    hold = asyncio.Event()
+
+    async def one(index: int):
+        await asyncio.sleep(ramp * index / max(sessions, 1))
+        return await Session(url, index, timeout).run(steps, think_time)
+
+    async def sample_memory():
+        while not hold.is_set():
+            current = rss_mb(pid, tree)
+            if current is not None and (peak["rss"] is None or current > peak["rss"]):
+                peak["rss"] = current
+            await asyncio.sleep(0.1)
+
+    sampler = asyncio.create_task(sample_memory()) if pid else None
+    probe = asyncio.create_task(Session(url, -2, timeout).probe(hold, probe_interval)) if probe_interval > 0 else None
+    started = time.perf_counter()
+    records = await asyncio.gather(*(one(index) for index in range(sessions)))
+    elapsed = time.perf_counter() - started
+    hold.set()
+    if sampler:
+        await sampler
+    latencies = await probe if probe else []
+
+    results: dict[str, float] = {"wall_s": elapsed}
+    starts = [record["start"] for record in records if record["start"] is not None]
+    if starts:
+        results.update({f"session_start/{key}": value for key, value in percentiles(starts).items()})
+    by_output: dict[str, list[float]] = {}
+    for record in records:
+        for output, seconds in record["renders"]:
+            by_output.setdefault(output, []).append(seconds)
+    for output, values in sorted(by_output.items()):
+        results.update({f"render/{output}/{key}": value for key, value in percentiles(values).items()})
+    if latencies:
+        results.update({f"cross_session/{key}": value for key, value in percentiles(latencies).items()})
+    results["timeouts"] = sum(record["timeouts"] for record in records) + sessions - len(starts)
+    if memory_before is not None and peak["rss"] is not None:
+        results["memory/rss_before_mb"] = memory_before
+        results["memory/rss_peak_mb"] = peak["rss"]
+        results["memory/per_session_mb"] = (peak["rss"] - memory_before) / sessions
+    return results, {"sessions": sessions, "completed": len(starts)}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Concurrent session load test for the app")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--steps", type=int, default=10, help="random input changes per session")
+    parser.add_argument("--think-time", type=float, default=0.2, help="seconds between a session's input changes")
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which the sessions connect")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for an output")
+    parser.add_argument("--app", default="app:app", help="ASGI app started with uvicorn")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="uvicorn worker processes, memory is then summed over the workers")
+    parser.add_argument("--probe-interval", type=float, default=0.1,
+                        help="seconds between the probe session's tab switches, 0 turns the probe off")
+    parser.add_argument("--min-coalesced", type=int,
+                        help="fail unless at least this many renders joined another session's render, "
+                             "checked with one worker; defaults to 1 from 20 sessions on")
+    parser.add_argument("--ws", help="uvicorn websocket protocol, e.g. helper.compression:DeflateWebSocketProtocol")
+    parser.add_argument("--url", help="use an app that is already running, e.g. http://127.0.0.1:8000")
+    parser.add_argument("--output", help="result file, defaults to benchmarks/results/load-<time>.json")
+    parser.add_argument("--compare", help="earlier result file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slowdown reported as a regression")
+    args = parser.parse_args(argv)
+
+    process = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        port = free_port()
+        process = start_app(args.app, port, args.timeout, args.workers, args.ws)
+        base_url = f"http://127.0.0.1:{port}"
+    ws_url = base_url.replace("http", "ws", 1) + "/websocket/"
+    try:
+        results, summary = asyncio.run(run_sessions(ws_url, args.sessions, args.steps, args.think_time,
+                                                    args.ramp, args.timeout, process.pid if process else None,
+                                                    args.workers > 1, args.probe_interval))
+        # Counts, kept out of the timings compared against a baseline
+        shared = singleflight_counts(base_url)
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    for key, value in {**results, **shared}.items():
+        print(f"{key:<48} {value:>12.3f}")
+    settings = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+    settings["env"] = {key: value for key, value in os.environ.items() if key.startswith("PHS_")}
+    settings.update(summary, singleflight=shared)
+    path = write_results("load", results, settings, args.output)
+    print(f"\nResults written to {path}")
+    failed = False
+    coalesced = shared.get("singleflight/render/coalesced", 0.0)
+    min_coalesced = args.min_coalesced if args.min_coalesced is not None else int(args.sessions >= 20)
+    if args.workers == 1 and coalesced < min_coalesced:
+        # Sessions asking for the same plot at the same time should share one render
+        print(f"Only {coalesced:.0f} coalesced renders, expected at least {min_coalesced}")
+        failed = True
+    if args.compare:
+        failed = compare_results(args.compare, results, args.tolerance) or failed
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
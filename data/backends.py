@@ -0,0 +1,234 @@
+import abc
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from typing import TYPE_CHECKING, Iterable
+
+if TYPE_CHECKING:
+    from data.data_con import _SharedDataset
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBackend(abc.ABC):
+    """Evaluates the DataLoader queries on one loaded dataset.
+    Every method returns only the rows asked for, in the same order for every backend:
+    ties keep the file order.
+    """
+    name = "base"
+
+    @abc.abstractmethod
+    def top_countries(self, year: int, top: int) -> pd.DataFrame: ...
+
+    @abc.abstractmethod
+    def year_rows(self, year: int) -> pd.DataFrame: ...
+
+    @abc.abstractmethod
+    def map_rows(self, year: int) -> pd.DataFrame: ...
+
+    @abc.abstractmethod
+    def country_rows(self, country: str) -> pd.DataFrame: ...
+
+    @abc.abstractmethod
+    def page(self, offset: int, limit: int, sort_by: str | None, descending: bool, years: list[int] | None,
+             country: str | None, score_range: tuple[float | None, float | None] | None) -> tuple[pd.DataFrame, int]: ...
+
+    @abc.abstractmethod
+    def scatter_rows(self) -> pd.DataFrame: ...
+
+
+def matching_countries(names: Iterable[str], needle: str) -> list[str]:
+    # Country names containing needle ignoring case (casefold), the grid filter of every backend
+    needle = needle.casefold()
+    return [name for name in names if needle in name.casefold()]
+
+
+class PandasBackend(QueryBackend):
+    # Slices of the pre-sorted frames and precomputed orders of _SharedDataset
+    name = "pandas"
+
+    def __init__(self, dataset: "_SharedDataset"):
+        self.dataset = dataset
+
+    def year_rows(self, year: int) -> pd.DataFrame:
+        # Rows of one year, sorted by Ladder score (highest first)
+        rows = self.dataset.year_slices.get(year)
+        if rows is None:
+            return self.dataset.by_year.iloc[0:0]
+        return self.dataset.by_year.iloc[rows]
+
+    def top_countries(self, year: int, top: int) -> pd.DataFrame:
+        summary = self.dataset.summary
+        if top <= summary.top_n and year in summary.top:
+            return self.dataset.frame.iloc[summary.top[year][:top]]
+        return self.year_rows(year).head(top)
+
+    def map_rows(self, year: int) -> pd.DataFrame:
+        rows = self.dataset.year_slices.get(year, slice(0, 0))
+        return self.dataset.by_year.iloc[rows][["Country name", "Ladder score"]].assign(iso_alpha=self.dataset.year_iso[rows])
+
+    def country_rows(self, country: str) -> pd.DataFrame:
+        rows = self.dataset.country_slices.get(country)
+        if rows is None:
+            return self.dataset.by_country.iloc[0:0]
+        return self.dataset.by_country.iloc[rows]
+
+    def _filter_positions(self, years: list[int] | None, country: str | None) -> np.ndarray | None:
+        # Row positions in frame matching the year / country filters, None when unfiltered
+        dataset = self.dataset
+        positions = None
+        if years:
+            year_rows = dataset.by_year.index.to_numpy()
+            parts = [year_rows[dataset.year_slices[int(y)]] for y in years if int(y) in dataset.year_slices]
+            positions = np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.intp)
+        if country:
+            country_rows = dataset.by_country.index.to_numpy()
+            parts = [country_rows[dataset.country_slices[name]]
+                     for name in matching_countries(dataset.country_slices, country)]
+            matched = np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.intp)
+            positions = matched if positions is None else np.intersect1d(positions, matched, assume_unique=True)
+        return positions
+
+    def page(self, offset, limit, sort_by, descending, years, country, score_range):
+        frame = self.dataset.frame
+        positions = self._filter_positions(years, country)
+        low, high = score_range or (None, None)
+        if low is not None or high is not None:
+            scores = frame["Ladder score"].to_numpy()
+            if positions is None:
+                positions = np.arange(len(scores))
+            keep = np.ones(len(positions), dtype=bool)
+            if low is not None:
+                keep &= scores[positions] >= low
+            if high is not None:
+                keep &= scores[positions] <= high
+            positions = positions[keep]
+
+        if positions is None:
+            # Unfiltered: the window is a slice of a precomputed sort order
+            total = len(frame)
+            if sort_by:
+                window = self.dataset.sort_order(sort_by, descending)[offset:offset + limit]
+            else:
+                window = np.arange(offset, min(offset + limit, total))
+            return frame.iloc[window], total
+
+        total = len(positions)
+        rows = frame.iloc[positions]
+        if sort_by:
+            rows = rows.sort_values(sort_by, ascending=not descending, kind="stable", na_position="last")
+        return rows.iloc[offset:offset + limit], total
+
+    def scatter_rows(self) -> pd.DataFrame:
+        return self.dataset.frame[["Ladder score", "Explained by: Log GDP per capita"]].dropna()
+
+
+class DuckDBBackend(QueryBackend):
+    # Filters, sorting, top-N and projections run in an embedded DuckDB database,
+    # only the result rows become a DataFrame
+    name = "duckdb"
+
+    def __init__(self, dataset: "_SharedDataset"):
+        import duckdb
+
+        self.columns = list(dataset.frame.columns)
+        self.countries = [str(name) for name in dataset.country_list]
+        self._connection = duckdb.connect()
+        # Copied once into native DuckDB tables: scanning the pandas frame in place
+        # converts it on every query. NaN becomes NULL; _row keeps ties in file
+        # order, like the stable sorts of the pandas backend
+        self._connection.register("frame_view", dataset.frame.assign(_row=np.arange(len(dataset.frame))))
+        self._connection.execute('CREATE TABLE whr AS SELECT * REPLACE (CAST("Country name" AS VARCHAR) AS "Country name") '
+                                 'FROM frame_view ORDER BY _row')
+        self._connection.unregister("frame_view")
+        self._connection.register("iso_view", pd.DataFrame({"name": list(dataset.iso_codes),
+                                                            "iso_alpha": list(dataset.iso_codes.values())}))
+        self._connection.execute("CREATE TABLE iso AS SELECT * FROM iso_view")
+        self._connection.unregister("iso_view")
+        self._local = threading.local()
+
+    def _query(self, sql: str, parameters: list | None = None) -> pd.DataFrame:
+        # One cursor per thread, a DuckDB connection must not be shared between threads
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            cursor = self._local.cursor = self._connection.cursor()
+        return cursor.execute(sql, parameters or []).df()
+
+    @staticmethod
+    def _identifier(name: str) -> str:
+        return '"' + name.replace('"', '""') + '"'
+
+    def _select(self, where: str, order: str, limit: str = "", parameters: list | None = None) -> pd.DataFrame:
+        columns = ", ".join(self._identifier(c) for c in self.columns)
+        return self._query(f"SELECT {columns} FROM whr WHERE {where} ORDER BY {order} {limit}", parameters)
+
+    def year_rows(self, year: int) -> pd.DataFrame:
+        return self._select("Year = ?", '"Ladder score" DESC NULLS LAST, _row', parameters=[year])
+
+    def top_countries(self, year: int, top: int) -> pd.DataFrame:
+        return self._select("Year = ?", '"Ladder score" DESC NULLS LAST, _row', "LIMIT ?", [year, top])
+
+    def map_rows(self, year: int) -> pd.DataFrame:
+        return self._query(
+            'SELECT w."Country name", w."Ladder score", iso.iso_alpha FROM whr w '
+            'LEFT JOIN iso ON w."Country name" = iso.name '
+            'WHERE w.Year = ? ORDER BY w."Ladder score" DESC NULLS LAST, w._row', [year])
+
+    def country_rows(self, country: str) -> pd.DataFrame:
+        return self._select('"Country name" = ?', "Year, _row", parameters=[country])
+
+    def page(self, offset, limit, sort_by, descending, years, country, score_range):
+        conditions, parameters = ["TRUE"], []
+        if years:
+            conditions.append("list_contains(?, Year)")
+            parameters.append([int(y) for y in years])
+        if country:
+            # Matched in Python like the pandas backend: DuckDB's lower() is not casefold()
+            conditions.append('list_contains(?, "Country name")')
+            parameters.append(matching_countries(self.countries, country))
+        low, high = score_range or (None, None)
+        if low is not None:
+            conditions.append('"Ladder score" >= ?')
+            parameters.append(low)
+        if high is not None:
+            conditions.append('"Ladder score" <= ?')
+            parameters.append(high)
+        where = " AND ".join(conditions)
+
+        order = "_row"
+        if sort_by:
+            if sort_by not in self.columns:
+                raise KeyError(sort_by)
+            order = f"{self._identifier(sort_by)} {'DESC' if descending else 'ASC'} NULLS LAST, _row"
+        total = int(self._query(f"SELECT count(*) FROM whr WHERE {where}", parameters).iat[0, 0])
+        rows = self._select(where, order, "LIMIT ? OFFSET ?", parameters + [limit, offset])
+        return rows, total
+
+    def scatter_rows(self) -> pd.DataFrame:
+        return self._query(
+            'SELECT "Ladder score", "Explained by: Log GDP per capita" FROM whr '
+            'WHERE "Ladder score" IS NOT NULL AND "Explained by: Log GDP per capita" IS NOT NULL ORDER BY _row')
+
+
+BACKENDS: dict[str, type[QueryBackend]] = {
+    "pandas": PandasBackend,
+    "duckdb": DuckDBBackend,
+}
+
+
+def create_backend(name: str, dataset: "_SharedDataset") -> QueryBackend:
+    """Create the query backend of a dataset, falling back to pandas when the engine is not installed.
+    Args:
+        name (str): Backend name, a key of BACKENDS.
+        dataset (_SharedDataset): Loaded dataset the backend queries.
+    Returns:
+        QueryBackend: The backend.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown query backend: {name}")
+    try:
+        return BACKENDS[name](dataset)
+    except ImportError as error:
+        logger.warning("Query backend %s is not available (%s), using pandas", name, error)
+        return PandasBackend(dataset)
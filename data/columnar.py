@@ -0,0 +1,89 @@
+# Columnar binary cache of the happiness CSV (Arrow IPC / Feather v2).
+# Build it with: python -m data.columnar [csv_path]
+import os
+import sys
+import pandas as pd
+from data.ingest import read_validated
+
+_SOURCE_KEY = b"phs_source_mtime_ns"
+
+
+def cache_path_for(csv_path: str) -> str:
+    """Return the cache file path for a CSV file (same folder, .arrow extension).
+    Args:
+        csv_path (str): Path to the CSV file.
+    Returns:
+        str: Path to the Arrow cache file.
+    """
+    return os.path.splitext(csv_path)[0] + ".arrow"
+
+
+def read_csv(csv_path: str, columns: list[str] | None = None) -> pd.DataFrame:
+    """Read the CSV file with the compact dtypes of the ingestion schema (data/ingest.py).
+    Args:
+        csv_path (str): Path to the CSV file.
+        columns (list[str] | None): Columns to read, all when None.
+    Returns:
+        pd.DataFrame: The valid rows of the CSV.
+    """
+    return read_validated(csv_path, columns)
+
+
+def build_cache(csv_path: str, cache_path: str | None = None) -> str:
+    """Convert the CSV file to an uncompressed Arrow IPC file, which can be memory-mapped.
+    The CSV modification time is stored in the file metadata to detect stale caches.
+    Args:
+        csv_path (str): Path to the CSV file.
+        cache_path (str | None): Output path, defaults to cache_path_for(csv_path).
+    Returns:
+        str: Path of the written cache file.
+    """
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    cache_path = cache_path or cache_path_for(csv_path)
+    mtime_ns = os.stat(csv_path).st_mtime_ns
+    # Validated, without the empty trailing columns of the extract
+    frame = read_csv(csv_path)
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), _SOURCE_KEY: str(mtime_ns).encode()})
+    # Unique per process: several workers may build the same shared cache
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, cache_path)
+    return cache_path
+
+
+def read_cache(csv_path: str, columns: list[str] | None = None, cache_path: str | None = None) -> pd.DataFrame | None:
+    """Read the Arrow cache of a CSV file if it exists and matches the CSV modification time.
+    Args:
+        csv_path (str): Path to the CSV file.
+        columns (list[str] | None): Columns to read, all when None.
+        cache_path (str | None): Cache file, defaults to cache_path_for(csv_path).
+    Returns:
+        pd.DataFrame | None: The cached frame, None when there is no fresh cache or pyarrow is missing.
+    """
+    cache_path = cache_path or cache_path_for(csv_path)
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return None
+    with pa.memory_map(cache_path) as source:
+        table = pa.ipc.open_file(source).read_all()
+    metadata = table.schema.metadata or {}
+    if metadata.get(_SOURCE_KEY) != str(os.stat(csv_path).st_mtime_ns).encode():
+        return None
+    if columns is not None:
+        table = table.select(columns)
+    # Convert column by column and release each Arrow buffer once converted, so the
+    # read does not hold the mapped table and a consolidated copy of it at the same time
+    frame = table.to_pandas(self_destruct=True, split_blocks=True)
+    del table
+    return frame
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "data/WHR2024.csv"
+    print(f"Written {build_cache(path)}")
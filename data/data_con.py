@@ -1,8 +1,364 @@
 import pandas as pd
+import numpy as np
 import asyncio
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any, Callable, Hashable
+from data.columnar import build_cache, read_cache
+from data.ingest import IngestReport, concat_chunks, iter_chunks
+from data.trendline import lowess_fit
+from data.geo import resolve_iso_codes
+from data.matrix import ScoreMatrix
+from data.backends import QueryBackend, create_backend
+from data.summary import (SummaryAccumulator, SummaryCube, build_summary, load_summary, save_summary,
+                          summary_path_for, update_summary)
+from helper.metrics import COALESCED_REQUESTS, LOAD_SECONDS, QUERY_SECONDS, timed, timer
+from helper.shared_cache import file_lock, shared_folder
+
+# Loads and derived computations (trendlines, ...) run here, off the event loop
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="dataset-loader")
+
+logger = logging.getLogger(__name__)
+
+
+def _build_slices(frame: pd.DataFrame, key: str) -> dict:
+    # frame must already be sorted by key: map every key value to its row slice
+    starts = frame.groupby(key, sort=False, observed=True).indices
+    return {k: slice(int(pos[0]), int(pos[-1]) + 1) for k, pos in starts.items()}
+
+
+class _SharedDataset():
+    # One loaded copy of a data file, shared by every session in the process
+    __slots__ = ("frame", "by_year", "by_country", "year_slices", "country_slices",
+                 "country_list", "dict_years", "mtime_ns", "version", "_sort_orders",
+                 "_derived", "_lock", "summary", "iso_codes", "unmatched_countries", "year_iso", "_backends",
+                 "partial", "ingest_report")
+
+    def __init__(self, frame: pd.DataFrame, mtime_ns: int, version: str, summary: SummaryCube | None = None,
+                 partial: bool = False, ingest_report: IngestReport | None = None):
+        self.frame = frame
+        # The first rows of a file still being streamed, replaced by the full dataset
+        self.partial = partial
+        # Problems found in the CSV, None when the data came from the columnar cache
+        self.ingest_report = ingest_report
+        # KPIs, per-year / per-country statistics and top lists (data/summary.py)
+        self.summary = summary or build_summary(frame)
+        # Pre-sorted copies so the per-year / per-country queries are plain slices
+        self.by_year = frame.sort_values(["Year", "Ladder score"], ascending=[True, False],
+                                         kind="stable", na_position="last")
+        self.by_country = frame.sort_values(["Country name", "Year"], kind="stable")
+        self.year_slices: dict[int, slice] = {int(k): v for k, v in _build_slices(self.by_year, "Year").items()}
+        self.country_slices: dict[str, slice] = _build_slices(self.by_country, "Country name")
+        self.country_list: list[str] = frame["Country name"].unique().tolist()
+        # Country names resolved to ISO-3 once, the map then never matches names
+        self.iso_codes, self.unmatched_countries = resolve_iso_codes([str(name) for name in self.country_list])
+        self.year_iso = self.by_year["Country name"].astype(str).map(self.iso_codes).to_numpy()
+        self.dict_years: dict = {str(year): str(year) for year in sorted(frame['Year'].unique())}
+        self.mtime_ns = mtime_ns
+        self.version = version
+        self._sort_orders: dict[tuple[str, bool], np.ndarray] = {}
+        self._derived: dict[Hashable, Future] = {}
+        self._backends: dict[str, QueryBackend] = {}
+        self._lock = threading.Lock()
+
+    def backend(self, name: str) -> QueryBackend:
+        # Query backend (data/backends.py) of this dataset, created on first use and shared by all sessions
+        with self._lock:
+            backend = self._backends.get(name)
+            if backend is None:
+                backend = self._backends[name] = create_backend(name, self)
+        return backend
+
+    def derived(self, key: Hashable, build: Callable[[], Any]) -> Future:
+        # Result of build() computed once for this dataset version and shared by all sessions
+        with self._lock:
+            future = self._derived.get(key)
+            if future is None or (future.done() and future.exception() is not None):
+                future = self._derived[key] = _executor.submit(build)
+                COALESCED_REQUESTS.inc(group="derived", result="leader")
+            elif not future.done():
+                COALESCED_REQUESTS.inc(group="derived", result="coalesced")
+        return future
+
+    def sort_order(self, column: str, descending: bool = False) -> np.ndarray:
+        # Row positions of frame sorted by one column (missing values last), built on first use
+        key = (column, descending)
+        order = self._sort_orders.get(key)
+        if order is None:
+            order = self.frame[column].reset_index(drop=True).sort_values(
+                ascending=not descending, kind="stable", na_position="last").index.to_numpy()
+            self._sort_orders[key] = order
+        return order
+
+
+class _DatasetRegistry():
+    """Process-wide registry of loaded datasets keyed by (path, columns).
+    The first caller starts the load, concurrent callers await the same
+    in-flight future and the file is only read again when its mtime changes.
+    """
+    def __init__(self, executor: Executor = _executor):
+        self._lock = threading.Lock()
+        self._entries: dict[tuple, Future] = {}
+        # Per entry: the first dataset sessions can show, partial while a large CSV streams
+        self._previews: dict[tuple, Future] = {}
+        self._watchers: dict[tuple, _DatasetWatcher] = {}
+        self._executor = executor
+
+    def _read(self, path: str, columns: tuple[str, ...], mtime_ns: int, preview: Future) -> _SharedDataset:
+        digest = hashlib.sha1(f"{path}|{mtime_ns}|{'|'.join(columns)}".encode()).hexdigest()[:12]
+        # Prefer the columnar cache (python -m data.columnar) when it matches the CSV
+        with timer(LOAD_SECONDS, stage="read"):
+            frame = read_cache(path, list(columns))
+            if frame is None:
+                frame = self._read_shared_cache(path, list(columns))
+        if frame is None:
+            return self._stream(path, columns, mtime_ns, digest, preview)
+        with timer(LOAD_SECONDS, stage="summary"):
+            # The cube persisted beside the data is reused, or updated for appended years
+            summary_path = summary_path_for(path)
+            previous = load_summary(summary_path)
+            summary = update_summary(previous, frame)
+            if summary is not previous:
+                save_summary(summary, summary_path)
+        with timer(LOAD_SECONDS, stage="index"):
+            return _SharedDataset(frame, mtime_ns, digest, summary)
+
+    @staticmethod
+    def _stream(path: str, columns: tuple[str, ...], mtime_ns: int, digest: str, preview: Future) -> _SharedDataset:
+        # The CSV is read and validated in chunks (data/ingest.py) and the summary cube
+        # grows with each chunk. A file of several chunks is published after the first
+        # one, so sessions show those rows while the rest loads
+        summary_path = summary_path_for(path)
+        previous = load_summary(summary_path)
+        report = IngestReport(path)
+        accumulator = SummaryAccumulator()
+        chunks: list[pd.DataFrame] = []
+        with timer(LOAD_SECONDS, stage="stream"):
+            for chunk in iter_chunks(path, list(columns), report=report):
+                if chunks and not preview.done():
+                    first = concat_chunks(chunks)
+                    preview.set_result(_SharedDataset(first, mtime_ns, f"{digest}-partial", accumulator.cube(first),
+                                                      partial=True, ingest_report=report))
+                accumulator.add(chunk)
+                chunks.append(chunk)
+            frame = concat_chunks(chunks)
+        with timer(LOAD_SECONDS, stage="summary"):
+            # The persisted cube is reused or updated for appended years, like a columnar
+            # load; the accumulated row hashes spare update_summary a pass over the frame
+            summary = update_summary(previous, frame, accumulator.top_n, accumulator.year_hashes(), accumulator.cube)
+            if summary is not previous:
+                save_summary(summary, summary_path)
+        if report.problems:
+            logger.warning("%s", report)
+        with timer(LOAD_SECONDS, stage="index"):
+            return _SharedDataset(frame, mtime_ns, digest, summary, ingest_report=report)
+
+    @staticmethod
+    def _read_shared_cache(path: str, columns: list[str]) -> pd.DataFrame | None:
+        # With several workers (PHS_SHARED_CACHE_DIR), the first one converts the CSV
+        # to the columnar cache, the others wait for it and memory-map the result
+        folder = shared_folder("data")
+        if folder is None:
+            return None
+        digest = hashlib.sha1(path.encode()).hexdigest()[:8]
+        cache_path = str(folder / f"{os.path.splitext(os.path.basename(path))[0]}-{digest}.arrow")
+        frame = read_cache(path, columns, cache_path)
+        if frame is not None:
+            return frame
+        with file_lock(f"{cache_path}.lock"):
+            frame = read_cache(path, columns, cache_path)
+            if frame is None:
+                try:
+                    build_cache(path, cache_path)
+                except ImportError:
+                    return None
+                frame = read_cache(path, columns, cache_path)
+        return frame
+
+    def _drop_failed(self, key: tuple, future: Future) -> None:
+        # Failed loads must not be cached, the next caller retries
+        if future.exception() is not None:
+            with self._lock:
+                if self._entries.get(key) is future:
+                    del self._entries[key]
+
+    def get_future(self, path: str, columns: tuple[str, ...]) -> Future:
+        path = os.path.abspath(path)
+        key = (path, columns)
+        mtime_ns = os.stat(path).st_mtime_ns
+        with self._lock:
+            future = self._entries.get(key)
+            if future is not None and (not future.done() or future.exception() is not None or future.result().mtime_ns == mtime_ns):
+                if not future.done():
+                    COALESCED_REQUESTS.inc(group="dataset_load", result="coalesced")
+                return future
+            preview = self._previews[key] = Future()
+            # Running futures cannot be cancelled by one of the sessions awaiting them
+            preview.set_running_or_notify_cancel()
+            future = self._executor.submit(self._read, path, columns, mtime_ns, preview)
+            self._entries[key] = future
+            COALESCED_REQUESTS.inc(group="dataset_load", result="leader")
+        future.add_done_callback(lambda f: self._drop_failed(key, f))
+        future.add_done_callback(lambda f: _settle_preview(preview, f))
+        future.add_done_callback(lambda f: self._drop_preview(key, preview))
+        return future
+
+    def _drop_preview(self, key: tuple, preview: Future) -> None:
+        # Once the full load is done, callers get it instead of the preview
+        with self._lock:
+            if self._previews.get(key) is preview:
+                del self._previews[key]
+
+    def get_preview_future(self, path: str, columns: tuple[str, ...]) -> Future:
+        # Resolves with the partial dataset of a streamed file, or with the full one
+        future = self.get_future(path, columns)
+        if future.done():
+            return future
+        with self._lock:
+            return self._previews.get((os.path.abspath(path), columns), future)
+
+    async def get(self, path: str, columns: tuple[str, ...]) -> _SharedDataset:
+        return await asyncio.wrap_future(self.get_future(path, columns))
+
+    def watch(self, path: str, columns: tuple[str, ...], interval: float) -> "_DatasetWatcher":
+        # One watcher thread per data file and column set, shared by all sessions
+        key = (os.path.abspath(path), columns)
+        with self._lock:
+            watcher = self._watchers.get(key)
+            if watcher is None:
+                watcher = self._watchers[key] = _DatasetWatcher(self, path, columns, interval)
+        return watcher
+
+    def stop_watchers(self) -> None:
+        # Stops the watcher threads, at shutdown
+        with self._lock:
+            watchers, self._watchers = list(self._watchers.values()), {}
+        for watcher in watchers:
+            watcher.stop()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def diff_frames(old: pd.DataFrame, new: pd.DataFrame, keys: tuple[str, str] = ("Year", "Country name")) -> tuple[set[int], set[str]]:
+    """Compare two versions of the data row by row on (Year, Country name).
+    Args:
+        old (pd.DataFrame): Previous data.
+        new (pd.DataFrame): Reloaded data.
+        keys (tuple[str, str]): Year and country columns identifying a row.
+    Returns:
+        tuple[set[int], set[str]]: Years and countries with added, removed or changed rows.
+    """
+    year, country = keys
+    def keyed(frame: pd.DataFrame) -> pd.DataFrame:
+        # Plain keys: the categories of two loads can differ
+        return frame.assign(**{country: frame[country].astype(str), year: frame[year].astype(int)}).set_index([year, country])
+    a, b = keyed(old), keyed(new)
+    if list(a.columns) != list(b.columns) or not a.index.is_unique or not b.index.is_unique:
+        rows = a.index.union(b.index)
+    else:
+        a, b = a.align(b, join="outer")
+        same = (a == b) | (a.isna() & b.isna())
+        rows = same.index[~same.all(axis=1).to_numpy()]
+    return {int(value) for value in rows.get_level_values(0)}, {str(value) for value in rows.get_level_values(1)}
+
+
+class DatasetChange():
+    # What a background reload changed, passed to the watcher listeners
+    __slots__ = ("dataset", "old_version", "new_version", "years", "countries")
+
+    def __init__(self, dataset: "_SharedDataset", old_version: str, years: set[int], countries: set[str]):
+        self.dataset = dataset
+        self.old_version = old_version
+        self.new_version = dataset.version
+        self.years = years
+        self.countries = countries
+
+
+class _DatasetWatcher():
+    """Polls a data file and reloads it in the background when its mtime changes.
+    A change is only loaded once the mtime has been stable for one interval, so a
+    file that is still being written is not picked up half way.
+    """
+    def __init__(self, registry: _DatasetRegistry, path: str, columns: tuple[str, ...], interval: float):
+        self._registry = registry
+        self._path = path
+        self._columns = columns
+        self.interval = interval
+        self._listeners: list[Callable[[DatasetChange], None]] = []
+        self._lock = threading.Lock()
+        self._current: _SharedDataset | None = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="dataset-watcher", daemon=True)
+        self._thread.start()
+
+    def subscribe(self, listener: Callable[[DatasetChange], None]) -> Callable[[], None]:
+        with self._lock:
+            self._listeners.append(listener)
+        def unsubscribe():
+            with self._lock:
+                if listener in self._listeners:
+                    self._listeners.remove(listener)
+        return unsubscribe
+
+    def _poll(self, pending: int | None) -> int | None:
+        mtime_ns = os.stat(self._path).st_mtime_ns
+        if self._current is None:
+            self._current = self._registry.get_future(self._path, self._columns).result()
+            return None
+        if mtime_ns == self._current.mtime_ns:
+            return None
+        if mtime_ns != pending:
+            return mtime_ns  # wait one more interval for the writer to finish
+        new = self._registry.get_future(self._path, self._columns).result()
+        old, self._current = self._current, new
+        years, countries = diff_frames(old.frame, new.frame)
+        logger.info("Reloaded %s: %d years and %d countries changed", self._path, len(years), len(countries))
+        change = DatasetChange(new, old.version, years, countries)
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(change)
+        return None
+
+    def stop(self) -> None:
+        # Ends the thread after the check in progress, if any
+        self._stopped.set()
+
+    def _run(self) -> None:
+        pending = None
+        while not self._stopped.wait(self.interval):
+            try:
+                pending = self._poll(pending)
+            except Exception:
+                logger.exception("Reloading %s failed, retrying", self._path)
+                pending = None
+
+
+def _settle_preview(preview: Future, future: Future) -> None:
+    # A load that published no partial dataset resolves its preview with the result
+    if preview.done():
+        return
+    if future.exception() is not None:
+        preview.set_exception(future.exception())
+    else:
+        preview.set_result(future.result())
+
+
+_registry = _DatasetRegistry()
+
+
+def stop_watchers() -> None:
+    """Stop the threads polling the data files for DataLoader.watch(), at shutdown."""
+    _registry.stop_watchers()
+
 
 class DataLoader:
-    def __init__(self):
+    def __init__(self, backend: str = "pandas"):
         # This is the file path to the CSV data
         self.path: str = 'data/WHR2024.csv'
         # Ensure we load at least the columns we need for the app
@@ -15,36 +371,192 @@ class DataLoader:
         self.happiness_data: pd.DataFrame | None = None
         self.country_list: dict[str, str] = []
         self.dict_years: dict = {}
+        # Identifies the loaded file contents, changes when the file is reloaded
+        self.version: str | None = None
+        # Query engine, see data/backends.py: "pandas" (dataset indexes) or "duckdb"
+        self.backend_name = backend
+        self._dataset: _SharedDataset | None = None
+        self._backend: QueryBackend | None = None
 
     def _require_data(self):
         if self.happiness_data is None:
             raise ValueError("Data not loaded. Please call load_data() first.")
 
-    async def load_data(self) -> pd.DataFrame:
-        self.happiness_data = await asyncio.to_thread(
-            pd.read_csv,
-            self.path,
-            usecols=self.COLUMNS,
-        )
-
-        self.country_list = self.happiness_data["Country name"].unique().tolist()
-        self.dict_years = {str(year): str(year) for year in sorted(self.happiness_data['Year'].unique())}
+    def _bind(self, dataset: _SharedDataset) -> pd.DataFrame:
+        # Shallow copies: sessions share the underlying arrays, copy-on-write
+        # keeps any change made by one session away from the shared frames
+        self._dataset = dataset
+        self._backend = dataset.backend(self.backend_name)
+        self.happiness_data = dataset.frame.copy(deep=False)
+        self.country_list = dataset.country_list
+        self.dict_years = dataset.dict_years
+        self.version = dataset.version
         return self.happiness_data
 
+    async def load_data(self) -> pd.DataFrame:
+        dataset = await _registry.get(self.path, tuple(self.COLUMNS))
+        return self._bind(dataset)
+
+    async def load_preview(self) -> pd.DataFrame:
+        """Like load_data(), but returns as soon as the first chunk of a large CSV is read.
+        Check complete and call load_rest() to move to the full data.
+        Returns:
+            pd.DataFrame: The rows read so far (all of them when complete).
+        """
+        dataset = await asyncio.wrap_future(_registry.get_preview_future(self.path, tuple(self.COLUMNS)))
+        return self._bind(dataset)
+
+    @property
+    def complete(self) -> bool:
+        # False while bound to the first rows of a file that is still loading
+        return self._dataset is not None and not self._dataset.partial
+
+    async def load_rest(self) -> DatasetChange | None:
+        """Wait for the full data after load_preview().
+        Returns:
+            DatasetChange | None: Pass it to apply_change(); None when the full data is already bound.
+        """
+        if self.complete:
+            return None
+        partial = self._dataset
+        dataset = await _registry.get(self.path, tuple(self.COLUMNS))
+        if partial.version != f"{dataset.version}-partial":
+            # The file changed while it loaded: the preview came from another version of it,
+            # compare them row by row, once for all sessions shown that preview
+            years, countries = await asyncio.wrap_future(dataset.derived(
+                ("diff", partial.version), lambda: diff_frames(partial.frame, dataset.frame)))
+            return DatasetChange(dataset, partial.version, years, countries)
+        # The preview is the first rows of the same file, only what comes after it changed
+        rest = dataset.frame.iloc[len(partial.frame):]
+        return DatasetChange(dataset, partial.version, {int(year) for year in rest["Year"].unique()},
+                             {str(country) for country in rest["Country name"].unique()})
+
+    @property
+    def ingest_report(self) -> IngestReport | None:
+        # Rows and values rejected by the ingestion schema, None when read from the columnar cache
+        return self._dataset.ingest_report if self._dataset is not None else None
+
+    def watch(self, listener: Callable[[DatasetChange], None], interval: float = 5.0) -> Callable[[], None]:
+        """Call listener, from a background thread, every time the data file is reloaded.
+        Pass the change to apply_change() to move this loader to the new data.
+        Args:
+            listener (Callable[[DatasetChange], None]): Receives the changed years and countries.
+            interval (float): Seconds between file checks (the first watcher sets it).
+        Returns:
+            Callable[[], None]: Stops calling listener.
+        """
+        return _registry.watch(self.path, tuple(self.COLUMNS), interval).subscribe(listener)
+
+    def apply_change(self, change: DatasetChange) -> None:
+        # Switch to the reloaded data, unless this loader already has it
+        if self.version != change.new_version:
+            self._bind(change.dataset)
+
+    @timed(QUERY_SECONDS, query="get_top_happiest_countries")
     async def get_top_happiest_countries(self, year: int, top: int) -> pd.DataFrame:
         self._require_data()
-        data = self.happiness_data[self.happiness_data['Year'] == year]
-        data = data.sort_values(by='Ladder score', ascending=False).head(top)
-        return data
-    
+        return self._backend.top_countries(year, top)
+
+    def get_kpis(self) -> dict:
+        """Return the KPI values of the loaded data (rows, columns, year and score range).
+        Returns:
+            dict: n_rows, n_cols, year_min, year_max, score_min, score_max.
+        """
+        self._require_data()
+        return dict(self._dataset.summary.kpis)
+
+    def get_year_summary(self) -> pd.DataFrame:
+        """Return count, min, max and mean Ladder score per year."""
+        self._require_data()
+        return self._dataset.summary.per_year
+
+    def get_country_summary(self) -> pd.DataFrame:
+        """Return Ladder score statistics, year range and latest rank per country."""
+        self._require_data()
+        return self._dataset.summary.per_country
+
+    @timed(QUERY_SECONDS, query="get_data_by_year")
     async def get_data_by_year(self, year: int) -> pd.DataFrame:
         self._require_data()
-        return self.happiness_data[self.happiness_data['Year'] == year]
-        
+        return self._backend.year_rows(year)
+
+    @timed(QUERY_SECONDS, query="get_map_data")
+    async def get_map_data(self, year: int) -> pd.DataFrame:
+        """Return the map rows of one year: country, ISO-3 code and Ladder score.
+        Countries without an ISO-3 code (see unmatched_countries) have a missing iso_alpha,
+        the map draws them by name.
+        Args:
+            year (int): Year to show.
+        Returns:
+            pd.DataFrame: Country name, iso_alpha and Ladder score columns.
+        """
+        self._require_data()
+        return self._backend.map_rows(year)
+
+    @property
+    def unmatched_countries(self) -> list[str]:
+        # Country names with no ISO-3 code, reported once at load time
+        return self._dataset.unmatched_countries if self._dataset is not None else []
+
+    @timed(QUERY_SECONDS, query="get_data_by_country")
     async def get_data_by_country(self, country: str) -> pd.DataFrame:
         self._require_data()
-        return self.happiness_data[self.happiness_data["Country name"] == country].sort_values(by='Year', ascending=True)
+        return self._backend.country_rows(country)
+
+    @timed(QUERY_SECONDS, query="get_score_matrix")
+    async def get_score_matrix(self, countries: list[str] | tuple[str, ...]) -> pd.DataFrame:
+        """Return the Ladder score of several countries per year, one column per country.
+        The columns are gathered from a year x country matrix built once per dataset version.
+        Args:
+            countries (list[str] | tuple[str, ...]): Countries in column order, unknown names are left out.
+        Returns:
+            pd.DataFrame: Indexed by Year, NaN where a country has no score that year.
+        """
+        self._require_data()
+        dataset = self._dataset
+        future = dataset.derived(("score_matrix", "Ladder score"),
+                                 lambda: ScoreMatrix.from_frame(dataset.frame, "Ladder score"))
+        # Built once: later calls skip the event loop round trip
+        matrix = future.result() if future.done() else await asyncio.wrap_future(future)
+        return matrix.select(countries)
+
+    @timed(QUERY_SECONDS, query="get_page")
+    async def get_page(self, offset: int, limit: int, sort_by: str | None = None, descending: bool = False,
+                       years: list[int] | None = None, country: str | None = None,
+                       score_range: tuple[float | None, float | None] | None = None) -> tuple[pd.DataFrame, int]:
+        """Return one window of filtered and sorted rows, evaluated by the query backend.
+        Args:
+            offset (int): Position of the first row of the window.
+            limit (int): Maximum number of rows in the window.
+            sort_by (str | None): Column to sort by, file order when None.
+            descending (bool): Sort from highest to lowest.
+            years (list[int] | None): Keep only these years.
+            country (str | None): Keep only countries whose name contains this text (case-insensitive).
+            score_range (tuple | None): Inclusive (min, max) Ladder score, either bound can be None.
+        Returns:
+            tuple[pd.DataFrame, int]: The rows of the window and the number of rows matching the filters.
+        """
+        self._require_data()
+        return self._backend.page(offset, limit, sort_by, descending, years, country, score_range)
 
-    async def get_clean_data_for_scatter(self) -> pd.DataFrame:
+    @timed(QUERY_SECONDS, query="get_clean_data_for_scatter")
+    async def get_clean_data_for_scatter(self, frac: float | None = None, mode: str = "exact") -> pd.DataFrame:
+        """Return the scatter plot columns without missing values.
+        Args:
+            frac (float | None): When set, add a "lowess" column with the LOWESS trendline
+                fitted with this fraction. It is computed once per dataset version.
+            mode (str): "exact" or "binned", see data.trendline.lowess_fit.
+        Returns:
+            pd.DataFrame: Ladder score and GDP columns, plus "lowess" when frac is set.
+        """
         self._require_data()
-        return self.happiness_data[["Ladder score", "Explained by: Log GDP per capita"]].dropna()
+        data = self._backend.scatter_rows()
+        if frac is None:
+            return data
+        # Built from the shared frame so every session reuses the same result
+        shared = self._dataset.frame[["Ladder score", "Explained by: Log GDP per capita"]].dropna()
+        fitted = await asyncio.wrap_future(self._dataset.derived(
+            ("lowess", frac, mode),
+            lambda: lowess_fit(shared["Ladder score"].to_numpy(), shared["Explained by: Log GDP per capita"].to_numpy(),
+                               frac=frac, mode=mode)))
+        return data.assign(lowess=fitted)
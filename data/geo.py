@@ -0,0 +1,30 @@
+import csv
+import logging
+from functools import lru_cache
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Country names of the WHR extracts and their ISO 3166-1 alpha-3 codes (Kosovo: XKX)
+ISO_PATH = Path(__file__).parent / "country_iso3.csv"
+
+
+@lru_cache(maxsize=1)
+def _iso_table(path: Path = ISO_PATH) -> dict[str, str]:
+    with open(path, newline="", encoding="utf-8") as f:
+        return {row["Country name"]: row["iso_alpha"] for row in csv.DictReader(f)}
+
+
+def resolve_iso_codes(names: list[str]) -> tuple[dict[str, str], list[str]]:
+    """Resolve country names to ISO-3 codes for the choropleth.
+    Args:
+        names (list[str]): Country names of the data.
+    Returns:
+        tuple[dict[str, str], list[str]]: Name to code map, and the names without a code.
+    """
+    table = _iso_table()
+    codes = {name: table[name] for name in names if name in table}
+    unmatched = sorted(name for name in names if name not in table)
+    if unmatched:
+        logger.warning("No ISO-3 code for %d countries, drawn by name on the map: %s", len(unmatched), ", ".join(unmatched))
+    return codes, unmatched
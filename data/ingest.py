@@ -0,0 +1,185 @@
+# Chunked CSV ingestion checked against a declared schema: bad values are
+# reported and dropped or cleared instead of failing the whole load
+import logging
+import os
+from typing import Iterator
+import numpy as np
+import pandas as pd
+from helper.metrics import INGEST_PROBLEMS
+
+logger = logging.getLogger(__name__)
+
+# Rows per chunk; a file larger than one chunk is shown to sessions after its first chunk
+CHUNK_ROWS = int(os.environ.get("PHS_INGEST_CHUNK_ROWS", 100_000))
+
+
+class Field():
+    # Declared type and valid range of one column
+    __slots__ = ("dtype", "required", "low", "high")
+
+    def __init__(self, dtype: str, required: bool = False, low: float | None = None, high: float | None = None):
+        self.dtype = dtype
+        # A row missing a required value, or with an invalid one, is dropped;
+        # an invalid optional value is cleared
+        self.required = required
+        self.low = low
+        self.high = high
+
+
+# Compact dtypes, shared by the CSV and the cache path so both give the same frame.
+# Scores stay float64: they carry 3 decimals and float32 shows rounding noise in plot hovers.
+SCHEMA: dict[str, Field] = {
+    "Year": Field("int16", required=True, low=1900, high=2100),
+    "Rank": Field("Int16", low=1),
+    "Country name": Field("category", required=True),
+    "Ladder score": Field("float64", low=0, high=10),
+    "upperwhisker": Field("float64", low=0, high=10),
+    "lowerwhisker": Field("float64", low=0, high=10),
+    "Explained by: Log GDP per capita": Field("float64"),
+    "Explained by: Social support": Field("float64"),
+    "Explained by: Healthy life expectancy": Field("float64"),
+    "Explained by: Freedom to make life choices": Field("float64"),
+    "Explained by: Generosity": Field("float64"),
+    "Explained by: Perceptions of corruption": Field("float64"),
+    "Dystopia + residual": Field("float64"),
+}
+
+
+class IngestReport():
+    """Values the schema rejected while a file was read.
+    problems counts them by (column, reason), samples keeps the first few as
+    (data row number, column, value, reason).
+    """
+    __slots__ = ("path", "rows_read", "rows_dropped", "problems", "samples")
+    MAX_SAMPLES = 20
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows_read = 0
+        self.rows_dropped = 0
+        self.problems: dict[tuple[str, str], int] = {}
+        self.samples: list[tuple[int, str, str, str]] = []
+
+    def add(self, column: str, reason: str, values: pd.Series) -> None:
+        # values: the offending raw values, indexed by row position in the file
+        if values.empty:
+            return
+        self.problems[(column, reason)] = self.problems.get((column, reason), 0) + len(values)
+        INGEST_PROBLEMS.inc(len(values), column=column, reason=reason)
+        for row, value in values.head(self.MAX_SAMPLES - len(self.samples)).items():
+            self.samples.append((int(row) + 1, column, str(value), reason))
+
+    def __str__(self) -> str:
+        problems = ", ".join(f"{column}: {count} {reason}" for (column, reason), count in self.problems.items())
+        samples = "; ".join(f"row {row} {column}={value!r} ({reason})" for row, column, value, reason in self.samples[:5])
+        return (f"{self.path}: {self.rows_read} rows read, {self.rows_dropped} dropped. "
+                f"{problems or 'No problems'}{'. First: ' + samples if samples else ''}")
+
+
+def validate_chunk(chunk: pd.DataFrame, report: IngestReport) -> pd.DataFrame:
+    """Coerce the schema columns of a chunk to their declared types.
+    Rows with a missing or invalid required value are dropped, other invalid
+    values become missing; both are recorded in report. Columns outside the
+    schema are kept as read.
+    Args:
+        chunk (pd.DataFrame): Rows as read from the CSV.
+        report (IngestReport): Collects the problems.
+    Returns:
+        pd.DataFrame: The valid rows, with the schema dtypes ("category" columns stay strings).
+    """
+    drop = np.zeros(len(chunk), dtype=bool)
+    columns = {}
+    for name in chunk.columns:
+        field = SCHEMA.get(name)
+        if field is None:
+            continue
+        raw = chunk[name]
+        if field.dtype == "category":
+            values = raw.astype("str").str.strip()
+            values = values.mask(values == "")
+            checks = {}
+        else:
+            values = pd.to_numeric(raw, errors="coerce")
+            checks = {"not a number": values.isna() & raw.notna()}
+            if field.low is not None or field.high is not None:
+                checks["out of range"] = ((values < field.low) if field.low is not None else False) \
+                    | ((values > field.high) if field.high is not None else False)
+            if field.dtype.lower().startswith("int"):
+                checks["not an integer"] = values.notna() & (values % 1 != 0)
+        invalid = np.zeros(len(chunk), dtype=bool)
+        for reason, mask in checks.items():
+            mask = np.asarray(mask, dtype=bool)
+            report.add(name, reason, raw[mask & ~invalid])
+            invalid |= mask
+        if field.required:
+            missing = np.asarray(values.isna(), dtype=bool) & ~invalid
+            report.add(name, "missing", raw[missing].fillna(""))
+            drop |= invalid | missing
+        elif invalid.any():
+            values = values.mask(invalid)
+        columns[name] = values
+    report.rows_read += len(chunk)
+    report.rows_dropped += int(drop.sum())
+    chunk = chunk.assign(**columns)
+    if drop.any():
+        chunk = chunk[~drop]
+    return chunk.astype({name: SCHEMA[name].dtype for name in columns if SCHEMA[name].dtype != "category"})
+
+
+def iter_chunks(path: str, columns: list[str] | None = None, chunk_rows: int = CHUNK_ROWS,
+                report: IngestReport | None = None) -> Iterator[pd.DataFrame]:
+    """Read a CSV file chunk by chunk, each chunk validated with validate_chunk().
+    Text columns are read as strings; numeric ones are parsed, then coerced by
+    the schema, so one bad value does not fail the whole read. Chunks are
+    indexed by their row positions in the resulting frame, and empty
+    "Unnamed:" columns are skipped when all columns are read.
+    Args:
+        path (str): Path to the CSV file.
+        columns (list[str] | None): Columns to read, all when None.
+        chunk_rows (int): Rows per chunk.
+        report (IngestReport | None): Collects the problems, logged at the end when None.
+    Yields:
+        pd.DataFrame: The valid rows of each chunk.
+    """
+    own_report = report is None
+    report = report or IngestReport(path)
+    usecols = columns if columns is not None else (lambda name: not name.startswith("Unnamed:"))
+    dtype = {name: "str" for name, field in SCHEMA.items()
+             if field.dtype == "category" and (columns is None or name in columns)}
+    position = 0
+    with pd.read_csv(path, usecols=usecols, dtype=dtype, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            chunk = validate_chunk(chunk, report)
+            chunk.index = pd.RangeIndex(position, position + len(chunk))
+            position += len(chunk)
+            yield chunk
+    if own_report and report.problems:
+        logger.warning("%s", report)
+
+
+def concat_chunks(chunks: list[pd.DataFrame]) -> pd.DataFrame:
+    """Join validated chunks into one frame and apply the "category" dtypes.
+    Args:
+        chunks (list[pd.DataFrame]): Chunks from iter_chunks(), in order.
+    Returns:
+        pd.DataFrame: The rows read so far.
+    """
+    if not chunks:
+        raise ValueError("The file has no rows")
+    frame = pd.concat(chunks) if len(chunks) > 1 else chunks[0].copy()
+    categories = {name: "category" for name in frame.columns if name in SCHEMA and SCHEMA[name].dtype == "category"}
+    return frame.astype(categories)
+
+
+def read_validated(path: str, columns: list[str] | None = None, chunk_rows: int = CHUNK_ROWS,
+                   report: IngestReport | None = None) -> pd.DataFrame:
+    """Read a whole CSV file through iter_chunks().
+    Args:
+        path (str): Path to the CSV file.
+        columns (list[str] | None): Columns to read, all when None.
+        chunk_rows (int): Rows per chunk.
+        report (IngestReport | None): Collects the problems, logged at the end when None.
+    Returns:
+        pd.DataFrame: The valid rows with the schema dtypes.
+    """
+    return concat_chunks(list(iter_chunks(path, columns, chunk_rows, report)))
@@ -0,0 +1,55 @@
+# Dense year x country matrix of one score column, built once per dataset version:
+# the scores of any set of countries are a column gather instead of one filter per country
+from typing import Iterable
+import numpy as np
+import pandas as pd
+
+
+class ScoreMatrix():
+    """Scores of every country per year as a (years, countries) float64 array,
+    NaN where a country has no score that year. Duplicate (year, country) rows
+    are averaged.
+    """
+    __slots__ = ("years", "countries", "values", "_columns")
+
+    def __init__(self, years: np.ndarray, countries: list[str], values: np.ndarray):
+        # Row labels, ascending
+        self.years = years
+        # Column labels, in file order
+        self.countries = countries
+        self.values = values
+        self._columns = {name: column for column, name in enumerate(countries)}
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame, column: str = "Ladder score") -> "ScoreMatrix":
+        """Build the matrix of one column of the long frame.
+        Args:
+            frame (pd.DataFrame): Rows with Year, Country name and column.
+            column (str): Score column.
+        Returns:
+            ScoreMatrix: The matrix.
+        """
+        years, year_codes = np.unique(frame["Year"].to_numpy(), return_inverse=True)
+        country_codes, countries = pd.factorize(frame["Country name"].astype(str))
+        scores = frame[column].to_numpy(dtype="float64", na_value=np.nan)
+        valid = ~np.isnan(scores)
+        # Flat cell index of every scored row, then sum and count per cell in one pass
+        cells = year_codes[valid] * len(countries) + country_codes[valid]
+        size = len(years) * len(countries)
+        sums = np.bincount(cells, weights=scores[valid], minlength=size)
+        counts = np.bincount(cells, minlength=size)
+        with np.errstate(invalid="ignore"):
+            values = (sums / counts).reshape(len(years), len(countries))
+        return cls(years, countries.tolist(), values)
+
+    def select(self, countries: Iterable[str]) -> pd.DataFrame:
+        """Return the scores of some countries, one column each.
+        Args:
+            countries (Iterable[str]): Country names in column order, unknown names are left out.
+        Returns:
+            pd.DataFrame: Indexed by Year, only the years where one of the countries has a score.
+        """
+        names = [name for name in dict.fromkeys(countries) if name in self._columns]
+        values = self.values[:, [self._columns[name] for name in names]]
+        scored = ~np.isnan(values).all(axis=1)
+        return pd.DataFrame(values[scored], index=pd.Index(self.years[scored], name="Year"), columns=names)
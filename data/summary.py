@@ -0,0 +1,269 @@
+# Pre-aggregated summary cube of the happiness data: KPIs, per-year and
+# per-country statistics and top-N lists, built in one vectorised pass.
+import json
+import os
+from typing import Callable
+import numpy as np
+import pandas as pd
+
+SCORE = "Ladder score"
+
+
+def year_hashes(frame: pd.DataFrame) -> dict[int, str]:
+    # Content hash of each year's rows: the sum of the row hashes, so neither the row
+    # positions nor the order of the rows matter, only their values
+    rows = pd.util.hash_pandas_object(frame, index=False)
+    return {int(year): str(int(value)) for year, value in rows.groupby(frame["Year"].to_numpy()).sum().items()}
+
+
+class SummaryCube():
+    __slots__ = ("kpis", "per_year", "per_country", "top", "year_hashes", "top_n")
+
+    def __init__(self, kpis: dict, per_year: pd.DataFrame, per_country: pd.DataFrame,
+                 top: dict[int, list[int]], hashes: dict[int, str], top_n: int):
+        self.kpis = kpis
+        # index Year: count, min, max, mean of Ladder score
+        self.per_year = per_year
+        # index Country name: count, sum, min, max, mean, first_year, last_year, latest_rank
+        self.per_country = per_country
+        # Year -> row positions of the top_n countries, highest score first
+        self.top = top
+        self.year_hashes = hashes
+        self.top_n = top_n
+
+    def to_json(self) -> dict:
+        return {
+            "kpis": self.kpis,
+            "per_year": json.loads(self.per_year.to_json(orient="split")),
+            "per_country": json.loads(self.per_country.to_json(orient="split")),
+            "top": {str(year): rows for year, rows in self.top.items()},
+            "year_hashes": {str(year): value for year, value in self.year_hashes.items()},
+            "top_n": self.top_n,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "SummaryCube":
+        def frame(part: dict) -> pd.DataFrame:
+            return pd.DataFrame(part["data"], index=part["index"], columns=part["columns"])
+        per_year = frame(data["per_year"])
+        per_year.index = per_year.index.astype(int)
+        per_year.index.name = "Year"
+        per_country = frame(data["per_country"])
+        per_country.index.name = "Country name"
+        return cls(data["kpis"], per_year, per_country,
+                   {int(year): rows for year, rows in data["top"].items()},
+                   {int(year): value for year, value in data["year_hashes"].items()},
+                   data["top_n"])
+
+
+def _ranked(frame: pd.DataFrame) -> pd.DataFrame:
+    # Rank 1 = highest Ladder score within its year
+    return frame.assign(rank=frame.groupby("Year")[SCORE].rank(ascending=False, method="min"))
+
+
+def _per_year(frame: pd.DataFrame) -> pd.DataFrame:
+    return frame.groupby("Year")[SCORE].agg(["count", "min", "max", "mean"])
+
+
+def _country_stats(frame: pd.DataFrame) -> pd.DataFrame:
+    # The additive part of the per-country statistics
+    grouped = frame.groupby("Country name", observed=True)
+    stats = grouped[SCORE].agg(["count", "sum", "min", "max"])
+    stats["first_year"] = grouped["Year"].min()
+    stats["last_year"] = grouped["Year"].max()
+    stats.index = stats.index.astype(str)
+    return stats
+
+
+def _latest_ranks(frame: pd.DataFrame) -> pd.Series:
+    # Rank of each country in its latest year, needs all rows of that year
+    ranked = _ranked(frame)
+    latest = ranked.loc[ranked.groupby("Country name", observed=True)["Year"].idxmax()]
+    ranks = latest.set_index("Country name")["rank"]
+    ranks.index = ranks.index.astype(str)
+    return ranks
+
+
+def _merge_country_stats(old: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    # Counts and sums add up, min/max and the year range combine
+    merged = old.reindex(old.index.union(new.index))
+    add = new.reindex(merged.index)
+    for column in ("count", "sum"):
+        merged[column] = merged[column].fillna(0) + add[column].fillna(0)
+    merged["min"] = np.fmin(merged["min"], add["min"])
+    merged["max"] = np.fmax(merged["max"], add["max"])
+    merged["first_year"] = np.fmin(merged["first_year"], add["first_year"])
+    merged["last_year"] = np.fmax(merged["last_year"], add["last_year"])
+    return merged
+
+
+def _per_country(frame: pd.DataFrame) -> pd.DataFrame:
+    stats = _country_stats(frame)
+    stats["latest_rank"] = _latest_ranks(frame)
+    stats["mean"] = stats["sum"] / stats["count"]
+    return stats
+
+
+def _top(frame: pd.DataFrame, top_n: int) -> dict[int, list[int]]:
+    positions = frame.assign(_pos=np.arange(len(frame)))
+    ordered = positions.sort_values(["Year", SCORE], ascending=[True, False], kind="stable", na_position="last")
+    head = ordered.groupby("Year").head(top_n)
+    return {int(year): rows.tolist() for year, rows in head.groupby("Year")["_pos"]}
+
+
+def _kpis(frame: pd.DataFrame, per_year: pd.DataFrame) -> dict:
+    return {
+        "n_rows": int(frame.shape[0]),
+        "n_cols": int(frame.shape[1]),
+        "year_max": int(per_year.index.max()),
+        "year_min": int(per_year.index.min()),
+        "score_max": round(float(per_year["max"].max()), 2),
+        "score_min": round(float(per_year["min"].min()), 2),
+    }
+
+
+def build_summary(frame: pd.DataFrame, top_n: int = 10) -> SummaryCube:
+    """Build the summary cube of a happiness frame.
+    Args:
+        frame (pd.DataFrame): The loaded data, with Year, Country name and Ladder score.
+        top_n (int): Length of the per-year top lists.
+    Returns:
+        SummaryCube: KPIs, per-year and per-country statistics and top lists.
+    """
+    per_year = _per_year(frame)
+    return SummaryCube(_kpis(frame, per_year), per_year, _per_country(frame), _top(frame, top_n),
+                       year_hashes(frame), top_n)
+
+
+def update_summary(cube: SummaryCube | None, frame: pd.DataFrame, top_n: int = 10,
+                   hashes: dict[int, str] | None = None,
+                   build: Callable[[pd.DataFrame], SummaryCube] | None = None) -> SummaryCube:
+    """Bring a cube up to date with frame, doing as little work as possible.
+    Unchanged data returns the cube itself; the rows of new years, wherever they are
+    in the file, are aggregated on their own and merged; any change to the rows of a
+    year already in the cube rebuilds it.
+    Args:
+        cube (SummaryCube | None): Cube of an earlier version of the data.
+        frame (pd.DataFrame): The current data.
+        top_n (int): Length of the per-year top lists.
+        hashes (dict[int, str] | None): year_hashes(frame), when already known.
+        build (Callable[[pd.DataFrame], SummaryCube] | None): Builds the cube of frame from
+            scratch, build_summary by default.
+    Returns:
+        SummaryCube: Cube matching frame.
+    """
+    if build is None:
+        build = lambda frame: build_summary(frame, top_n)
+    if cube is None or cube.top_n != top_n:
+        return build(frame)
+    if hashes is None:
+        hashes = year_hashes(frame)
+    old_years = set(cube.year_hashes)
+    if any(hashes.get(year) != value for year, value in cube.year_hashes.items()):
+        return build(frame)
+    new_years = sorted(set(hashes) - old_years)
+    if not new_years:
+        return cube
+
+    added = frame[frame["Year"].isin(new_years)]
+    per_year = pd.concat([cube.per_year, _per_year(added)]).sort_index()
+    # The top lists hold row positions, which move when the new rows sit between old ones
+    top = _top(frame, top_n)
+
+    # Per-country statistics merge: counts and sums add up, min/max combine
+    new = _per_country(added)
+    merged = _merge_country_stats(cube.per_country, new)
+    add = new.reindex(merged.index)
+    # The latest rank moves to a new year only when it is later than the country's last one
+    newer = add["last_year"].notna() & ~(add["last_year"] < cube.per_country["last_year"].reindex(merged.index))
+    merged["latest_rank"] = add["latest_rank"].where(newer, merged["latest_rank"])
+    merged["mean"] = merged["sum"] / merged["count"]
+    return SummaryCube(_kpis(frame, per_year), per_year, merged, top, hashes, top_n)
+
+
+class SummaryAccumulator():
+    """Builds the summary cube chunk by chunk while a file is streamed.
+    Counts, sums, minima, maxima, year ranges, row hashes and top lists are
+    merged as chunks arrive. Only the latest rank of each country needs all
+    rows of a year, cube() computes it from the rows read so far.
+    """
+    __slots__ = ("top_n", "_years", "_countries", "_top", "_hashes")
+
+    def __init__(self, top_n: int = 10):
+        self.top_n = top_n
+        self._years: pd.DataFrame | None = None
+        self._countries: pd.DataFrame | None = None
+        # Top candidates so far: Year, Ladder score and row position
+        self._top: pd.DataFrame | None = None
+        self._hashes: dict[int, int] = {}
+
+    def add(self, chunk: pd.DataFrame) -> None:
+        """Merge the aggregates of one chunk.
+        Args:
+            chunk (pd.DataFrame): Next rows, indexed by their positions in the frame.
+        """
+        years = chunk.groupby("Year")[SCORE].agg(["count", "sum", "min", "max"])
+        if self._years is None:
+            self._years = years
+        else:
+            merged = self._years.reindex(self._years.index.union(years.index))
+            add = years.reindex(merged.index)
+            for column in ("count", "sum"):
+                merged[column] = merged[column].fillna(0) + add[column].fillna(0)
+            merged["min"] = np.fmin(merged["min"], add["min"])
+            merged["max"] = np.fmax(merged["max"], add["max"])
+            self._years = merged
+        countries = _country_stats(chunk)
+        self._countries = countries if self._countries is None else _merge_country_stats(self._countries, countries)
+        candidates = pd.DataFrame({"Year": chunk["Year"].to_numpy(), SCORE: chunk[SCORE].to_numpy(),
+                                   "_pos": chunk.index.to_numpy()})
+        if self._top is not None:
+            candidates = pd.concat([self._top, candidates], ignore_index=True)
+        ordered = candidates.sort_values(["Year", SCORE, "_pos"], ascending=[True, False, True],
+                                         kind="stable", na_position="last")
+        self._top = ordered.groupby("Year").head(self.top_n)
+        # Row hashes add up per year, like year_hashes() of the whole frame
+        for year, value in pd.util.hash_pandas_object(chunk, index=False).groupby(chunk["Year"].to_numpy()).sum().items():
+            self._hashes[int(year)] = (self._hashes.get(int(year), 0) + int(value)) % 2**64
+
+    def year_hashes(self) -> dict[int, str]:
+        # year_hashes() of the chunks added so far
+        return {year: str(value) for year, value in self._hashes.items()}
+
+    def cube(self, frame: pd.DataFrame) -> SummaryCube:
+        """Return the cube of the chunks added so far.
+        Args:
+            frame (pd.DataFrame): Those chunks joined, see data.ingest.concat_chunks.
+        Returns:
+            SummaryCube: Same contents as build_summary(frame).
+        """
+        per_year = self._years[["count", "min", "max"]].assign(mean=self._years["sum"] / self._years["count"])
+        per_year["count"] = per_year["count"].astype(int)
+        per_country = self._countries.copy()
+        per_country["latest_rank"] = _latest_ranks(frame)
+        per_country["mean"] = per_country["sum"] / per_country["count"]
+        top = {int(year): rows.tolist() for year, rows in self._top.groupby("Year")["_pos"]}
+        return SummaryCube(_kpis(frame, per_year), per_year, per_country, top, self.year_hashes(), self.top_n)
+
+
+def summary_path_for(data_path: str) -> str:
+    return os.path.splitext(data_path)[0] + ".summary.json"
+
+
+def load_summary(path: str) -> SummaryCube | None:
+    try:
+        with open(path) as f:
+            return SummaryCube.from_json(json.load(f))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_summary(cube: SummaryCube, path: str) -> None:
+    # Best effort: a read-only data folder only costs a rebuild on the next start
+    try:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(cube.to_json(), f)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
@@ -0,0 +1,51 @@
+import numpy as np
+
+
+def _tricube(u: np.ndarray) -> np.ndarray:
+    return np.clip(1 - np.abs(u) ** 3, 0, None) ** 3
+
+
+def _local_linear(x: np.ndarray, y: np.ndarray, weights: np.ndarray, frac: float) -> np.ndarray:
+    # One LOWESS pass (no robustness iterations) for every point at once: n x n distance matrix
+    n = len(x)
+    k = min(max(int(np.ceil(frac * n)), 2), n)
+    dist = np.abs(x[None, :] - x[:, None])
+    h = np.partition(dist, k - 1, axis=1)[:, k - 1:k]
+    w = _tricube(dist / np.where(h > 0, h, 1)) * weights[None, :]
+    sw = w.sum(axis=1)
+    mx = (w * x).sum(axis=1) / sw
+    my = (w * y).sum(axis=1) / sw
+    dx = x[None, :] - mx[:, None]
+    sxx = (w * dx ** 2).sum(axis=1)
+    sxy = (w * dx * (y[None, :] - my[:, None])).sum(axis=1)
+    slope = np.divide(sxy, sxx, out=np.zeros_like(sxy), where=sxx > 0)
+    return my + slope * (x - mx)
+
+
+def lowess_fit(x: np.ndarray, y: np.ndarray, frac: float = 2 / 3, mode: str = "exact", bins: int = 256) -> np.ndarray:
+    """Fit a LOWESS curve and return the fitted value at every x.
+    Args:
+        x (np.ndarray): x values, without missing values.
+        y (np.ndarray): y values, without missing values.
+        frac (float): Share of the points used for each local fit.
+        mode (str): "exact" uses statsmodels (same result as plotly's trendline="lowess"),
+            "binned" fits the means of equal-count bins and interpolates, much faster for large data.
+        bins (int): Number of bins in "binned" mode.
+    Returns:
+        np.ndarray: Fitted values, in the order of x.
+    """
+    if mode not in ("exact", "binned"):
+        raise ValueError(f"Unknown trendline mode: {mode}")
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if mode == "exact" or len(x) <= bins:
+        from statsmodels.nonparametric.smoothers_lowess import lowess
+        return lowess(y, x, frac=frac, return_sorted=False)
+
+    order = np.argsort(x, kind="stable")
+    edges = np.linspace(0, len(x), bins + 1).astype(int)[:-1]
+    counts = np.diff(np.append(edges, len(x))).astype(float)
+    bin_x = np.add.reduceat(x[order], edges) / counts
+    bin_y = np.add.reduceat(y[order], edges) / counts
+    fitted = _local_linear(bin_x, bin_y, counts, frac)
+    return np.interp(x, bin_x, fitted)
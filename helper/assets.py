@@ -0,0 +1,95 @@
+import json
+import re
+from pathlib import Path
+from shiny.ui import tags
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.staticfiles import StaticFiles
+from helper.compression import accepted_encodings
+
+# Files of each bundle, relative to the www folder, in load order.
+# tools/build_assets.py turns every bundle into www/dist/<name>.<hash>.<ext>
+ASSET_BUNDLES = {
+    "vendor.js": ["js/plotly-3.7.0.min.js"],
+    "app.js": [
+        "js/phs-footer.js",
+        "js/phs-router.js",
+        "js/phs-thene-mode.js",
+        "js/phs-plotly-react.js",
+    ],
+    "app.css": [
+        "styles/phs.css",
+        "styles/_navbar.css",
+        "styles/_footer.css",
+        "styles/_value_box.css",
+        "styles/_datagrid.css",
+        "styles/_spinner.css",
+    ],
+}
+
+MANIFEST = "dist/manifest.json"
+# Matches the content hash tools/build_assets.py puts in bundle file names
+_HASHED_NAME = re.compile(r"\.[0-9a-f]{12}\.(js|css)$")
+
+
+def _asset_tag(href: str):
+    if href.endswith(".css"):
+        return tags.link(rel="stylesheet", href=href)
+    return tags.script(src=href)
+
+
+def asset_tags(www_folder: Path, prefix: str = "www"):
+    """Return the <script>/<link> tags of the bundles, in load order.
+    Uses the fingerprinted bundles listed in www/dist/manifest.json when it exists,
+    otherwise one tag per source file.
+    Args:
+        www_folder (Path): The www folder.
+        prefix (str): URL prefix the www folder is served under.
+    Returns:
+        list: Shiny tags for ui.head_content.
+    """
+    manifest_path = www_folder / MANIFEST
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+    result = []
+    for name, sources in ASSET_BUNDLES.items():
+        if name in manifest:
+            result.append(_asset_tag(f"{prefix}/{manifest[name]['file']}"))
+        else:
+            result.extend(_asset_tag(f"{prefix}/{source}") for source in sources)
+    return result
+
+
+class AssetFiles(StaticFiles):
+    """StaticFiles with cache headers and precompressed variants.
+    Fingerprinted bundles are cached for a year and served from their .br / .gz
+    copies when the browser accepts it, other files are revalidated after max_age seconds.
+    """
+    def __init__(self, *args, max_age: int = 3600, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_age = max_age
+
+    async def _precompressed(self, path: str, scope):
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if encoding not in accepted:
+                continue
+            try:
+                response = await super().get_response(path + suffix, scope)
+            except HTTPException:
+                continue
+            if response.status_code == 200:
+                response.headers["content-encoding"] = encoding
+                response.headers["content-type"] = "text/css; charset=utf-8" if path.endswith(".css") else "text/javascript; charset=utf-8"
+                return response
+        return None
+
+    async def get_response(self, path: str, scope):
+        hashed = bool(_HASHED_NAME.search(path))
+        response = (await self._precompressed(path, scope) if hashed else None) or await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            if hashed:
+                response.headers["cache-control"] = "public, max-age=31536000, immutable"
+                response.headers["vary"] = "Accept-Encoding"
+            else:
+                response.headers["cache-control"] = f"public, max-age={self.max_age}"
+        return response
@@ -0,0 +1,166 @@
+# Compression on the wire: brotli or gzip for HTTP responses above a size threshold,
+# and a uvicorn websocket protocol with tunable permessage-deflate for the Shiny messages.
+# Both build on starlette and uvicorn internals (starlette 1.4+, uvicorn 0.35+, see
+# requirements.txt); with older versions they fall back to GZipMiddleware and uvicorn's
+# own websocket protocol
+import inspect
+import logging
+import os
+import anyio.to_thread
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+from helper.metrics import COMPRESSED_BYTES
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+try:
+    from starlette.middleware.gzip import GZipResponder, IdentityResponder
+except ImportError:  # starlette < 0.46
+    GZipResponder = IdentityResponder = object
+try:
+    from uvicorn.protocols.websockets.websockets_sansio_impl import WebSocketsSansIOProtocol
+except ImportError:  # uvicorn < 0.35
+    WebSocketsSansIOProtocol = None
+
+logger = logging.getLogger(__name__)
+
+# The responders take an encoding from a subclass from starlette 1.4 on: async
+# apply_compression and thread_minimum_size
+RESPONDERS = inspect.iscoroutinefunction(getattr(IdentityResponder, "apply_compression", None))
+
+# Bodies of this size or more are compressed in a worker thread, not on the event loop
+THREAD_MIN_BYTES = 128 * 1024
+
+# permessage-deflate settings of DeflateWebSocketProtocol. Level 0 turns it off; every
+# connection keeps a compressor of about 2**(bits + 2) + 2**(mem level + 9) bytes
+WS_DEFLATE_LEVEL = int(os.environ.get("PHS_WS_DEFLATE_LEVEL", 6))
+WS_WINDOW_BITS = int(os.environ.get("PHS_WS_WINDOW_BITS", 15))
+WS_MEM_LEVEL = int(os.environ.get("PHS_WS_MEM_LEVEL", 8))
+
+
+def accepted_encodings(header: str) -> set[str]:
+    # Content codings of an Accept-Encoding header, without those refused with q=0
+    result = set()
+    for part in header.lower().split(","):
+        name, _, params = part.partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name.strip():
+            result.add(name.strip())
+    return result
+
+
+class _CountedGZipResponder(GZipResponder):
+    async def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        compressed = await super().apply_compression(body, more_body=more_body)
+        COMPRESSED_BYTES.inc(len(body), encoding="gzip", stage="in")
+        COMPRESSED_BYTES.inc(len(compressed), encoding="gzip", stage="out")
+        return compressed
+
+
+class _BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int, **kwargs):
+        super().__init__(app, minimum_size, **kwargs)
+        self.quality = quality
+        self._compressor = None
+
+    def _compress_body(self, body: bytes, more_body: bool) -> bytes:
+        if self._compressor is None:
+            self._compressor = brotli.Compressor(quality=self.quality)
+        data = self._compressor.process(body)
+        return data + (self._compressor.flush() if more_body else self._compressor.finish())
+
+    async def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if len(body) >= THREAD_MIN_BYTES:
+            compressed = await anyio.to_thread.run_sync(self._compress_body, body, more_body)
+        else:
+            compressed = self._compress_body(body, more_body)
+        COMPRESSED_BYTES.inc(len(body), encoding="br", stage="in")
+        COMPRESSED_BYTES.inc(len(compressed), encoding="br", stage="out")
+        return compressed
+
+
+class CompressionMiddleware():
+    """Compresses HTTP responses of at least minimum_size bytes with the first of
+    encodings the browser accepts: "br" (needs the brotli package) or "gzip".
+    Responses that already have a Content-Encoding (the precompressed bundles),
+    partial responses, images and fonts are passed through, like websockets.
+    Before starlette 1.4 it is starlette's GZipMiddleware: gzip only, not counted.
+    """
+    def __init__(self, app: ASGIApp, encodings: tuple[str, ...] = ("br", "gzip"), minimum_size: int = 1024,
+                 gzip_level: int = 6, brotli_quality: int = 5):
+        self.app = app
+        self.encodings = tuple(encoding for encoding in encodings if encoding != "br" or brotli is not None)
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self._fallback = None
+        if not RESPONDERS and self.encodings:
+            logger.warning("starlette before 1.4: HTTP responses are compressed with GZipMiddleware")
+            self.encodings = tuple(encoding for encoding in self.encodings if encoding == "gzip")
+            if self.encodings:
+                self._fallback = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=gzip_level)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self._fallback is not None:
+            await self._fallback(scope, receive, send)
+            return
+        if scope["type"] != "http" or not self.encodings:
+            await self.app(scope, receive, send)
+            return
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        encoding = next((encoding for encoding in self.encodings if encoding in accepted), None)
+        if encoding == "br":
+            responder = _BrotliResponder(self.app, self.minimum_size, self.brotli_quality)
+        elif encoding == "gzip":
+            responder = _CountedGZipResponder(self.app, self.minimum_size, self.gzip_level,
+                                              thread_minimum_size=THREAD_MIN_BYTES)
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size)
+        await responder(scope, receive, send)
+
+
+def deflate_extension(level: int = WS_DEFLATE_LEVEL, window_bits: int = WS_WINDOW_BITS,
+                      mem_level: int = WS_MEM_LEVEL) -> ServerPerMessageDeflateFactory:
+    """permessage-deflate offer of the server.
+    Args:
+        level (int): zlib compression level, 1 (fast) to 9 (small).
+        window_bits (int): LZ77 window, 9 to 15: larger windows find repeats further back,
+            also in the previous messages of the connection.
+        mem_level (int): zlib memory level, 1 to 9.
+    Returns:
+        ServerPerMessageDeflateFactory: The extension for websockets.
+    """
+    return ServerPerMessageDeflateFactory(
+        server_max_window_bits=window_bits,
+        client_max_window_bits=window_bits,
+        compress_settings={"level": level, "memLevel": mem_level},
+    )
+
+
+if WebSocketsSansIOProtocol is not None:
+    class DeflateWebSocketProtocol(WebSocketsSansIOProtocol):
+        """uvicorn's websockets protocol with the permessage-deflate settings of
+        PHS_WS_DEFLATE_LEVEL, PHS_WS_WINDOW_BITS and PHS_WS_MEM_LEVEL instead of
+        uvicorn's fixed ones. Select it with
+        uvicorn app:app --ws helper.compression:DeflateWebSocketProtocol
+        """
+        def __init__(self, config, *args, **kwargs):
+            super().__init__(config, *args, **kwargs)
+            enabled = config.ws_per_message_deflate and WS_DEFLATE_LEVEL > 0
+            self.conn.available_extensions = [deflate_extension()] if enabled else []
+else:
+    # Without the sans-I/O protocol the settings cannot be applied, uvicorn keeps its own
+    from uvicorn.protocols.websockets.auto import AutoWebSocketsProtocol as DeflateWebSocketProtocol
@@ -0,0 +1,170 @@
+import asyncio
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _label_text(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Histogram():
+    # Cumulative-bucket histogram per label set, the Prometheus way
+    __slots__ = ("name", "help", "buckets", "_series", "_lock")
+
+    def __init__(self, name: str, help: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [bucket counts..., +Inf count, sum]
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in self._series.items():
+                total = 0
+                for bound, count in zip((*self.buckets, "+Inf"), series[:-1]):
+                    total += count
+                    lines.append(f"{self.name}_bucket{_label_text(key + (('le', bound),))} {total}")
+                lines.append(f"{self.name}_sum{_label_text(key)} {series[-1]}")
+                lines.append(f"{self.name}_count{_label_text(key)} {total}")
+        return lines
+
+
+class Gauge():
+    # Value per label set; set/inc/dec, or a callback read at scrape time
+    __slots__ = ("name", "help", "kind", "callback", "_values", "_lock")
+
+    def __init__(self, name: str, help: str, kind: str = "gauge", callback: Callable[[], dict] | None = None):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.callback = callback
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if self.callback is not None:
+            values = {tuple(sorted(labels)): value for labels, value in self.callback().items()}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        for key, value in values.items():
+            lines.append(f"{self.name}{_label_text(key)} {value}")
+        return lines
+
+
+class MetricsRegistry():
+    """Process-wide metrics, rendered in the Prometheus text format by render()."""
+    def __init__(self):
+        self._metrics: dict[str, Histogram | Gauge] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name: str, factory: Callable):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    def histogram(self, name: str, help: str, buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._get(name, lambda: Histogram(name, help, buckets))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._get(name, lambda: Gauge(name, help))
+
+    def counter(self, name: str, help: str) -> Gauge:
+        return self._get(name, lambda: Gauge(name, help, kind="counter"))
+
+    def callback(self, name: str, help: str, fn: Callable[[], dict], kind: str = "gauge") -> Gauge:
+        # fn returns {((label, value), ...): number} and is called on every scrape
+        return self._get(name, lambda: Gauge(name, help, kind=kind, callback=fn))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+QUERY_SECONDS = metrics.histogram("phs_query_seconds", "DataLoader query time")
+LOAD_SECONDS = metrics.histogram("phs_data_load_seconds", "Data file load and index build time")
+PLOT_SECONDS = metrics.histogram("phs_plot_seconds", "PlotBuilder build time per plot, serialization included")
+RENDER_SECONDS = metrics.histogram("phs_render_seconds", "Plot output time seen by the session, including cache and pool wait")
+OUTPUT_BYTES = metrics.histogram("phs_output_bytes", "Payload size per plot output", BYTES_BUCKETS)
+ACTIVE_SESSIONS = metrics.gauge("phs_active_sessions", "Open Shiny sessions")
+INGEST_PROBLEMS = metrics.counter("phs_ingest_problems_total",
+                                  "Data file values rejected by the ingestion schema, by column and reason")
+REAPED_SESSIONS = metrics.counter("phs_sessions_reaped_total", "Sessions closed by the server, by reason: idle or memory")
+COALESCED_REQUESTS = metrics.counter("phs_singleflight_requests_total",
+                                     "Requests for shared work by group: leader started it, coalesced awaited a leader")
+COMPRESSED_BYTES = metrics.counter("phs_http_compression_bytes_total",
+                                   "HTTP response bytes before (in) and after (out) compression, by encoding")
+
+
+@contextmanager
+def timer(histogram: Histogram, **labels):
+    """Observe the time spent in the with block on a histogram.
+    Args:
+        histogram (Histogram): Histogram to observe, e.g. QUERY_SECONDS.
+        **labels: Label values of the observation.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+
+def timed(histogram: Histogram, **labels):
+    """Decorator version of timer(), for plain and async functions.
+    Args:
+        histogram (Histogram): Histogram to observe.
+        **labels: Label values of the observation.
+    """
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with timer(histogram, **labels):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(histogram, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,208 @@
+# Opt-in sampling profiler: for a bounded window, a background thread samples the
+# stacks of the threads running a labelled section (an output handler, a plot build)
+# and writes collapsed stacks and speedscope profiles per label
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import types
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+PROFILE_FOLDER = Path(os.environ.get("PHS_PROFILE_DIR", Path(__file__).resolve().parents[1] / ".cache" / "profiles"))
+# Longest window a request may ask for, in seconds
+MAX_SECONDS = 300.0
+
+
+def _frame_name(code: types.CodeType) -> str:
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler():
+    """Samples the Python stacks of labelled threads every interval seconds during a window.
+    Code runs under a label with section() (sync) or run() (a coroutine is only
+    labelled while it runs, not while it waits), which cost one flag check
+    outside a window.
+    """
+    def __init__(self, interval: float = 0.005, folder: Path = PROFILE_FOLDER):
+        self.interval = interval
+        self.folder = folder
+        self.active = False
+        # Thread id -> label of the section it is running
+        self._labels: dict[int, str] = {}
+        self._samples: dict[str, dict[tuple[str, ...], int]] = {}
+        self._lock = threading.Lock()
+        self._done: Future | None = None
+        # Set by stop() to close the open window early
+        self._stopped = threading.Event()
+
+    @contextmanager
+    def section(self, label: str):
+        if not self.active:
+            yield
+            return
+        thread_id = threading.get_ident()
+        previous = self._labels.get(thread_id)
+        self._labels[thread_id] = label
+        try:
+            yield
+        finally:
+            if previous is None or not self.active:
+                self._labels.pop(thread_id, None)
+            else:
+                self._labels[thread_id] = previous
+
+    @types.coroutine
+    def _labelled(self, label: str, coroutine):
+        # Drives the coroutine step by step, labelling the thread around each step
+        steps = coroutine.__await__()
+        value, error = None, None
+        while True:
+            with self.section(label):
+                try:
+                    request = steps.throw(error) if error is not None else steps.send(value)
+                except StopIteration as stop:
+                    return stop.value
+            try:
+                value, error = (yield request), None
+            except BaseException as exc:
+                value, error = None, exc
+
+    async def run(self, label: str, coroutine):
+        """Await coroutine, sampled under label while a window is open.
+        Args:
+            label (str): Output id or section name.
+            coroutine: The coroutine to await.
+        Returns:
+            Any: Its result.
+        """
+        if not self.active:
+            return await coroutine
+        return await self._labelled(label, coroutine)
+
+    def wrap(self, fn: Callable) -> Callable:
+        # Decorator: samples a sync or async handler under its function name (the output id)
+        label = fn.__name__
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                return await self.run(label, fn(*args, **kwargs))
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.section(label):
+                    return fn(*args, **kwargs)
+        return wrapper
+
+    def start(self, seconds: float) -> Future:
+        """Open a sampling window, or join the one already open.
+        Args:
+            seconds (float): Window length, at most MAX_SECONDS.
+        Returns:
+            Future: Resolves with the written files and sample counts when the window closes.
+        """
+        with self._lock:
+            if self._done is not None and not self._done.done():
+                return self._done
+            self._done = done = Future()
+            self._samples = {}
+            self._stopped.clear()
+            self.active = True
+        seconds = min(max(seconds, self.interval), MAX_SECONDS)
+        threading.Thread(target=self._sample, args=(seconds, done), name="profiler", daemon=True).start()
+        return done
+
+    async def profile(self, seconds: float) -> dict:
+        return await asyncio.wrap_future(self.start(seconds))
+
+    def stop(self) -> Future | None:
+        """Close the open window now; its samples so far are still written.
+        Returns:
+            Future | None: The window's result, None when no window was opened.
+        """
+        self._stopped.set()
+        return self._done
+
+    def _sample(self, seconds: float, done: Future) -> None:
+        started = time.time()
+        start = time.monotonic()
+        deadline = start + seconds
+        ticks = 0
+        try:
+            while time.monotonic() < deadline and not self._stopped.is_set():
+                ticks += 1
+                frames = sys._current_frames()
+                for thread_id, label in list(self._labels.items()):
+                    frame = frames.get(thread_id)
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_name(frame.f_code))
+                        frame = frame.f_back
+                    if stack:
+                        counts = self._samples.setdefault(label, {})
+                        key = tuple(reversed(stack))
+                        counts[key] = counts.get(key, 0) + 1
+                del frames
+                self._stopped.wait(self.interval)
+        finally:
+            self.active = False
+            self._labels.clear()
+        # Sampling takes time too: weigh samples by the measured period
+        period = (time.monotonic() - start) / max(ticks, 1)
+        try:
+            done.set_result(self._write(started, seconds, period))
+        except Exception as error:
+            logger.exception("Writing the profile failed")
+            done.set_exception(error)
+
+    def _write(self, started: float, seconds: float, period: float) -> dict:
+        # <folder>/<start time>/<label>.collapsed.txt and <label>.speedscope.json
+        folder = self.folder / time.strftime("%Y%m%d-%H%M%S", time.localtime(started))
+        folder.mkdir(parents=True, exist_ok=True)
+        files, counts = [], {}
+        for label, samples in self._samples.items():
+            name = re.sub(r"[^\w.-]", "_", label)
+            collapsed = folder / f"{name}.collapsed.txt"
+            collapsed.write_text("".join(f"{';'.join(stack)} {count}\n" for stack, count in samples.items()))
+            speedscope = folder / f"{name}.speedscope.json"
+            speedscope.write_text(json.dumps(self._speedscope(label, samples, period)))
+            files += [str(collapsed), str(speedscope)]
+            counts[label] = sum(samples.values())
+        logger.info("Profile of %.0f s written to %s: %s", seconds, folder, counts)
+        return {"folder": str(folder), "seconds": seconds, "period": period, "samples": counts, "files": files}
+
+    def _speedscope(self, label: str, samples: dict[tuple[str, ...], int], period: float) -> dict:
+        # Sampled profile in the speedscope file format, weights in seconds
+        index: dict[str, int] = {}
+        frames, stacks, weights = [], [], []
+        for stack, count in samples.items():
+            ids = []
+            for name in stack:
+                if name not in index:
+                    index[name] = len(frames)
+                    frames.append({"name": name})
+                ids.append(index[name])
+            stacks.append(ids)
+            weights.append(count * period)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": label,
+            "activeProfileIndex": 0,
+            "exporter": "phs-profiler",
+            "shared": {"frames": frames},
+            "profiles": [{"type": "sampled", "name": label, "unit": "seconds", "startValue": 0,
+                          "endValue": sum(weights), "samples": stacks, "weights": weights}],
+        }
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,133 @@
+# Session lifecycle: closes sessions left idle and keeps the worker under a memory budget
+import asyncio
+import gc
+import logging
+import math
+import os
+import time
+from typing import Awaitable, Callable
+from helper.metrics import REAPED_SESSIONS, metrics
+
+logger = logging.getLogger(__name__)
+
+
+def process_rss_mb() -> float | None:
+    # Resident memory of this process, Linux only
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class _Tracked():
+    __slots__ = ("close", "last_active")
+
+    def __init__(self, close: Callable[[], Awaitable[None]]):
+        self.close = close
+        self.last_active = time.monotonic()
+
+
+class SessionReaper():
+    """Tracks the last activity of every session of the process and closes
+    sessions idle for more than idle_seconds. Above memory_budget_mb of resident
+    memory, the release hooks run first (dropping caches), then the sessions
+    idle for at least min_idle_seconds are closed, longest idle first.
+    Closed sessions release their frames, outputs and reactive graph; the
+    browser shows the disconnected overlay and a reload starts a new session.
+    A limit of 0 turns that check off.
+    """
+    def __init__(self, idle_seconds: float = 0.0, memory_budget_mb: float = 0.0,
+                 min_idle_seconds: float = 60.0, interval: float = 10.0):
+        self.idle_seconds = idle_seconds
+        self.memory_budget_mb = memory_budget_mb
+        self.min_idle_seconds = min(min_idle_seconds, idle_seconds) if idle_seconds > 0 else min_idle_seconds
+        self.interval = min(interval, idle_seconds / 4) if idle_seconds > 0 else interval
+        self._sessions: dict[str, _Tracked] = {}
+        self._release_hooks: list[Callable[[], None]] = []
+        self._task: asyncio.Task | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.idle_seconds > 0 or self.memory_budget_mb > 0
+
+    def add_release_hook(self, fn: Callable[[], None]) -> None:
+        # fn frees memory that can be rebuilt, e.g. a cache's clear()
+        self._release_hooks.append(fn)
+
+    def track(self, session) -> None:
+        """Track a Shiny session until it ends. Call touch() on its activity:
+        reactive flushes are shared by all sessions and do not tell them apart.
+        Args:
+            session: The session passed to server().
+        """
+        if not self.enabled:
+            return
+        session_id = session.id
+        self._sessions[session_id] = _Tracked(session.close)
+        session.on_ended(lambda: self._sessions.pop(session_id, None))
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def touch(self, session_id: str) -> None:
+        tracked = self._sessions.get(session_id)
+        if tracked is not None:
+            tracked.last_active = time.monotonic()
+
+    def idle_sessions(self) -> list[tuple[float, str]]:
+        # (idle seconds, session id), longest idle first
+        now = time.monotonic()
+        return sorted(((now - tracked.last_active, session_id) for session_id, tracked in self._sessions.items()),
+                      reverse=True)
+
+    async def _run(self):
+        # Stops with the last session, track() starts it again
+        while self._sessions:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reap()
+            except Exception:
+                logger.exception("Session reaper check failed")
+
+    async def reap(self) -> None:
+        idle = self.idle_sessions()
+        if self.idle_seconds > 0:
+            for seconds, session_id in idle:
+                if seconds >= self.idle_seconds:
+                    await self._close(session_id, "idle")
+            idle = [(seconds, session_id) for seconds, session_id in idle if seconds < self.idle_seconds]
+        if self.memory_budget_mb <= 0:
+            return
+        rss = process_rss_mb()
+        if rss is None or rss <= self.memory_budget_mb:
+            return
+        for hook in self._release_hooks:
+            hook()
+        gc.collect()
+        rss = process_rss_mb()
+        if rss is None or rss <= self.memory_budget_mb:
+            return
+        # Sessions share the data frames, so memory is not known per session: close
+        # the share of the idle sessions matching the overshoot, the next check sees the effect
+        candidates = [session_id for seconds, session_id in idle if seconds >= self.min_idle_seconds]
+        count = min(len(candidates), max(1, math.ceil(len(self._sessions) * (rss - self.memory_budget_mb) / rss)))
+        if candidates:
+            logger.warning("Resident memory %.0f MB above the %.0f MB budget, closing %d idle sessions",
+                           rss, self.memory_budget_mb, count)
+        for session_id in candidates[:count]:
+            await self._close(session_id, "memory")
+        gc.collect()
+
+    async def _close(self, session_id: str, reason: str) -> None:
+        tracked = self._sessions.pop(session_id, None)
+        if tracked is None:
+            return
+        REAPED_SESSIONS.inc(reason=reason)
+        try:
+            await tracked.close()
+        except Exception:
+            logger.exception("Closing session %s failed", session_id)
+
+
+metrics.callback("phs_process_resident_bytes", "Resident memory of the worker process",
+                 lambda: {(): (process_rss_mb() or 0.0) * 2**20})
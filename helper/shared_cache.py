@@ -0,0 +1,246 @@
+# On-disk cache shared by the worker processes of one host (uvicorn --workers N),
+# enabled with PHS_SHARED_CACHE_DIR and bounded by PHS_SHARED_CACHE_MB
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Hashable
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, writes stay atomic through os.replace
+    fcntl = None
+
+_MISSING = object()
+
+
+def shared_folder(name: str) -> Path | None:
+    """Return subfolder name of PHS_SHARED_CACHE_DIR, created if needed.
+    Args:
+        name (str): Subfolder, e.g. "renders".
+    Returns:
+        Path | None: The folder, None when no shared cache is configured.
+    """
+    root = os.environ.get("PHS_SHARED_CACHE_DIR")
+    if not root:
+        return None
+    folder = Path(root) / name
+    folder.mkdir(parents=True, exist_ok=True)
+    return folder
+
+
+@contextmanager
+def file_lock(path: str | Path, blocking: bool = True):
+    """Hold an exclusive advisory lock on path (created if needed) between processes.
+    Args:
+        path (str | Path): Lock file.
+        blocking (bool): Wait for the lock, otherwise yield False when another process holds it.
+    Yields:
+        bool: True when the lock is held.
+    """
+    with open(path, "a") as f:
+        if fcntl is None:
+            yield True
+            return
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def atomic_write(path: str | Path, data: bytes) -> None:
+    # Readers in other processes see the old file or the new one, never a partial write
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        # An interrupted write leaves no temporary file, the sweep would never delete it
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class DiskCache():
+    """Content-addressed JSON values on disk, shared by processes.
+    Entries are named after the SHA-256 of the key, written atomically and
+    evicted least recently used first (a hit refreshes the file mtime) once
+    the folder grows past max_bytes. claim() lets one process compute an entry
+    while the others wait for it. salt is hashed with every key: entries
+    written under another salt (other code producing the values) are never read.
+    The file methods block, call them through asyncio.to_thread on the event loop.
+    """
+    # Fraction of max_bytes kept after an eviction sweep
+    SWEEP_TARGET = 0.8
+
+    def __init__(self, folder: str | Path, max_bytes: int = 256 * 2**20, stale_seconds: float = 120.0, salt: str = ""):
+        self.folder = Path(folder)
+        self.max_bytes = max_bytes
+        self.salt = salt
+        self.stale_seconds = stale_seconds
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.waits = 0
+        self._bytes: int | None = None
+        self._lock = threading.Lock()
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, name: str, salt: Callable[[], str] | None = None) -> "DiskCache | None":
+        # The cache in subfolder name of PHS_SHARED_CACHE_DIR, None when it is not set;
+        # salt is only called when the cache is enabled
+        folder = shared_folder(name)
+        if folder is None:
+            return None
+        return cls(folder, max_bytes=int(float(os.environ.get("PHS_SHARED_CACHE_MB", 256)) * 2**20),
+                   salt=salt() if salt is not None else "")
+
+    def _path(self, key: Hashable) -> Path:
+        digest = hashlib.sha256(f"{self.salt}\0{key!r}".encode()).hexdigest()
+        return self.folder / digest[:2] / f"{digest}.json"
+
+    def _read(self, key: Hashable) -> Any:
+        # The stored value or _MISSING, not counted
+        path = self._path(key)
+        try:
+            value = json.loads(path.read_bytes())
+            os.utime(path)
+        except (OSError, ValueError):
+            return _MISSING
+        return value
+
+    def _count(self, value: Any) -> None:
+        with self._lock:
+            if value is _MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self._read(key)
+        self._count(value)
+        return default if value is _MISSING else value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        path = self._path(key)
+        data = json.dumps(value).encode()
+        try:
+            path.parent.mkdir(exist_ok=True)
+            atomic_write(path, data)
+        except OSError:
+            return
+        with self._lock:
+            self.writes += 1
+            if self._bytes is not None:
+                self._bytes += len(data)
+        if self._bytes is None or self._bytes > self.max_bytes:
+            self.sweep()
+
+    def sweep(self) -> None:
+        # Measure the folder and, above max_bytes, delete the least recently used entries;
+        # one process sweeps at a time, the others skip
+        with file_lock(self.folder / ".sweep.lock", blocking=False) as locked:
+            if not locked:
+                return
+            entries = []
+            for path in self.folder.glob("*/*.json"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            evicted = 0
+            if total > self.max_bytes:
+                entries.sort()
+                for _, size, path in entries:
+                    if total <= self.max_bytes * self.SWEEP_TARGET:
+                        break
+                    try:
+                        path.unlink()
+                    except OSError:
+                        continue
+                    total -= size
+                    evicted += 1
+            with self._lock:
+                self._bytes = total
+                self.evictions += evicted
+
+    def claim(self, key: Hashable) -> bool:
+        """Try to become the process that computes key; call release() when done.
+        Returns:
+            bool: False when another process holds a claim that is not stale.
+        """
+        lock_path = self._path(key).with_suffix(".lock")
+        lock_path.parent.mkdir(exist_ok=True)
+        for _ in range(2):
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - lock_path.stat().st_mtime < self.stale_seconds:
+                        return False
+                    lock_path.unlink()  # left behind by a crashed worker
+                except FileNotFoundError:
+                    pass
+        return False
+
+    def release(self, key: Hashable) -> None:
+        try:
+            self._path(key).with_suffix(".lock").unlink()
+        except FileNotFoundError:
+            pass
+
+    def _poll(self, key: Hashable, lock_path: Path) -> tuple[Any, bool]:
+        # The value or _MISSING, and whether the claim is still held
+        value = self._read(key)
+        if value is not _MISSING or lock_path.exists():
+            return value, True
+        # Released between the two checks, or failed without storing a value
+        return self._read(key), False
+
+    async def wait_for(self, key: Hashable, default: Any = None, interval: float = 0.05) -> Any:
+        """Wait for the process holding the claim on key to store it.
+        Counts one wait, then one hit or miss, however often it polls.
+        Returns:
+            Any: The value, or default when the claim was released or went stale without one.
+        """
+        with self._lock:
+            self.waits += 1
+        lock_path = self._path(key).with_suffix(".lock")
+        deadline = time.monotonic() + self.stale_seconds
+        value = _MISSING
+        while time.monotonic() < deadline:
+            value, claimed = await asyncio.to_thread(self._poll, key, lock_path)
+            if value is not _MISSING or not claimed:
+                break
+            await asyncio.sleep(interval)
+        self._count(value)
+        return default if value is _MISSING else value
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "bytes": self._bytes or 0,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "waits": self.waits,
+            }
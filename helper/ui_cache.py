@@ -0,0 +1,90 @@
+import functools
+import glob
+import hashlib
+import os
+import re
+from importlib import metadata
+from pathlib import Path
+from typing import Callable
+from shiny.ui import HTML
+
+# Rendered static UI pieces, kept between worker starts
+UI_CACHE_FOLDER = Path(os.environ.get("PHS_UI_CACHE", Path(__file__).resolve().parents[1] / ".cache" / "ui"))
+
+
+# Source key part of a cache file name
+_KEY = re.compile(r"[0-9a-f]{12}")
+
+
+def _source_key(sources: tuple, salt: str) -> str:
+    digest = hashlib.sha1(salt.encode())
+    for source in sources:
+        try:
+            stat = os.stat(source)
+            digest.update(f"{source}|{stat.st_mtime_ns}|{stat.st_size}".encode())
+        except OSError:
+            digest.update(f"{source}|missing".encode())
+    return digest.hexdigest()[:12]
+
+
+def cached_html(name: str, build: Callable[[], object], sources: tuple = (), salt: str = "") -> HTML:
+    """Return a static UI piece as HTML, built once and cached on disk.
+    The cache file is keyed on the modification time and size of the source files,
+    so editing the config (or the code that builds the piece) rebuilds it; the
+    files of older keys are deleted then.
+    Only for tags without HTML dependencies, which are lost in the rendered HTML.
+    Args:
+        name (str): Cache file name prefix, e.g. "footer".
+        build (Callable[[], object]): Builds the tag on a cache miss.
+        sources (tuple): Files the piece is built from.
+        salt (str): Extra cache key text, e.g. a package version.
+    Returns:
+        HTML: The rendered piece.
+    """
+    path = UI_CACHE_FOLDER / f"{name}-{_source_key(sources, salt)}.html"
+    try:
+        return HTML(path.read_text(encoding="utf-8"))
+    except OSError:
+        pass
+    html = str(build())
+    try:
+        UI_CACHE_FOLDER.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(html, encoding="utf-8")
+        os.replace(tmp_path, path)
+    except OSError:
+        return HTML(html)  # read-only deployment, build again next start
+    _remove_stale(name, path)
+    return HTML(html)
+
+
+def _remove_stale(name: str, current: Path) -> None:
+    # Copies of this piece built from older sources are never read again
+    for old in UI_CACHE_FOLDER.glob(f"{glob.escape(name)}-*.html"):
+        if old != current and _KEY.fullmatch(old.stem[len(name) + 1:]):
+            try:
+                old.unlink()
+            except OSError:
+                pass
+
+
+@functools.lru_cache(maxsize=1)
+def _faicons_version() -> str:
+    return metadata.version("faicons")
+
+
+def icon_svg(name: str, fill: str | None = None) -> HTML:
+    """Cached faicons.icon_svg, faicons is only imported on a cache miss.
+    Args:
+        name (str): Font Awesome icon name.
+        fill (str | None): Fill colour of the icon.
+    Returns:
+        HTML: The SVG icon.
+    """
+    def build():
+        import faicons as fa
+
+        return fa.icon_svg(name, fill=fill) if fill is not None else fa.icon_svg(name)
+
+    fill_key = hashlib.sha1(fill.encode()).hexdigest()[:8] if fill is not None else "default"
+    return cached_html(f"icon-{name}-{fill_key}", build, salt=_faicons_version())
@@ -0,0 +1,13 @@
+# The DataLoader reads data/WHR2024.csv relative to the project root, as the app does
+import os
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="session", autouse=True)
+def project_root():
+    previous = os.getcwd()
+    os.chdir(ROOT)
+    yield ROOT
+    os.chdir(previous)
@@ -0,0 +1,31 @@
+# Precompressed bundles are only served in an encoding the browser accepts
+import asyncio
+import pytest
+from helper.assets import AssetFiles
+
+BUNDLE = "dist/app.0123456789ab.js"
+
+
+@pytest.fixture
+def files(tmp_path) -> AssetFiles:
+    (tmp_path / "dist").mkdir()
+    (tmp_path / BUNDLE).write_text("console.log(1)")
+    (tmp_path / f"{BUNDLE}.br").write_bytes(b"br")
+    (tmp_path / f"{BUNDLE}.gz").write_bytes(b"gz")
+    return AssetFiles(directory=tmp_path)
+
+
+def encoding(files: AssetFiles, accept_encoding: str) -> str | None:
+    scope = {"type": "http", "method": "GET", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    response = asyncio.run(files.get_response(BUNDLE, scope))
+    return response.headers.get("content-encoding")
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("gzip, deflate, br", "br"),
+    ("gzip, br;q=0", "gzip"),
+    ("br;q=0, gzip;q=0", None),
+    ("identity", None),
+])
+def test_precompressed_encoding(files, accept_encoding, expected):
+    assert encoding(files, accept_encoding) == expected
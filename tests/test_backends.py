@@ -0,0 +1,95 @@
+# Every query backend (data/backends.py) must return the same rows, in the same
+# order, as the pandas backend for the queries the app runs
+import asyncio
+import importlib.util
+import pandas as pd
+import pytest
+from data.backends import BACKENDS
+from data.data_con import DataLoader, _SharedDataset
+
+# Backends whose engine is not installed are skipped, not compared with the pandas fallback
+ENGINES = {"duckdb": "duckdb"}
+BACKEND_PARAMS = [pytest.param(name, marks=pytest.mark.skipif(
+    name in ENGINES and importlib.util.find_spec(ENGINES[name]) is None, reason=f"{ENGINES.get(name)} not installed"))
+    for name in BACKENDS if name != "pandas"]
+
+
+def cases(frame: pd.DataFrame) -> list[tuple[str, str, tuple]]:
+    # (label, backend method, arguments) covering the queries the app runs
+    years = sorted(int(year) for year in frame["Year"].unique())
+    countries = [str(name) for name in frame["Country name"].unique()]
+    result = []
+    for year in years + [1900]:
+        result += [(f"top10 {year}", "top_countries", (year, 10)),
+                   (f"top3 {year}", "top_countries", (year, 3)),
+                   (f"top50 {year}", "top_countries", (year, 50)),
+                   (f"year {year}", "year_rows", (year,)),
+                   (f"map {year}", "map_rows", (year,))]
+    for country in countries[:25] + ["Atlantis"]:
+        result.append((f"country {country}", "country_rows", (country,)))
+    for sort_by in (None, "Ladder score", "Year", "Country name", "Explained by: Log GDP per capita"):
+        for descending in (False, True):
+            result.append((f"page sort={sort_by} desc={descending}", "page",
+                           (40, 50, sort_by, descending, None, None, None)))
+    result += [
+        ("page years", "page", (0, 100, "Ladder score", True, years[-3:], None, None)),
+        ("page country", "page", (0, 100, None, False, None, "land", None)),
+        ("page country casefold", "page", (0, 100, None, False, None, "ß", None)),
+        ("page score", "page", (10, 100, "Year", False, None, None, (4.5, 6.0))),
+        ("page all filters", "page", (0, 20, "Country name", True, years[-5:], "a", (5.0, None))),
+        ("page past end", "page", (10**9, 50, None, False, None, None, None)),
+        ("scatter", "scatter_rows", ()),
+    ]
+    return result
+
+
+def normalise(result) -> tuple[pd.DataFrame, int | None]:
+    # Compare values and order, not index labels or dtypes (category vs string, int16 vs int64)
+    rows, total = result if isinstance(result, tuple) else (result, None)
+    rows = rows.reset_index(drop=True)
+    for column in rows.columns:
+        if not pd.api.types.is_float_dtype(rows[column]):
+            rows[column] = rows[column].astype(str)
+    return rows, total
+
+
+@pytest.fixture(scope="module")
+def dataset() -> _SharedDataset:
+    return _SharedDataset(asyncio.run(DataLoader().load_data()), 0, "parity")
+
+
+@pytest.mark.parametrize("name", BACKEND_PARAMS)
+def test_backend_matches_pandas(dataset, name):
+    reference, backend = dataset.backend("pandas"), dataset.backend(name)
+    assert backend.name == name
+    mismatches = []
+    for label, method, args in cases(dataset.frame):
+        expected, expected_total = normalise(getattr(reference, method)(*args))
+        actual, actual_total = normalise(getattr(backend, method)(*args))
+        try:
+            pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+            assert actual_total == expected_total, f"total {actual_total} != {expected_total}"
+        except AssertionError as error:
+            mismatches.append(f"{label}: {error}")
+    assert not mismatches, "\n".join(mismatches)
+
+
+@pytest.mark.parametrize("name", BACKEND_PARAMS)
+def test_loader_matches_pandas(name):
+    # The same through DataLoader: KPIs, a grid page, the map and the scatter data
+    async def queries(backend: str) -> dict:
+        loader = DataLoader(backend)
+        frame = await loader.load_data()
+        year = int(frame["Year"].max())
+        return {
+            "kpis": loader.get_kpis(),
+            "page": normalise(await loader.get_page(0, 50, "Ladder score", True, [year - 1, year], "a", (5.0, None))),
+            "map": normalise(await loader.get_map_data(year)),
+            "scatter": normalise(await loader.get_clean_data_for_scatter()),
+        }
+
+    expected, actual = asyncio.run(queries("pandas")), asyncio.run(queries(name))
+    assert actual["kpis"] == expected["kpis"]
+    for key in ("page", "map", "scatter"):
+        pd.testing.assert_frame_equal(actual[key][0], expected[key][0], check_dtype=False)
+        assert actual[key][1] == expected[key][1]
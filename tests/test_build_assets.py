@@ -0,0 +1,25 @@
+# The fallback JS minifier keeps code, strings and regex literals intact
+import sys
+import pytest
+from tools import build_assets
+
+
+@pytest.fixture(autouse=True)
+def without_rjsmin(monkeypatch):
+    # The fallback is what runs when rjsmin is not installed
+    monkeypatch.setitem(sys.modules, "rjsmin", None)
+
+
+@pytest.mark.parametrize("source, expected", [
+    ("var a = 1; // one\n\n  var b = 2; /* two */ var c = 3;", "var a = 1;\nvar b = 2;   var c = 3;"),
+    ('var s = "http://x /* y */";', 'var s = "http://x /* y */";'),
+    ("var t = `a // b\n  c`;", "var t = `a // b\n  c`;"),
+    (r"var r = /\/\*/g; // comment", r"var r = /\/\*/g;"),
+    ('var q = /"/.test(x); var d = "/";', 'var q = /"/.test(x); var d = "/";'),
+    ("if (/[/*]/.test(x)) return /a'b/i;", "if (/[/*]/.test(x)) return /a'b/i;"),
+    ("var h = w / 2 / scale; // half", "var h = w / 2 / scale;"),
+    ("var m = (a + b) / 2; var n = x[1] / 4 /* q */;", "var m = (a + b) / 2; var n = x[1] / 4  ;"),
+    ('var k = "a" / 2 / "b";', 'var k = "a" / 2 / "b";'),
+])
+def test_minify_js_fallback(source, expected):
+    assert build_assets.minify_js(source) == expected
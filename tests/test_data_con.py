@@ -0,0 +1,68 @@
+# Reload detection: diff_frames() and the background watcher of a data file
+import os
+import queue
+import time
+import pandas as pd
+import pytest
+from data.data_con import DatasetChange, _DatasetRegistry, _DatasetWatcher, diff_frames
+
+COLUMNS = ("Year", "Country name", "Ladder score")
+CSV = "Year,Country name,Ladder score\n2020,Finland,7.8\n2020,Chad,4.2\n2021,Finland,7.7\n2021,Chad,4.3\n"
+
+
+def frame(rows: list[tuple]) -> pd.DataFrame:
+    data = pd.DataFrame(rows, columns=list(COLUMNS))
+    return data.astype({"Year": "int16", "Country name": "category"})
+
+
+BASE = [(2020, "Finland", 7.8), (2020, "Chad", 4.2), (2021, "Finland", 7.7), (2021, "Chad", 4.3)]
+
+
+def test_diff_frames_unchanged_in_another_order():
+    assert diff_frames(frame(BASE), frame(BASE[::-1])) == (set(), set())
+
+
+def test_diff_frames_added_removed_changed():
+    new = [(2020, "Finland", 7.8), (2020, "Chad", 4.5), (2021, "Finland", 7.7), (2022, "Peru", 5.8)]
+    years, countries = diff_frames(frame(BASE), frame(new))
+    # Chad 2020 changed, Chad 2021 removed, Peru 2022 added
+    assert years == {2020, 2021, 2022}
+    assert countries == {"Chad", "Peru"}
+
+
+def test_diff_frames_missing_values_are_equal():
+    old = frame([(2020, "Finland", None), (2020, "Chad", 4.2)])
+    assert diff_frames(old, old.copy()) == (set(), set())
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.delenv("PHS_SHARED_CACHE_DIR", raising=False)
+    registry = _DatasetRegistry()
+    yield registry
+    registry.stop_watchers()
+
+
+def test_watcher_reloads_when_mtime_is_bumped(tmp_path, registry):
+    path = tmp_path / "data.csv"
+    path.write_text(CSV)
+    watcher = registry.watch(str(path), COLUMNS, interval=0.02)
+    assert isinstance(watcher, _DatasetWatcher)
+    changes: queue.Queue[DatasetChange] = queue.Queue()
+    watcher.subscribe(changes.put)
+    first = registry.get_future(str(path), COLUMNS).result(timeout=10)
+    # Let the watcher take the loaded dataset as its current one
+    deadline = time.monotonic() + 10
+    while watcher._current is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    path.write_text(CSV.replace("2021,Chad,4.3", "2021,Chad,4.9"))
+    mtime_ns = first.mtime_ns + 10**9
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+    change = changes.get(timeout=10)
+
+    assert (change.years, change.countries) == ({2021}, {"Chad"})
+    assert change.old_version == first.version
+    assert change.dataset.mtime_ns == mtime_ns
+    assert change.dataset.frame["Ladder score"].tolist() == [7.8, 4.2, 7.7, 4.9]
+    assert changes.empty()
@@ -0,0 +1,51 @@
+# Schema checks of the CSV ingestion: what is dropped, what is cleared, what is reported
+import numpy as np
+import pandas as pd
+from data.ingest import IngestReport, read_validated, validate_chunk
+
+
+def test_validate_chunk_drops_and_clears():
+    chunk = pd.DataFrame({
+        "Year": ["2020", "abc", "1800", "2020.5", None, "2021", "2021", "2021"],
+        "Country name": ["Finland", "Chad", "Peru", "Denmark", "Chile", "  ", "Peru", "Chad"],
+        "Ladder score": ["7.8", "4.2", "5.8", "6.1", "6.0", "6.0", "x", "12"],
+        "Comment": ["a", "b", "c", "d", "e", "f", "g", "h"],
+    })
+    report = IngestReport("test.csv")
+    valid = validate_chunk(chunk, report)
+
+    # Rows with an invalid or missing required value are dropped
+    assert valid["Country name"].tolist() == ["Finland", "Peru", "Chad"]
+    assert report.rows_read == 8
+    assert report.rows_dropped == 5
+    assert report.problems == {
+        ("Year", "not a number"): 1,
+        ("Year", "out of range"): 1,
+        ("Year", "not an integer"): 1,
+        ("Year", "missing"): 1,
+        ("Country name", "missing"): 1,
+        ("Ladder score", "not a number"): 1,
+        ("Ladder score", "out of range"): 1,
+    }
+    # An invalid optional value is cleared, the row kept
+    assert valid["Ladder score"].iloc[0] == 7.8
+    assert np.isnan(valid["Ladder score"].iloc[1]) and np.isnan(valid["Ladder score"].iloc[2])
+    assert valid["Year"].dtype == "int16"
+    # Columns outside the schema are kept as read
+    assert valid["Comment"].tolist() == ["a", "g", "h"]
+    # Samples give the data row number, 1-based
+    assert report.samples[0] == (2, "Year", "abc", "not a number")
+
+
+def test_read_validated_across_chunks(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("Year,Country name,Ladder score\n"
+                    "2020,Finland,7.8\n2020,Chad,bad\n2021,,5.0\n2021,Peru,5.8\n2022,Chile,6.1\n")
+    report = IngestReport(str(path))
+    frame = read_validated(str(path), chunk_rows=2, report=report)
+
+    assert frame["Country name"].astype(str).tolist() == ["Finland", "Chad", "Peru", "Chile"]
+    assert frame.index.tolist() == [0, 1, 2, 3]
+    assert frame["Country name"].dtype == "category"
+    assert report.rows_read == 5 and report.rows_dropped == 1
+    assert report.problems == {("Ladder score", "not a number"): 1, ("Country name", "missing"): 1}
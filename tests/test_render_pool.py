@@ -0,0 +1,85 @@
+# Single-flight of renders: who shares a render, and what a cancel stops
+import asyncio
+import threading
+import pytest
+from view.render_pool import RenderCancelled, RenderFlights, RenderJob, RenderPool
+
+
+class Renders():
+    # Renders on a thread pool that wait for release(), counting the started ones
+    def __init__(self):
+        self.pool = RenderPool("thread", max_workers=2)
+        self.gate = threading.Event()
+        self.started = 0
+
+    def release(self):
+        self.gate.set()
+
+    def _render(self, value):
+        self.gate.wait(5)
+        return value
+
+    def start(self, value):
+        async def start(shared: RenderJob):
+            self.started += 1
+            return await self.pool.run(shared, self._render, value)
+        return start
+
+
+@pytest.fixture
+def renders():
+    renders = Renders()
+    yield renders
+    renders.release()
+    renders.pool.shutdown()
+
+
+def test_same_key_shares_one_render(renders):
+    async def main():
+        flights = RenderFlights("test")
+        calls = [asyncio.ensure_future(flights.run("key", RenderJob(), renders.start("plot"))) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        renders.release()
+        return await asyncio.gather(*calls), len(flights)
+
+    assert asyncio.run(main()) == (["plot"] * 3, 0)
+    assert renders.started == 1
+
+
+def test_leader_leaving_does_not_stop_the_others(renders):
+    async def main():
+        flights = RenderFlights("test")
+        leader, follower = RenderJob(), RenderJob()
+        first = asyncio.ensure_future(flights.run("key", leader, renders.start("plot")))
+        second = asyncio.ensure_future(flights.run("key", follower, renders.start("other")))
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        with pytest.raises(RenderCancelled):
+            await first
+        renders.release()
+        return await second
+
+    assert asyncio.run(main()) == "plot"
+    assert renders.started == 1
+
+
+def test_every_caller_leaving_cancels_a_queued_render(renders):
+    async def main():
+        flights = RenderFlights("test")
+        # Both pool workers busy, so the shared render of "key" is still queued
+        busy = [asyncio.ensure_future(flights.run(f"busy{i}", RenderJob(), renders.start(i))) for i in range(2)]
+        jobs = [RenderJob(), RenderJob()]
+        calls = [asyncio.ensure_future(flights.run("key", job, renders.start("stale"))) for job in jobs]
+        await asyncio.sleep(0.05)
+        for job in jobs:
+            job.cancel()
+        for call in calls:
+            with pytest.raises(RenderCancelled):
+                await call
+        # The next caller starts a new render instead of joining the cancelled one
+        fresh = asyncio.ensure_future(flights.run("key", RenderJob(), renders.start("fresh")))
+        renders.release()
+        return await fresh, await asyncio.gather(*busy)
+
+    assert asyncio.run(main()) == ("fresh", [0, 1])
+    assert renders.started == 4
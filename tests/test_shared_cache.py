@@ -0,0 +1,87 @@
+# DiskCache between processes, simulated with threads on one folder
+import asyncio
+import os
+import threading
+import time
+import pytest
+from helper import shared_cache
+from helper.shared_cache import DiskCache, atomic_write
+
+
+@pytest.fixture
+def cache(tmp_path) -> DiskCache:
+    return DiskCache(tmp_path / "renders", stale_seconds=5.0)
+
+
+def test_get_put_and_salt(cache):
+    assert cache.get(("plot", 1), "none") == "none"
+    cache.put(("plot", 1), ["<div>", "description"])
+    assert cache.get(("plot", 1)) == ["<div>", "description"]
+    # Another salt, e.g. other plotting code, never reads these entries
+    assert DiskCache(cache.folder, salt="other").get(("plot", 1)) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_claim_is_exclusive_until_released(cache):
+    other = DiskCache(cache.folder)
+    assert cache.claim("key")
+    assert not other.claim("key")
+    cache.release("key")
+    assert other.claim("key")
+
+
+def test_stale_claim_expires(cache):
+    assert cache.claim("key")
+    # Left behind by a worker that crashed long ago
+    lock_path = cache._path("key").with_suffix(".lock")
+    old = time.time() - cache.stale_seconds - 1
+    os.utime(lock_path, (old, old))
+    assert DiskCache(cache.folder, stale_seconds=cache.stale_seconds).claim("key")
+
+
+def test_wait_for_value_stored_by_claim_holder(cache):
+    assert cache.claim("key")
+
+    def render():
+        time.sleep(0.1)
+        cache.put("key", {"figure": 1})
+        cache.release("key")
+
+    thread = threading.Thread(target=render)
+    thread.start()
+    waiter = DiskCache(cache.folder)
+    assert asyncio.run(waiter.wait_for("key", interval=0.01)) == {"figure": 1}
+    thread.join()
+    assert waiter.stats()["waits"] == 1 and waiter.stats()["hits"] == 1
+
+
+def test_wait_for_claim_released_without_value(cache):
+    assert cache.claim("key")
+    threading.Timer(0.05, cache.release, ("key",)).start()
+    assert asyncio.run(DiskCache(cache.folder).wait_for("key", "none", interval=0.01)) == "none"
+
+
+def test_sweep_evicts_least_recently_used(cache):
+    for i in range(5):
+        cache.put(i, "x" * 3000)
+        # Entry 0 was used longest ago
+        os.utime(cache._path(i), (1000 + i, 1000 + i))
+    # 5 entries of 3002 bytes, kept down to 80% of 10000
+    small = DiskCache(cache.folder, max_bytes=10_000)
+    small.sweep()
+    assert [small._path(i).exists() for i in range(5)] == [False, False, False, True, True]
+    assert small.stats()["bytes"] == 2 * 3002 and small.stats()["evictions"] == 3
+
+
+def test_atomic_write_interrupted_keeps_old_file(tmp_path, monkeypatch):
+    path = tmp_path / "entry.json"
+    atomic_write(path, b"old")
+
+    def interrupted(src, dst):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(shared_cache.os, "replace", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        atomic_write(path, b"new")
+    assert path.read_bytes() == b"old"
+    assert [p.name for p in tmp_path.iterdir()] == ["entry.json"]
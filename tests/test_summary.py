@@ -0,0 +1,54 @@
+# update_summary() must give the cube build_summary() gives, without rebuilding
+# when only new years were added
+import pandas as pd
+import pytest
+from data.summary import SummaryAccumulator, build_summary, update_summary
+
+
+@pytest.fixture
+def frame() -> pd.DataFrame:
+    # Grouped by country, like the WHR extracts: each year's rows are spread over the file
+    rows = [(country, year, score + year % 3 * 0.1)
+            for country, score in (("Finland", 7.5), ("Denmark", 7.4), ("Chad", 4.2), ("Peru", 5.8))
+            for year in (2019, 2020, 2021, 2022)]
+    return pd.DataFrame(rows, columns=["Country name", "Year", "Ladder score"])
+
+
+def assert_same_cube(actual, expected):
+    pd.testing.assert_frame_equal(actual.per_year, expected.per_year, check_dtype=False)
+    pd.testing.assert_frame_equal(actual.per_country.sort_index()[expected.per_country.columns],
+                                  expected.per_country.sort_index(), check_dtype=False)
+    assert actual.top == expected.top
+    assert actual.kpis == expected.kpis
+    assert actual.year_hashes == expected.year_hashes
+
+
+def never_build(frame):
+    raise AssertionError("rebuilt from scratch")
+
+
+@pytest.mark.parametrize("year", [2022, 2019])
+def test_new_year_between_old_rows_is_merged(frame, year):
+    cube = build_summary(frame[frame["Year"] != year].reset_index(drop=True), top_n=2)
+    updated = update_summary(cube, frame, top_n=2, build=never_build)
+    assert_same_cube(updated, build_summary(frame, top_n=2))
+
+
+def test_unchanged_rows_in_another_order_keep_the_cube(frame):
+    cube = build_summary(frame, top_n=2)
+    shuffled = frame.sort_values(["Year", "Country name"]).reset_index(drop=True)
+    assert update_summary(cube, shuffled, top_n=2, build=never_build) is cube
+
+
+def test_changed_year_rebuilds(frame):
+    cube = build_summary(frame, top_n=2)
+    changed = frame.copy()
+    changed.loc[0, "Ladder score"] = 1.0
+    assert_same_cube(update_summary(cube, changed, top_n=2), build_summary(changed, top_n=2))
+
+
+def test_accumulator_matches_build(frame):
+    accumulator = SummaryAccumulator(top_n=2)
+    for start in range(0, len(frame), 5):
+        accumulator.add(frame.iloc[start:start + 5])
+    assert_same_cube(accumulator.cube(frame), build_summary(frame, top_n=2))
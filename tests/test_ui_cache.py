@@ -0,0 +1,30 @@
+# Static UI pieces cached on disk: one file per piece, rebuilt when a source changes
+import os
+import pytest
+from helper import ui_cache
+
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(ui_cache, "UI_CACHE_FOLDER", tmp_path / "ui")
+    return tmp_path / "ui"
+
+
+def test_new_source_key_replaces_older_files(folder, tmp_path):
+    source = tmp_path / "config.yml"
+    source.write_text("a")
+    builds = []
+    build = lambda: builds.append(1) or "<p>footer</p>"
+
+    assert str(ui_cache.cached_html("footer", build, (str(source),))) == "<p>footer</p>"
+    assert str(ui_cache.cached_html("footer", build, (str(source),))) == "<p>footer</p>"
+    assert len(builds) == 1
+    # Another piece whose name starts like this one is left alone
+    ui_cache.cached_html("footer-links", lambda: "<a></a>", (str(source),))
+
+    source.write_text("changed")
+    os.utime(source, ns=(1, 1))
+    ui_cache.cached_html("footer", build, (str(source),))
+    assert len(builds) == 2
+    names = sorted(path.name.rsplit("-", 1)[0] for path in folder.iterdir())
+    assert names == ["footer", "footer-links"]
@@ -0,0 +1,112 @@
+# Build the static asset bundles listed in helper/assets.py:
+# concatenate and minify CSS/JS, write content-hashed files with
+# gzip (and brotli when installed) copies, and the manifest read by the app.
+# Run from the project root: python -m tools.build_assets
+import gzip
+import hashlib
+import json
+import re
+import sys
+from pathlib import Path
+from helper.assets import ASSET_BUNDLES, MANIFEST
+from helper.functs import get_my_www_folder
+
+_STRINGS = re.compile(r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')""")
+# A JS string or template literal (group 1), block comment (group 2), line comment,
+# or what reads as a regex literal (group 3) if the / before it is not a division
+_JS_TOKENS = re.compile(r"""("(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`)|(/\*.*?\*/)|//[^\n]*"""
+                        r"""|(/(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[*])(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[])*/[a-z]*)""", re.S)
+# Keywords a regex literal can follow; after any other name, a number or a closing bracket, / divides
+_REGEX_KEYWORDS = {"return", "typeof", "instanceof", "in", "of", "new", "delete", "void", "throw", "case", "do",
+                   "else", "yield", "await"}
+
+
+def minify_css(css: str) -> str:
+    # Comments and whitespace go, quoted strings (data URIs, content: "...") are kept as they are
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    parts = _STRINGS.split(css)
+    for i in range(0, len(parts), 2):
+        code = re.sub(r"\s+", " ", parts[i])
+        parts[i] = re.sub(r"\s*([{};,>])\s*", r"\1", code).replace(";}", "}")
+    return "".join(parts).strip()
+
+
+def minify_js(js: str) -> str:
+    # rjsmin when installed, otherwise only comments, indentation and blank lines are removed;
+    # strings and template literals are kept as they are, code around a comment stays
+    try:
+        import rjsmin
+        return rjsmin.jsmin(js)
+    except ImportError:
+        pass
+    parts, code, pos = [], "", 0
+    while (match := _JS_TOKENS.search(js, pos)) is not None:
+        code += js[pos:match.start()]
+        if match.group(3) and _divides(code, bool(parts)):
+            code += "/"
+            pos = match.start() + 1
+            continue
+        pos = match.end()
+        if match.group(2):
+            code += " "  # a block comment still separates the tokens around it
+        elif match.group(1) or match.group(3):
+            parts += [re.sub(r"\s*\n\s*", "\n", code), match.group(0)]
+            code = ""
+    parts.append(re.sub(r"\s*\n\s*", "\n", code + js[pos:]))
+    return "".join(parts).strip()
+
+
+def _divides(code: str, after_literal: bool) -> bool:
+    # Whether a / following code is the division operator, not the start of a regex literal;
+    # code is empty right after a string, template or regex literal
+    code = code.rstrip()
+    if not code:
+        return after_literal
+    if code[-1] in ")]}":
+        return True
+    word = re.search(r"[\w$]+$", code)
+    return word is not None and word.group() not in _REGEX_KEYWORDS
+
+
+def build_bundles(www: Path) -> dict:
+    dist = www / "dist"
+    dist.mkdir(exist_ok=True)
+    # Bundles from older builds are replaced
+    for old in dist.iterdir():
+        old.unlink()
+
+    manifest = {}
+    for name, sources in ASSET_BUNDLES.items():
+        files = [www / source for source in sources if (www / source).exists()]
+        missing = [source for source in sources if not (www / source).exists()]
+        if missing:
+            print(f"{name}: skipping missing {', '.join(missing)}")
+        if not files:
+            continue
+        stem, ext = name.rsplit(".", 1)
+        if ext == "css":
+            content = "\n".join(minify_css(f.read_text(encoding="utf-8")) for f in files)
+        else:
+            # Already minified files (.min.js) are taken as they are
+            content = ";\n".join(f.read_text(encoding="utf-8") if f.name.endswith(".min.js")
+                                 else minify_js(f.read_text(encoding="utf-8")) for f in files)
+        data = content.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        file_name = f"{stem}.{digest}.{ext}"
+        (dist / file_name).write_bytes(data)
+        (dist / f"{file_name}.gz").write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+        try:
+            import brotli
+            (dist / f"{file_name}.br").write_bytes(brotli.compress(data, quality=11))
+        except ImportError:
+            pass
+        source_size = sum(f.stat().st_size for f in files)
+        manifest[name] = {"file": f"dist/{file_name}", "sources": [str(f.relative_to(www)) for f in files]}
+        print(f"{name}: {len(files)} files, {source_size} -> {len(data)} bytes -> dist/{file_name}")
+
+    (www / MANIFEST).write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+
+if __name__ == "__main__":
+    build_bundles(Path(sys.argv[1]) if len(sys.argv) > 1 else get_my_www_folder())
@@ -5,5 +5,5 @@ def compile_scss_file(input_path: str, output_path: str):
     with open(output_path, "w") as f:
         f.write(css)
 
-compile_scss_file("tools/_navbar.scss", "tools/_navbar.css")
-
+if __name__ == "__main__":
+    compile_scss_file("tools/_navbar.scss", "tools/_navbar.css")
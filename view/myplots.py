@@ -1,37 +1,231 @@
+from __future__ import annotations
 # from helper.functs import sort_colors_by_brightness
-import plotly.express as px
 # import plotly.graph_objects as go
-import plotly.io as pio
-import pandas as pd
+import asyncio
+import hashlib
 import json
+import threading
+from importlib import metadata
+from pathlib import Path
+from typing import TYPE_CHECKING
+from view.plot_cache import RenderCache
+from view.render_pool import RenderCancelled, RenderFlights, RenderJob, RenderPool
+from helper.metrics import PLOT_SECONDS, metrics, timed, timer
+from helper.shared_cache import DiskCache
+from helper.profiler import profiler
 
+if TYPE_CHECKING:
+    import pandas as pd
+
+# plotly (and pandas through it) is imported and the templates registered on
+# first use, so importing this module - and app.py - stays fast, see _plotly()
 _templates_loaded = False
+_templates_lock = threading.Lock()
+TEMPLATE_PATH = Path(__file__).resolve().parents[1] / "www" / "config" / "phs_plotly.json"
 
-# Load and register template once at module level
-def _load_templates(path: str = "www/config/phs_plotly.json") -> None:
+def _load_templates(path: str | Path = TEMPLATE_PATH) -> None:
     global _templates_loaded
+    import plotly.io as pio
+
     with open(path) as f:
         phs_theme = json.load(f)
     for template_name, config in phs_theme.items():
         pio.templates[template_name]["layout"].update(config["layout"])
     _templates_loaded = True
 
-_load_templates()
+def _plotly():
+    # plotly.express, with the PHS templates registered once per process
+    if not _templates_loaded:
+        with _templates_lock:
+            if not _templates_loaded:
+                _load_templates()
+    import plotly.express as px
+    return px
+
+def warm_up() -> None:
+    """Import plotly and register the templates now instead of on the first render."""
+    _plotly()
+
+def _code_digest() -> str:
+    # A render depends on the templates, the builders in this module and the plotly version
+    digest = hashlib.sha256()
+    for path in (TEMPLATE_PATH, __file__):
+        digest.update(Path(path).read_bytes())
+    digest.update(metadata.version("plotly").encode())
+    return digest.hexdigest()
+
+# Rendered plots shared by every session, keyed on (builder, dataset version, arguments)
+render_cache = RenderCache(maxsize=256)
+# Worker pool for render_async, configured with PHS_RENDER_POOL (thread/process),
+# PHS_RENDER_WORKERS and PHS_RENDER_MAX_PENDING
+render_pool = RenderPool.from_env()
+# Concurrent renders of the same plot by several sessions share one pool job
+render_flights = RenderFlights("render")
+# Renders shared by the worker processes of the host, None unless PHS_SHARED_CACHE_DIR is set.
+# Keyed on the plotting code too: a worker running another release never reads these renders
+shared_render_cache = DiskCache.from_env("renders", salt=_code_digest)
+
+SERIALIZE_SECONDS = metrics.histogram("phs_plot_serialize_seconds", "Figure serialization time (to_html / to_json)")
+metrics.callback("phs_render_cache_events_total", "Shared render cache hits, misses and evictions",
+                 lambda: {(("event", event),): render_cache.stats()[event] for event in ("hits", "misses", "evictions")},
+                 kind="counter")
+metrics.callback("phs_render_cache_size", "Entries in the shared render cache",
+                 lambda: {(): render_cache.stats()["size"]})
+if shared_render_cache is not None:
+    metrics.callback("phs_shared_render_cache_events_total", "On-disk render cache hits, misses, writes, evictions and waits",
+                     lambda: {(("event", event),): shared_render_cache.stats()[event]
+                              for event in ("hits", "misses", "writes", "evictions", "waits")},
+                     kind="counter")
+    metrics.callback("phs_shared_render_cache_bytes", "Size of the on-disk render cache at the last sweep",
+                     lambda: {(): shared_render_cache.stats()["bytes"]})
+metrics.callback("phs_renders_in_flight", "Distinct renders running or queued on the render pool",
+                 lambda: {(): len(render_flights)})
+
+_MISSING = object()
+# Choropleth skeleton per theme, see PlotBuilder._map_skeleton
+_map_skeletons: dict[str, dict] = {}
+# Comparison line plot layout per theme, see PlotBuilder._compare_layout
+_compare_layouts: dict[str, dict] = {}
+_worker_builders: dict = {}
+
+def _render_in_worker(output_format: str, builder: str, data: pd.DataFrame, args: tuple) -> tuple[str, str]:
+    # Module level so it can be pickled for a process pool
+    plot_builder = _worker_builders.get(output_format)
+    if plot_builder is None:
+        plot_builder = _worker_builders[output_format] = PlotBuilder(output_format)
+    # Builders are named after their outputs; a process pool worker is not sampled
+    with profiler.section(builder):
+        return getattr(plot_builder, f"build_{builder}")(data, *args)
+
+def get_template_json(names: tuple[str, ...] = ("ggplot2", "plotly_dark")) -> dict[str, dict]:
+    """Return the registered Plotly templates as plain JSON-ready dictionaries.
+    The client keeps them, so JSON figures are sent without their template.
+    Args:
+        names (tuple[str, ...]): Template names used by the app.
+    Returns:
+        dict[str, dict]: Template dictionaries keyed by template name.
+    """
+    _plotly()
+    import plotly.io as pio
+    from plotly.io.json import to_json_plotly
+
+    return {name: json.loads(to_json_plotly(pio.templates[name].to_plotly_json())) for name in names}
 
 class PlotBuilder():
     # Value objects for plot builders, to avoid reloading templates and setting layout defaults multiple times
-    __slots__ = ("_layout_defaults",)
+    __slots__ = ("_layout_defaults", "_jobs", "output_format")
+    # Above this many points the scatter plot uses WebGL, above SCATTER_MAX_POINTS it is sampled
+    SCATTER_WEBGL_POINTS = 5000
+    SCATTER_MAX_POINTS = 20000
+    # From this many countries the comparison plot draws its lines with WebGL
+    COMPARE_WEBGL_SERIES = 10
 
-    def __init__(self):
+    def __init__(self, output_format: str = "html"):
+        if output_format not in ("html", "json"):
+            raise ValueError(f"Unknown plot output format: {output_format}")
         self._layout_defaults = dict(margin=dict(t=40, b=0, l=0, r=0))
+        # "html": <div> + <script> for ui.HTML, "json": figure for Plotly.react on the client
+        self.output_format = output_format
+        # Latest render job per output, used to cancel superseded renders
+        self._jobs: dict[str, RenderJob] = {}
+
+    def cancel_all(self) -> None:
+        # The session has ended: renders only it was waiting for are stopped
+        for job in self._jobs.values():
+            job.cancel()
+        self._jobs.clear()
 
     def _to_html(self, fig) -> str:
+        import plotly.io as pio
+
+        if isinstance(fig, dict):
+            # Prebuilt figure dictionaries (see _map_skeleton) skip plotly's validation
+            return pio.to_html(fig, full_html=False, include_plotlyjs=False, validate=False)
         fig.update_layout(**self._layout_defaults)
         return fig.to_html(full_html=False, include_plotlyjs=False)
 
+    def _to_json(self, fig, my_theme: str) -> str:
+        import plotly.io as pio
 
+        # The template is the bulk of a figure, the client already has it (see get_template_json)
+        if isinstance(fig, dict):
+            fig_dict = dict(fig, layout=dict(fig["layout"]))
+        else:
+            fig.update_layout(**self._layout_defaults)
+            fig_dict = fig.to_dict()
+        fig_dict["layout"].pop("template", None)
+        fig_dict["template"] = my_theme
+        return pio.to_json(fig_dict, validate=False)
+
+    def _serialize(self, fig, my_theme: str) -> str:
+        with timer(SERIALIZE_SECONDS, format=self.output_format):
+            if self.output_format == "json":
+                return self._to_json(fig, my_theme)
+            return self._to_html(fig)
+
+    async def render_async(self, output_id: str, builder: str, version: str | None, data: pd.DataFrame, *args) -> tuple[str, str]:
+        """Return the output of build_<builder>(data, *args) from the shared render cache;
+        a cache miss is rendered on render_pool.
+        Identical renders in flight for other sessions are awaited instead of repeated.
+        A newer call for the same output_id cancels this one.
+        Args:
+            output_id (str): Output the plot is rendered for.
+            builder (str): Builder name without the "build_" prefix, e.g. "top10_bar".
+            version (str | None): Dataset version, part of the cache key.
+            data (pd.DataFrame): Data passed to the builder on a cache miss.
+            *args: Remaining builder arguments (theme, year, ...), part of the cache key.
+        Returns:
+            tuple[str, str]: Plot HTML (or figure JSON) and its description.
+        Raises:
+            RenderCancelled: The render was superseded before it finished.
+        """
+        key = (builder, self.output_format, version, args)
+        previous = self._jobs.pop(output_id, None)
+        if previous is not None:
+            previous.cancel()
+        cached = render_cache.get(key, _MISSING)
+        if cached is not _MISSING:
+            return cached
+        job = self._jobs[output_id] = RenderJob()
+        try:
+            return await render_flights.run(key, job, lambda shared: self._render_shared(key, shared, builder, data, args))
+        finally:
+            if self._jobs.get(output_id) is job:
+                del self._jobs[output_id]
+
+    async def _render_shared(self, key: tuple, job: RenderJob, builder: str, data: pd.DataFrame, args: tuple) -> tuple[str, str]:
+        # Cached even when the session that asked for it has moved on
+        if shared_render_cache is None:
+            result = await render_pool.run(job, _render_in_worker, self.output_format, builder, data, args)
+        else:
+            result = await self._render_across_workers(key, job, builder, data, args)
+        render_cache.put(key, result)
+        return result
+
+    async def _render_across_workers(self, key: tuple, job: RenderJob, builder: str, data: pd.DataFrame, args: tuple) -> tuple[str, str]:
+        # Another worker may have stored the render already or be rendering it now;
+        # the file reads and writes run off the event loop
+        cached = await asyncio.to_thread(shared_render_cache.get, key)
+        if cached is not None:
+            return tuple(cached)
+        # A claim left behind by a cancel during this call expires like a crashed worker's
+        claimed = await asyncio.to_thread(shared_render_cache.claim, key)
+        if not claimed:
+            cached = await shared_render_cache.wait_for(key)
+            if cached is not None:
+                return tuple(cached)
+        try:
+            result = await render_pool.run(job, _render_in_worker, self.output_format, builder, data, args)
+            await asyncio.to_thread(shared_render_cache.put, key, result)
+            return result
+        finally:
+            if claimed:
+                await asyncio.to_thread(shared_render_cache.release, key)
+
+    @timed(PLOT_SECONDS, plot="top10_bar")
     def build_top10_bar(self, data: pd.DataFrame, my_theme: str, year: int) -> tuple[str, str]:
         description = f"This bar plot shows the top 10 in {year}"
+        px = _plotly()
         fig = px.bar(
             data,
             x='Ladder score',
@@ -41,10 +235,59 @@ class PlotBuilder():
             labels={'Ladder score': 'Happiness Score', 'Country name': 'Country'}, 
             template = my_theme
         )
-        return self._to_html(fig), description
+        return self._serialize(fig, my_theme), description
+
+    def _map_skeleton(self, my_theme: str) -> dict:
+        # Choropleth layout and trace settings per theme, built once per process;
+        # a year only fills in locations, z and hover text
+        skeleton = _map_skeletons.get(my_theme)
+        if skeleton is None:
+            import pandas as pd
 
+            px = _plotly()
+            sample = pd.DataFrame({"Country name": ["Scotland"], "iso_alpha": ["GBR"], "Ladder score": [0.0]})
+            fig = px.choropleth(
+                sample,
+                locations='iso_alpha',
+                locationmode='ISO-3',
+                color='Ladder score',
+                hover_name='Country name',
+                labels={'Ladder score': 'Life Ladder Score', 'iso_alpha': 'Country code'},
+                title='World Happiness',
+                template = my_theme
+            )
+            fig.update_layout(**self._layout_defaults)
+            skeleton = _map_skeletons[my_theme] = fig.to_dict()
+        return skeleton
+
+    @timed(PLOT_SECONDS, plot="happiness_map")
     def build_happiness_map(self, data: pd.DataFrame, my_theme: str, year: int) -> tuple[str, str]:
         description = f"Heat map about Ladder score by country in {year}"
+        if "iso_alpha" in data.columns:
+            # Data from DataLoader.get_map_data: ISO-3 codes, reuse the cached skeleton
+            skeleton = self._map_skeleton(my_theme)
+            coded = data["iso_alpha"].notna().to_numpy()
+            traces = [dict(
+                skeleton["data"][0],
+                locations=data["iso_alpha"].to_numpy()[coded],
+                z=data["Ladder score"].to_numpy()[coded],
+                hovertext=data["Country name"].astype(str).to_numpy()[coded]
+            )]
+            if not coded.all():
+                # Countries without an ISO-3 code are drawn by name, as plotly matches them,
+                # in a second trace on the same colour scale
+                names = data["Country name"].astype(str).to_numpy()[~coded]
+                traces.append(dict(
+                    skeleton["data"][0],
+                    locations=names,
+                    locationmode="country names",
+                    z=data["Ladder score"].to_numpy()[~coded],
+                    hovertext=names,
+                    hovertemplate=skeleton["data"][0]["hovertemplate"].replace("Country code=%{location}<br>", "")
+                ))
+            layout = dict(skeleton["layout"], title=dict(skeleton["layout"]["title"], text=f'World Happiness in {year}'))
+            return self._serialize({"data": traces, "layout": layout}, my_theme), description
+        px = _plotly()
         fig = px.choropleth(
             data,
             locations='Country name',  # Use country names for locations
@@ -55,21 +298,42 @@ class PlotBuilder():
             title=f'World Happiness in {year}', 
             template = my_theme
         )
-        return self._to_html(fig), description
+        return self._serialize(fig, my_theme), description
     
+    @timed(PLOT_SECONDS, plot="scatterplot")
     def build_scatterplot(self, data: pd.DataFrame, my_theme: str, trendline: str | None = "lowess") -> tuple[str, str]:
         description = "Scatterplot between Ladder score and GDP per capita"
+        # A precomputed "lowess" column (DataLoader.get_clean_data_for_scatter) replaces plotly's own fit
+        precomputed = trendline == "lowess" and "lowess" in data.columns
+        points = data
+        if len(points) > self.SCATTER_MAX_POINTS:
+            points = points.sample(self.SCATTER_MAX_POINTS, random_state=0)
+        px = _plotly()
         fig = px.scatter(
-            data,
+            points,
             x="Ladder score",
             y="Explained by: Log GDP per capita",
-            trendline=trendline,
+            trendline=None if precomputed else trendline,
+            render_mode="webgl" if len(points) > self.SCATTER_WEBGL_POINTS else "auto",
             template = my_theme
         )
-        return self._to_html(fig), description
+        if precomputed:
+            trend = data[["Ladder score", "lowess"]].sort_values("Ladder score")
+            step = len(trend) // self.SCATTER_MAX_POINTS + 1
+            fig.add_scatter(
+                x=trend["Ladder score"].to_numpy()[::step],
+                y=trend["lowess"].to_numpy()[::step],
+                mode="lines",
+                name="LOWESS trendline",
+                line=dict(color=fig.data[0].marker.color),
+                showlegend=False
+            )
+        return self._serialize(fig, my_theme), description
 
+    @timed(PLOT_SECONDS, plot="linecountry")
     def build_linecountry(self, data: pd.DataFrame, my_theme: str, selected_country: str) -> tuple[str, str]:
         description = f"Area plot based on Ladder score per year for {selected_country}"
+        px = _plotly()
         fig = px.area(
             data, 
             x = 'Year', 
@@ -82,10 +346,50 @@ class PlotBuilder():
             xaxis_title='Date',
             yaxis_title='Value'
         )
-        return self._to_html(fig), description
+        return self._serialize(fig, my_theme), description
+
+    def _compare_layout(self, my_theme: str) -> dict:
+        # Layout of the comparison plot per theme, built once per process; traces are plain dictionaries
+        layout = _compare_layouts.get(my_theme)
+        if layout is None:
+            _plotly()
+            import plotly.graph_objects as go
+
+            fig = go.Figure(layout=dict(
+                title="Ladder score per year",
+                xaxis_title="Year",
+                yaxis_title="Ladder score",
+                legend_title="Country",
+                template=my_theme
+            ))
+            fig.update_layout(**self._layout_defaults)
+            layout = _compare_layouts[my_theme] = fig.to_dict()["layout"]
+        return layout
+
+    @timed(PLOT_SECONDS, plot="comparecountries")
+    def build_comparecountries(self, data: pd.DataFrame, my_theme: str, countries: tuple[str, ...]) -> tuple[str, str]:
+        # data: DataLoader.get_score_matrix, one column per country indexed by Year
+        description = f"Line plot of the Ladder score per year for {len(data.columns)} countries: {', '.join(data.columns)}"
+        # One WebGL context for all lines instead of one SVG path each
+        trace_type = "scattergl" if len(data.columns) >= self.COMPARE_WEBGL_SERIES else "scatter"
+        years = data.index.to_numpy()
+        traces = [
+            dict(
+                type=trace_type,
+                mode="lines+markers",
+                name=country,
+                x=years,
+                y=data[country].to_numpy(),
+                hovertemplate=f"{country}<br>%{{x}}: %{{y:.3f}}<extra></extra>"
+            )
+            for country in data.columns
+        ]
+        return self._serialize({"data": traces, "layout": self._compare_layout(my_theme)}, my_theme), description
 
+    @timed(PLOT_SECONDS, plot="pietop3")
     def build_pietop3(self, data: pd.DataFrame, my_theme: str, year: int, top: int) -> tuple[str, str]:
         description = f"Pie chart showing the distribution of the top {top} happiest countries in {year}"
+        px = _plotly()
         fig = px.pie(
             data,
             names='Country name',
@@ -93,4 +397,4 @@ class PlotBuilder():
             title=f'Top {top} Happiest Countries Distribution in {year}',
             template=my_theme
         )
-        return self._to_html(fig), description
\ No newline at end of file
+        return self._serialize(fig, my_theme), description
\ No newline at end of file
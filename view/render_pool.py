@@ -0,0 +1,156 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Hashable
+from helper.metrics import COALESCED_REQUESTS
+
+
+class RenderCancelled(Exception):
+    """Raised when a render is superseded by a newer render of the same output."""
+
+
+class RenderJob():
+    # Handle for one submitted render, cancel() stops it if it has not started yet
+    __slots__ = ("cancelled", "future", "_callbacks")
+
+    def __init__(self):
+        self.cancelled = False
+        self.future: Future | None = None
+        self._callbacks: list[Callable[[], None]] = []
+
+    def add_cancel_callback(self, fn: Callable[[], None]) -> None:
+        self._callbacks.append(fn)
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        if self.future is not None:
+            self.future.cancel()
+        callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            fn()
+
+
+class _Flight():
+    # One render in flight: the pool job and the callers waiting for it
+    __slots__ = ("job", "task", "waiters")
+
+    def __init__(self, job: RenderJob, task: asyncio.Future):
+        self.job = job
+        self.task = task
+        self.waiters: set[RenderJob] = set()
+
+
+class RenderFlights():
+    """Single-flight for renders: concurrent calls with the same key share one
+    render. A caller that cancels its job stops waiting at once; the shared
+    render is only cancelled when every caller has cancelled.
+    """
+    def __init__(self, group: str = "render"):
+        self.group = group
+        self._flights: dict[Hashable, _Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def _done(self, key: Hashable, flight: _Flight, task: asyncio.Future) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not task.cancelled():
+            task.exception()  # retrieved, even when every caller has left
+
+    def _leave(self, key: Hashable, flight: _Flight, job: RenderJob) -> None:
+        flight.waiters.discard(job)
+        if flight.waiters or flight.task.done():
+            return
+        flight.job.cancel()
+        future = flight.job.future
+        if (future is None or future.cancelled()) and self._flights.get(key) is flight:
+            # Not started, or stopped before it started: the next caller starts a new render
+            # instead of joining a cancelled one
+            del self._flights[key]
+
+    async def run(self, key: Hashable, job: RenderJob, start: Callable[[RenderJob], Awaitable]) -> Any:
+        """Await start(shared_job) for key, or the render of key already in flight.
+        Args:
+            key (Hashable): Identifies identical renders.
+            job (RenderJob): The caller's job, cancel() it to stop waiting.
+            start (Callable[[RenderJob], Awaitable]): Starts the render with the shared job.
+        Returns:
+            Any: The render result.
+        Raises:
+            RenderCancelled: job was cancelled, or the shared render was.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            shared = RenderJob()
+            flight = self._flights[key] = _Flight(shared, asyncio.ensure_future(start(shared)))
+            flight.task.add_done_callback(lambda task: self._done(key, flight, task))
+            COALESCED_REQUESTS.inc(group=self.group, result="leader")
+        else:
+            COALESCED_REQUESTS.inc(group=self.group, result="coalesced")
+        flight.waiters.add(job)
+        left = asyncio.get_running_loop().create_future()
+        job.add_cancel_callback(lambda: left.done() or left.set_result(None))
+        try:
+            await asyncio.wait((flight.task, left), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self._leave(key, flight, job)
+        if job.cancelled:
+            raise RenderCancelled()
+        return flight.task.result()
+
+
+class RenderPool():
+    """Runs plot builders off the event loop on a thread or process pool.
+    At most max_pending renders are queued on the executor, further callers
+    wait their turn without blocking the event loop.
+    """
+    def __init__(self, kind: str = "thread", max_workers: int | None = None, max_pending: int = 32):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown render pool kind: {kind}")
+        self.kind = kind
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending
+        self._executor: Executor | None = None
+        self._slots: asyncio.Semaphore | None = None
+
+    @classmethod
+    def from_env(cls) -> "RenderPool":
+        return cls(
+            kind=os.environ.get("PHS_RENDER_POOL", "thread"),
+            max_workers=int(os.environ.get("PHS_RENDER_WORKERS", 0)) or None,
+            max_pending=int(os.environ.get("PHS_RENDER_MAX_PENDING", 32)),
+        )
+
+    @property
+    def executor(self) -> Executor:
+        # Created on first use so importing the module never spawns workers
+        if self._executor is None:
+            if self.kind == "process":
+                # Spawned, not forked: forking while another thread imports or loads data can deadlock the child
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="plot-render")
+        return self._executor
+
+    async def run(self, job: RenderJob, fn: Callable, *args) -> Any:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        async with self._slots:
+            if job.cancelled:
+                raise RenderCancelled()
+            job.future = self.executor.submit(fn, *args)
+            try:
+                return await asyncio.wrap_future(job.future)
+            except asyncio.CancelledError:
+                if job.cancelled and job.future.cancelled():
+                    raise RenderCancelled() from None
+                raise
+
+    def shutdown(self) -> None:
+        # Queued renders are dropped. Worker processes are joined: left running at interpreter
+        # exit they leak their semaphores; threads end on their own after the running render
+        if self._executor is not None:
+            self._executor.shutdown(wait=self.kind == "process", cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,26 @@
+/** Client side renderer for plots sent as figure JSON (PHS_PLOT_OUTPUT=json).
+  Templates arrive once per session, each figure only names its template and
+  Plotly.react updates the existing plot instead of rebuilding the DOM.
+  */
+const phsPlotlyTemplates = {};
+
+Shiny.addCustomMessageHandler("phs_plotly_templates", function (templates) {
+  Object.assign(phsPlotlyTemplates, templates);
+});
+
+Shiny.addCustomMessageHandler("phs_plotly_react", function (message) {
+  const container = document.getElementById(message.id);
+  if (!container) return;
+
+  const figure = JSON.parse(message.figure);
+  const layout = { ...figure.layout, template: phsPlotlyTemplates[figure.template] };
+  container.setAttribute("aria-label", message.description);
+  Plotly.react(container, figure.data, layout, { responsive: true });
+});
+
+// Plots drawn inside a hidden nav panel get the wrong size, resize them when shown
+document.addEventListener("shown.bs.tab", function () {
+  document.querySelectorAll(".phs-plotly-json.js-plotly-plot").forEach(plot => {
+    if (plot.offsetParent !== null) Plotly.Plots.resize(plot);
+  });
+});